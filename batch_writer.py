@@ -0,0 +1,118 @@
+# batch_writer.py (Supabase 일괄 쓰기)
+"""
+레코드를 모아 두었다가 여러 행 upsert 한 번으로 저장하는 Supabase 배치 작성기입니다.
+
+- batch_size개가 모이거나 flush_interval초가 지나면 비웁니다. (close() 때 남은 것도 모두 저장)
+- key_column을 주면, 같은 키(page_id)의 예전 청크 중 이번에 저장하지 않은 id를 upsert 뒤
+  `in_` 조건 삭제 한 번으로 정리합니다. (먼저 지우고 다시 넣는 방식과 달리 문서가 잠깐 사라지는 구간이 없음)
+  옛 행을 따로 관리하는 경우(블루/그린 색인)에는 key_column=None으로 끕니다.
+- 배치마다 성공하면 on_flush(items), 실패하면 on_error(items, exc)를 부르고 오류를 출력합니다.
+"""
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+class BatchWriter:
+    def __init__(self, client, table: str, batch_size: int = 100, flush_interval: float = 5.0,
+                 limiter=None, key_column: Optional[str] = "page_id",
+                 on_flush: Optional[Callable[[List[Any]], None]] = None,
+                 on_error: Optional[Callable[[List[Any], Exception], None]] = None):
+        self.client = client
+        self.table = table
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.limiter = limiter
+        self.key_column = key_column
+        self.on_flush = on_flush
+        self.on_error = on_error
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._records = []
+        self._items = []
+        self._last_flush = time.monotonic()
+        self.batches = 0
+        self.records_written = 0
+        self.failed_batches = 0
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically, name=f"{table}-flusher", daemon=True)
+            self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, record: dict, item: Any = None):
+        """레코드 하나를 쌓습니다. item은 콜백에 그대로 돌려줄 원본(예: 문서)입니다."""
+        with self._lock:
+            self._records.append(record)
+            self._items.append(item if item is not None else record)
+            full = len(self._records) >= self.batch_size
+        if full: self.flush()
+
+    def _take(self):
+        with self._lock:
+            records, items = self._records[:self.batch_size], self._items[:self.batch_size]
+            del self._records[:self.batch_size]
+            del self._items[:self.batch_size]
+            self._last_flush = time.monotonic()
+        return records, items
+
+    def flush(self):
+        """쌓인 레코드를 batch_size개씩 모두 저장합니다."""
+        with self._flush_lock:
+            while True:
+                records, items = self._take()
+                if not records: return
+                self._write_batch(records, items)
+
+    def _write_batch(self, records: list, items: list):
+        self.batches += 1
+        batch_no = self.batches
+        try:
+            if self.limiter: self.limiter.acquire()
+            self.client.table(self.table).upsert(records).execute()
+
+            # 같은 키(page_id)의 예전 청크 중 이번에 쓰지 않은 행 정리
+            keys = list(dict.fromkeys(r[self.key_column] for r in records if r.get(self.key_column))) if self.key_column else []
+            if keys:
+                if self.limiter: self.limiter.acquire()
+                self.client.table(self.table).delete().in_(self.key_column, keys) \
+                    .not_.in_("id", [r["id"] for r in records]).execute()
+
+            self.records_written += len(records)
+            if self.on_flush: self.on_flush(items)
+        except Exception as e:
+            self.failed_batches += 1
+            print(f"❌ [BatchWriter] {self.table} 배치 #{batch_no} 저장 실패 ({len(records)}건): {e}")
+            if self.on_error: self.on_error(items, e)
+
+    def delete_in(self, column: str, values: list) -> int:
+        """column IN (values) 조건으로 batch_size개씩 한꺼번에 지웁니다. 실패한 배치 수를 반환합니다."""
+        failures = 0
+        values = list(values)
+        for start in range(0, len(values), self.batch_size):
+            chunk = values[start:start + self.batch_size]
+            try:
+                if self.limiter: self.limiter.acquire()
+                self.client.table(self.table).delete().in_(column, chunk).execute()
+            except Exception as e:
+                failures += 1
+                print(f"❌ [BatchWriter] {self.table} 삭제 배치 실패 ({len(chunk)}건): {e}")
+        return failures
+
+    def _flush_periodically(self):
+        while not self._stop.wait(min(1.0, self.flush_interval)):
+            with self._lock:
+                due = self._records and time.monotonic() - self._last_flush >= self.flush_interval
+            if due: self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher: self._flusher.join()
+        self.flush()
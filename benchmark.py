@@ -0,0 +1,724 @@
+# benchmark.py (Gemini / Supabase 스텁 기반 부하 측정)
+"""
+외부 API(Gemini, Supabase)를 고정 지연시간을 가진 스텁으로 바꿔 끼운 뒤
+워커 파이프라인의 처리량을 측정합니다. Redis는 실제 서버를 사용합니다.
+(docker-compose의 redis_cache 또는 로컬 redis-server)
+
+사용법:
+    python benchmark.py worker --concurrency 1 2 4 8 --jobs 40
+    python benchmark.py search --repeat 5     # (실제 GEMINI/SUPABASE 키 필요) RPC vs 로컬 검색 비교
+    python benchmark.py api --concurrency 20 40 80 120 --requests 240   # /chat 동시 요청 수용량 (async vs 동기)
+    python benchmark.py replay --output before.json                       # 기록된 질문 재생 (process_job, /chat → /get_result)
+    python benchmark.py replay --aof redis-data/appendonlydir --compare before.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import threading
+import hashlib
+import statistics
+import contextlib
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+from digest import build_digest, estimate_tokens
+
+BENCH_PREFIX = "bench:"
+
+# --- 1. 스텁 클라이언트 ---
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def resolve(self):
+        return None
+
+class FakeGeminiModel:
+    """
+    프롬프트 종류에 따라 고정된 응답을 돌려주는 Gemini 대역.
+    지연 = 고정 지연 + BENCH_LLM_PREFILL_LATENCY(초/1000토큰) × 프롬프트 어림 토큰 수 (입력 처리 시간 흉내)
+    """
+    def __init__(self, latency):
+        self.latency = latency
+        self.prefill_latency = float(os.getenv("BENCH_LLM_PREFILL_LATENCY", "0"))
+
+    def delay(self, prompt):
+        return self.latency + self.prefill_latency * estimate_tokens(prompt) / 1000
+
+    def generate_content(self, prompt, request_options=None, **kwargs):
+        time.sleep(self.delay(prompt))
+        return self.reply(prompt)
+
+    @staticmethod
+    def reply(prompt):
+        if "intent classifier" in prompt:
+            return _FakeResponse('{"intent": null, "category": null, "sub_category": null, "age": null, "keywords": ["검사"]}')
+        if "핵심 키워드" in prompt:
+            return _FakeResponse("장애, 발달, 검사, 정밀, 비용, 지원")
+        if "[후보 목록]" in prompt:
+            return _FakeResponse("0, 1, 2, 3, 4")
+        return _FakeResponse("* **지원 내용** : 벤치마크용 요약")
+
+class FakeAsyncGeminiModel(FakeGeminiModel):
+    """gemini_async.AsyncGeminiModel 대역 (지연 동안 이벤트 루프를 막지 않음)"""
+    async def generate_content(self, prompt, request_options=None, **kwargs):
+        await asyncio.sleep(self.delay(prompt))
+        return self.reply(prompt)
+
+class _FakeRpc:
+    def __init__(self, rows, latency):
+        self.rows = rows
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return type("Response", (), {"data": [dict(r) for r in self.rows]})()
+
+class _FakeTable:
+    """select/insert/in_ 등 어떤 체인 호출이든 받아 빈 결과를 돌려주는 테이블 대역 (chat_cache 등)"""
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return type("Response", (), {"data": []})()
+
+class FakeSupabase:
+    """match_documents RPC를 고정 지연 후 고정 문서 목록으로 응답하는 Supabase 대역"""
+    def __init__(self, rows, latency):
+        self.rows = rows
+        self.latency = latency
+
+    def rpc(self, name, params):
+        return _FakeRpc(self.rows[:params.get("match_count", 50)], self.latency)
+
+    def table(self, name):
+        return _FakeTable()
+
+class FakeGenAI:
+    """google.generativeai 모듈 중 embed_content만 흉내 내는 대역"""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def embed_content(self, model, content, task_type=None, **kwargs):
+        time.sleep(self.latency)
+        if isinstance(content, list):
+            return {"embedding": [fake_embedding(text) for text in content]}
+        return {"embedding": fake_embedding(content)}
+
+class _FakeNotionUsers:
+    def me(self):
+        return {"object": "user", "id": "bench"}
+
+class FakeNotion:
+    """/chat의 설정 확인과 /health?deep=true의 users.me()만 받는 Notion 대역"""
+    def __init__(self):
+        self.users = _FakeNotionUsers()
+
+def fake_embedding(text, dim=768):
+    """텍스트마다 고정된(재현 가능한) 무작위 단위 벡터. 서로 다른 질문끼리는 거의 직교합니다."""
+    seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def make_fake_corpus(size=100):
+    # (제목, 분류, 대상) - 실제 색인 메타데이터와 같은 표기
+    pages = [("영유아 발달 정밀 검사비 지원", "의료/재활", ["일반"]),
+             ("장애인 등록 진단서 발급비 지원", "의료/재활", ["장애/발달지연"]),
+             ("두리활동 사회성 향상 프로그램", "가족 지원", ["장애/발달지연"]),
+             ("발달재활서비스 바우처", "생활 지원", ["장애/발달지연"]),
+             ("언어발달지원사업", "교육/보육", ["일반", "다문화"]),
+             ("아이돌봄 서비스", "돌봄/양육", ["일반"]),
+             ("부모 양육 코칭 상담", "가족 지원", ["보호자"])]
+    age_ranges = [(0, 72), (0, 36), (24, 99999), (-1, 99999)]
+    rows = []
+    for i in range(size):
+        base_title, category, targets = pages[i % len(pages)]
+        start_age, end_age = age_ranges[i % len(age_ranges)]
+        title = f"{base_title} {i}"
+        target = f"{max(start_age, 0)}~{end_age}개월 ({', '.join(targets)})"
+        # 실제 페이지처럼 1.5KB 안팎의 지원 내용 (리랭킹 프롬프트 크기 측정용)
+        detail = (f"* **지원 내용**: {base_title} 대상 아동에게 1인당 최대 {20 + i % 5 * 10}만원을 지원합니다.\n"
+                  + "- 신청 방법: 주민센터 방문 또는 복지로 온라인 신청. 신청서, 가족관계증명서, 진단서 사본을 제출합니다.\n" * 8)
+        extra_req = "도봉구 거주, 기준 중위소득 180% 이하"
+        rows.append({
+            "id": f"page-{i}_0",
+            "content": f"사업명: {title}\n대상: {target}\n{detail}추가 자격요건: {extra_req}\n문의처: 도봉구청 02-2091-0000",
+            "metadata": {"page_id": f"page-{i}", "title": title, "category": category,
+                         "sub_category_list": targets, "start_age": start_age, "end_age": end_age,
+                         "page_url": "", "pre_summary": "* **지원 내용** : 벤치마크용 요약",
+                         "digest": build_digest(title, target, detail, extra_req)},
+            # 실제 벡터 검색처럼 상위에서 가파르게 떨어지는 유사도 (로컬 리랭커의 점수 차 판단용)
+            "similarity": round(0.85 - 0.4 * (i / size) ** 0.5, 4),
+        })
+    return rows
+
+def _prefix_job_keys(job_queue):
+    """운영 큐와 섞이지 않도록 작업 큐/결과/이벤트 키 앞에 BENCH_PREFIX를 붙입니다. (API와 워커가 같은 키를 보도록)"""
+    for name in ["JOB_QUEUE_KEY", "JOB_RESULT_PREFIX", "JOB_RESULTS_KEY", "JOB_PROCESSING_PREFIX",
+                 "JOB_HEARTBEATS_KEY", "JOB_ATTEMPTS_KEY", "JOB_DEAD_LETTER_KEY", "JOB_EVENTS_PREFIX"]:
+        setattr(job_queue, name, BENCH_PREFIX + getattr(job_queue, name))
+
+def install_stubs(llm_latency, embed_latency, db_latency, keep_embedding_cache=False):
+    """클라이언트 레지스트리의 외부 클라이언트를 스텁으로 교체하고 worker 모듈을 반환합니다."""
+    import utils
+    import worker
+    import job_queue
+    from clients import registry
+
+    registry.override("llm", FakeGeminiModel(llm_latency))
+    registry.override("genai", FakeGenAI(embed_latency))
+    # chat_cache 테이블은 빈 결과만 돌려주므로 의미 캐시는 프로세스 내 인덱스만 사용합니다.
+    registry.override("supabase", FakeSupabase(make_fake_corpus(), db_latency))
+    # 같은 질문이 반복되므로 임베딩 캐시를 끄고 매번 (가짜) API 지연을 재현합니다. (replay는 운영처럼 캐시 사용)
+    if not keep_embedding_cache: utils.embedding_cache = None
+    _prefix_job_keys(job_queue)
+    return worker
+
+# --- 2. 워커 처리량 벤치마크 ---
+
+def run_worker_load(worker, concurrency, jobs):
+    """
+    jobs개의 작업을 큐에 넣고, 동시 처리 수 concurrency로 모두 끝날 때까지의 시간을 잽니다.
+    (소요시간, 실패한 작업 수)를 반환합니다. 실패한 작업도 오류 결과를 남기므로 따로 셉니다.
+    """
+    queue = worker.job_queue
+    redis_client = queue.redis_client
+    # 이전 측정에서 쌓인 의미 캐시가 적중하지 않도록 비웁니다.
+    worker.utils.semantic_cache_index.replace([], [])
+    redis_client.delete(queue.JOB_QUEUE_KEY)
+    job_ids = [str(uuid.uuid4()) for _ in range(jobs)]
+    for i, job_id in enumerate(job_ids):
+        queue.enqueue_job({"job_id": job_id, "question": f"장애검사 비용 지원 {i}", "chat_history": []})
+    result_keys = [queue.result_key(job_id) for job_id in job_ids]
+
+    stop_event = threading.Event()
+    runner = threading.Thread(target=worker.start_worker, kwargs={"concurrency": concurrency, "stop_event": stop_event})
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner.start()
+        while redis_client.exists(*result_keys) < jobs:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        stop_event.set()
+        runner.join()
+
+    failures = sum(1 for raw in redis_client.mget(result_keys) if not raw or json.loads(raw).get("status") != "complete")
+    redis_client.delete(queue.JOB_QUEUE_KEY, *result_keys)
+    return elapsed, failures
+
+def bench_worker(args):
+    # stage 스레드풀 크기가 WORKER_CONCURRENCY에 맞춰 정해지므로 import 전에 설정합니다.
+    os.environ["WORKER_CONCURRENCY"] = str(max(args.concurrency))
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker = install_stubs(args.llm_latency, args.embed_latency, args.db_latency)
+
+    print(f"📦 작업 {args.jobs}건 | LLM {args.llm_latency}s, 임베딩 {args.embed_latency}s, DB {args.db_latency}s")
+    baseline = None
+    for n in args.concurrency:
+        elapsed, failures = run_worker_load(worker, n, args.jobs)
+        throughput = args.jobs / elapsed
+        baseline = baseline or throughput
+        failed = f" | ⚠️ 실패 {failures}건" if failures else ""
+        print(f"   - 동시 {n:>2}: {elapsed:6.2f}s, {throughput:6.2f} jobs/s (x{throughput / baseline:.1f}){failed}")
+
+# --- 3. API 동시 요청 수용량 (async /chat vs 동기 /chat) ---
+
+def install_api_stubs(llm_latency):
+    """API 서버의 외부 클라이언트를 스텁으로 바꾸고, 비교용 동기 /chat 경로를 붙인 app을 반환합니다."""
+    import utils
+    import job_queue
+    from clients import registry
+    from fastapi import HTTPException
+    import main
+
+    registry.override("notion", FakeNotion())
+    registry.override("llm", FakeGeminiModel(llm_latency))
+    registry.override("llm_async", FakeAsyncGeminiModel(llm_latency))
+    _prefix_job_keys(job_queue)
+
+    @main.app.post("/bench/chat_sync")
+    def chat_sync(chat_request: main.ChatRequest):
+        """async 전환 전 /chat의 일반 검색 경로 (의도 분석 → 답변 캐시 → 작업 등록)를 스레드풀에서 실행"""
+        question = chat_request.question.strip()
+        extracted_info = utils.extract_info_from_question(question, chat_request.chat_history)
+        if extracted_info.get("error"): raise HTTPException(status_code=500, detail=extracted_info["error"])
+        cached_answer = utils.get_cached_answer(question)
+        if cached_answer: return cached_answer
+        job_id = str(uuid.uuid4())
+        job_queue.enqueue_job({"job_id": job_id, "question": question, "chat_history": []})
+        return {"message": "요청 접수 완료.", "job_id": job_id}
+
+    return main.app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _fire_requests(url, total, concurrency):
+    """total개의 /chat 요청을 동시에 최대 concurrency개씩 보내고 (경과 시간, 지연 목록, 실패 수)를 반환합니다."""
+    import httpx
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(i):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    # 질문마다 달라야 의도 분석 캐시에 걸리지 않고 매번 (가짜) LLM을 부릅니다.
+                    response = await client.post(url, json={"question": f"장애검사 비용 {uuid.uuid4().hex[:8]} {i}"})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not ok: failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return time.perf_counter() - started, latencies, failures
+
+def _serve_api(port, llm_latency):
+    """(자식 프로세스) 스텁을 끼운 API 서버를 띄웁니다. 부하 발생기와 GIL을 나눠 쓰지 않도록 프로세스를 분리합니다."""
+    import logging
+    import uvicorn
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = install_api_stubs(llm_latency)
+    # 요청마다 찍히는 API 로그는 측정을 방해하므로 끕니다.
+    logging.getLogger().setLevel(logging.WARNING)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0: return
+        time.sleep(0.1)
+    raise RuntimeError(f"API 서버가 {timeout}초 안에 뜨지 않았습니다.")
+
+def bench_api(args):
+    import logging
+    import multiprocessing
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    port = _free_port()
+    server = multiprocessing.Process(target=_serve_api, args=(port, args.llm_latency), daemon=True)
+    server.start()
+    _wait_for_port(port)
+
+    print(f"📦 요청 {args.requests}건씩 | LLM(의도 분석) {args.llm_latency}s | 동기 경로는 스레드풀(기본 40) 안에서 실행")
+    try:
+        for n in args.concurrency:
+            line = f"   - 동시 {n:>3}:"
+            for label, path in [("동기", "/bench/chat_sync"), ("async", "/chat")]:
+                elapsed, latencies, failures = asyncio.run(_fire_requests(f"http://127.0.0.1:{port}{path}", args.requests, n))
+                latencies.sort()
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                line += (f" | {label} {args.requests / elapsed:7.1f} req/s"
+                         f" (p50 {statistics.median(latencies):6.0f}ms, p95 {p95:6.0f}ms{f', 실패 {failures}' if failures else ''})")
+            print(line)
+    finally:
+        server.terminate()
+        server.join()
+        import job_queue
+        job_queue.redis_client.delete(BENCH_PREFIX + job_queue.JOB_QUEUE_KEY)
+
+# --- 4. 기록된 질문 재생 (커밋 간 비교용) ---
+# 같은 질문 목록을 같은 스텁 지연/동시 처리 수로 재생해 처리량, p50/p95/p99, Redis 메모리 증가량을 잽니다.
+# 운영 캐시와 섞이지 않도록 별도 Redis DB(--redis-db)를 쓰고, 실행마다 비운 상태에서 시작합니다.
+REPLAY_QUESTIONS = [
+    "장애검사 어디서 받나요", "발달검사 비용 지원", "짝치료 프로그램 있나요", "언어치료 바우처 신청",
+    "안녕하세요", "복지관 부모교육", "3살 아이 어린이집 통합보육", "기저귀 지원 받을 수 있나요",
+    "아이돌봄 서비스 신청 방법", "장애검사 어디서 받나요", "우리 아이가 말이 늦어요", "활동지원 수당",
+    "그룹치료 하는 곳", "고마워요", "발달재활서비스 바우처 금액", "병원 진단서 발급비 지원",
+    "발달검사 비용 지원", "주말에 아이랑 갈 만한 곳", "양육 상담 받고 싶어요", "장애아동 셔틀 지원",
+]
+# replay --aof: AOF에서 이 키로 들어간 작업 등록(RPUSH/LPUSH)만 골라냅니다. (job_queue.JOB_QUEUE_KEY)
+AOF_QUEUE_KEY = b"chatbot:job_queue"
+
+def _aof_files(path):
+    """AOF 파일 목록. Redis 7의 appendonlydir이면 매니페스트 순서(베이스 → 증분)를 따릅니다."""
+    if not os.path.isdir(path): return [path]
+    manifests = [name for name in os.listdir(path) if name.endswith(".manifest")]
+    if not manifests:
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".aof"))
+    with open(os.path.join(path, manifests[0]), encoding="utf-8") as f:
+        return [os.path.join(path, line.split()[1]) for line in f if line.startswith("file ")]
+
+def _iter_aof_commands(path):
+    """AOF에 기록된 명령을 [인자(bytes), ...] 형태로 순서대로 돌려줍니다."""
+    for file_path in _aof_files(path):
+        with open(file_path, "rb") as f:
+            # RDB 형식 베이스 파일은 명령 기록이 아니므로 건너뜁니다.
+            if f.read(5) == b"REDIS": continue
+            f.seek(0)
+            try:
+                for line in iter(f.readline, b""):
+                    if not line.startswith(b"*"): continue
+                    args = []
+                    for _ in range(int(line[1:])):
+                        args.append(f.read(int(f.readline()[1:])))
+                        f.readline()
+                    yield args
+            except ValueError:
+                continue  # 마지막 명령이 잘린 파일 (비정상 종료 직후 등)
+
+def iter_aof_jobs(path):
+    """AOF의 작업 등록 페이로드. 재시도로 큐에 되돌려진 같은 작업은 한 번만 돌려줍니다."""
+    seen = set()
+    for args in _iter_aof_commands(path):
+        if len(args) < 3 or args[0].upper() not in (b"RPUSH", b"LPUSH") or args[1] != AOF_QUEUE_KEY: continue
+        for payload in args[2:]:
+            try:
+                job = json.loads(payload.decode("utf-8"))
+            except ValueError:
+                continue
+            if job.get("job_id") in seen: continue
+            seen.add(job.get("job_id"))
+            yield job
+
+def load_replay_jobs(path=None, aof=None, limit=None):
+    """재생할 요청 목록. JSONL 파일(줄마다 question 필드) → AOF → 내장 질문 목록 순으로 고릅니다."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    elif aof:
+        records = list(iter_aof_jobs(aof))
+    else:
+        records = [{"question": question} for question in REPLAY_QUESTIONS]
+
+    jobs = [{"question": r["question"], "chat_history": r.get("chat_history") or [],
+             "last_result_ids": r.get("last_result_ids") or [], "shown_count": r.get("shown_count", 0)}
+            for r in records if r.get("question")]
+    return jobs[:limit] if limit else jobs
+
+def _bench_redis(db):
+    import redis
+    return redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=db)
+
+def redis_memory_snapshot(client):
+    """서버 전체 used_memory와 벤치마크 DB의 키 수 / 키 메모리 합계(MEMORY USAGE)"""
+    keys = list(client.scan_iter(count=1000))
+    pipe = client.pipeline(transaction=False)
+    for key in keys: pipe.memory_usage(key)
+    sizes = pipe.execute() if keys else []
+    return {"used_memory": client.info("memory")["used_memory"], "keys": len(keys), "key_bytes": sum(s or 0 for s in sizes)}
+
+def latency_summary(latencies_ms):
+    ordered = sorted(latencies_ms)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+    return {"p50_ms": round(pick(50), 1), "p95_ms": round(pick(95), 1), "p99_ms": round(pick(99), 1),
+            "max_ms": round(ordered[-1], 1)}
+
+def rerank_counts(metrics_text):
+    """/metrics 텍스트에서 리랭킹 방식별 호출 수 {method: count}"""
+    counts = defaultdict(int)
+    for line in metrics_text.splitlines():
+        if not line.startswith("chatbot_rerank_total{"): continue
+        labels, value = line.rsplit(" ", 1)
+        method = labels.split('method="', 1)[1].split('"', 1)[0]
+        counts[method] += int(float(value))
+    return dict(counts)
+
+def rerank_prompt_tokens(metrics_text):
+    """/metrics 텍스트에서 Gemini 리랭킹 프롬프트의 평균 어림 토큰 수 (호출이 없으면 None)"""
+    values = {}
+    for line in metrics_text.splitlines():
+        for field in ("sum", "count"):
+            if line.startswith(f'chatbot_llm_prompt_tokens_{field}{{kind="rerank"}}'):
+                values[field] = float(line.rsplit(" ", 1)[1])
+    return round(values["sum"] / values["count"]) if values.get("count") else None
+
+def _rerank_llm_rate(counts):
+    total = sum(counts.values())
+    return round((counts.get("llm", 0) + counts.get("llm_failed", 0)) / total, 3) if total else None
+
+def _replay_report(label, jobs, elapsed, latencies, failures, before, after, **extra):
+    report = {
+        "requests": len(jobs), "elapsed_s": round(elapsed, 3), "throughput": round(len(jobs) / elapsed, 2),
+        **latency_summary(latencies), "failures": failures,
+        "redis_used_memory_delta": after["used_memory"] - before["used_memory"],
+        "redis_keys": after["keys"], "redis_key_bytes": after["key_bytes"], **extra,
+    }
+    notes = [f"실패 {failures}"] if failures else []
+    if report.get("rerank_llm_rate") is not None: notes.append(f"Gemini 리랭킹 {report['rerank_llm_rate']:.0%}")
+    if report.get("rerank_prompt_tokens"): notes.append(f"리랭킹 프롬프트 ≈{report['rerank_prompt_tokens']:,}토큰")
+    print(f"   - {label:<7} {report['throughput']:7.2f} req/s | p50 {report['p50_ms']:7.0f}ms"
+          f" p95 {report['p95_ms']:7.0f}ms p99 {report['p99_ms']:7.0f}ms"
+          f" | Redis +{report['redis_used_memory_delta'] / 1024:,.0f}KB (키 {report['redis_keys']}개,"
+          f" {report['redis_key_bytes'] / 1024:,.0f}KB)" + "".join(f" | {note}" for note in notes))
+    return report
+
+def replay_worker(args, jobs, client):
+    """process_job을 --concurrency개 스레드에서 직접 호출합니다. (의도 분석/큐/결과 저장 없이 검색 파이프라인만)"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    import metrics
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker = install_stubs(args.llm_latency, args.embed_latency, args.db_latency, keep_embedding_cache=True)
+    worker.utils.semantic_cache_index.replace([], [])
+    latencies, stages, failures = [], defaultdict(list), 0
+
+    def one(job):
+        nonlocal failures
+        timings = {}
+        started = time.perf_counter()
+        try:
+            worker.process_job(dict(job), timings)
+        except Exception:
+            failures += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+        for stage, seconds in timings.items(): stages[stage].append(seconds * 1000)
+
+    before = redis_memory_snapshot(client)
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(one, jobs))
+        elapsed = time.perf_counter() - started
+        # 의미 캐시 저장 등 백그라운드 쓰기가 끝난 뒤의 메모리를 잽니다.
+        worker.drain_background_writes()
+    report = _replay_report("worker", jobs, elapsed, latencies, failures, before, redis_memory_snapshot(client),
+                            rerank_llm_rate=_rerank_llm_rate(rerank_counts(metrics.render())),
+                            rerank_prompt_tokens=rerank_prompt_tokens(metrics.render()),
+                            stages_p50_ms={stage: latency_summary(v)["p50_ms"] for stage, v in stages.items()})
+    print("     단계별 p50: " + ", ".join(f"{stage}={ms:.0f}ms" for stage, ms in report["stages_p50_ms"].items()))
+    return report
+
+def _serve_replay_worker(args, ready, metrics_port):
+    """(자식 프로세스) 스텁을 끼운 워커. API 서버와 같은 접두사 키로 큐를 소비하고, 지표는 metrics_port로 내보냅니다."""
+    os.environ["WORKER_METRICS_PORT"] = str(metrics_port)
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker = install_stubs(args.llm_latency, args.embed_latency, args.db_latency, keep_embedding_cache=True)
+        ready.set()
+        worker.start_worker(concurrency=args.concurrency)
+
+async def _replay_chat(base_url, jobs, concurrency):
+    """/chat을 보내고, 작업이 등록되면 /get_result?wait= 롱폴링으로 최종 결과까지 기다린 시간을 잽니다."""
+    import httpx
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures, queued = [], 0, 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(job):
+            nonlocal failures, queued
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json=job)
+                    result = response.json() if response.status_code == 200 else {"status": "error"}
+                    job_id = result.get("job_id")
+                    if job_id: queued += 1
+                    while job_id and result.get("status") not in ("complete", "error", "clarify"):
+                        result = (await client.get(f"/get_result/{job_id}", params={"wait": 30})).json()
+                    ok = result.get("status") != "error"
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not ok: failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(job) for job in jobs))
+        return time.perf_counter() - started, latencies, failures, queued
+
+def replay_api(args, jobs, client):
+    """API 서버와 워커를 각각 자식 프로세스로 띄우고 /chat → /get_result 전체 경로를 재생합니다."""
+    import logging
+    import multiprocessing
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    port, metrics_port = _free_port(), _free_port()
+    ready = multiprocessing.Event()
+    worker_process = multiprocessing.Process(target=_serve_replay_worker, args=(args, ready, metrics_port), daemon=True)
+    api_process = multiprocessing.Process(target=_serve_api, args=(port, args.llm_latency), daemon=True)
+    worker_process.start()
+    api_process.start()
+    try:
+        ready.wait(30)
+        _wait_for_port(port)
+        before = redis_memory_snapshot(client)
+        elapsed, latencies, failures, queued = asyncio.run(
+            _replay_chat(f"http://127.0.0.1:{port}", jobs, args.concurrency))
+        import httpx
+        worker_metrics = httpx.get(f"http://127.0.0.1:{metrics_port}/metrics", timeout=10).text
+        return _replay_report("api", jobs, elapsed, latencies, failures, before, redis_memory_snapshot(client),
+                              rerank_llm_rate=_rerank_llm_rate(rerank_counts(worker_metrics)),
+                              rerank_prompt_tokens=rerank_prompt_tokens(worker_metrics), queued_jobs=queued)
+    finally:
+        for process in (api_process, worker_process):
+            process.terminate()
+            process.join()
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def _print_comparison(baseline, config, runs):
+    print(f"📏 기준 결과 대비 (기준 커밋: {baseline.get('commit')})")
+    if baseline.get("config") != config:
+        print(f"   ⚠️ 설정이 달라 직접 비교하기 어렵습니다: {baseline.get('config')} vs {config}")
+    for mode, report in runs.items():
+        old = baseline.get("runs", {}).get(mode)
+        if not old: continue
+        deltas = []
+        for key in ["throughput", "p50_ms", "p95_ms", "p99_ms", "redis_key_bytes", "rerank_llm_rate", "rerank_prompt_tokens"]:
+            if old.get(key) and report.get(key) is not None:
+                deltas.append(f"{key} {old[key]} → {report[key]} ({(report[key] - old[key]) / old[key]:+.1%})")
+        print(f"   - {mode:<7} " + ", ".join(deltas))
+
+def bench_replay(args):
+    # utils가 import되기 전에 벤치마크용 Redis DB와 워커 설정을 정합니다. (자식 프로세스도 물려받음)
+    if args.redis_db == 0:
+        print("❌ replay는 실행마다 DB를 비우므로 운영 DB(0)는 쓸 수 없습니다. --redis-db를 바꿔 주세요.")
+        return
+    os.environ["REDIS_DB"] = str(args.redis_db)
+    os.environ["WORKER_CONCURRENCY"] = str(args.concurrency)
+    os.environ["WORKER_METRICS_PORT"] = "0"
+    if args.rerank_mode: os.environ["RERANK_MODE"] = args.rerank_mode
+    os.environ["BENCH_LLM_PREFILL_LATENCY"] = str(args.llm_prefill_latency)
+
+    jobs = load_replay_jobs(args.questions_file, args.aof, args.limit)
+    if not jobs:
+        print("❌ 재생할 질문이 없습니다.")
+        return
+    client = _bench_redis(args.redis_db)
+    print(f"📼 질문 {len(jobs)}건 재생 | 동시 {args.concurrency} | LLM {args.llm_latency}s, 임베딩 {args.embed_latency}s,"
+          f" DB {args.db_latency}s | 입력 {args.llm_prefill_latency}s/1k토큰 | Redis DB {args.redis_db}")
+
+    runs = {}
+    # api 모드는 자식 프로세스가 깨끗한 상태에서 시작하도록 (이 프로세스에 스텁/모듈을 올리기 전에) 먼저 실행합니다.
+    for mode, run in [("api", replay_api), ("worker", replay_worker)]:
+        if args.mode not in (mode, "all"): continue
+        client.flushdb()
+        runs[mode] = run(args, jobs, client)
+
+    result = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"requests": len(jobs), "concurrency": args.concurrency, "llm_latency": args.llm_latency,
+                   "llm_prefill_latency": args.llm_prefill_latency,
+                   "embed_latency": args.embed_latency, "db_latency": args.db_latency,
+                   "rerank_mode": os.getenv("RERANK_MODE", "hybrid"),
+                   "source": args.questions_file or args.aof or "builtin"},
+        "runs": runs,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _print_comparison(json.load(f), result["config"], runs)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 결과 저장: {args.output}")
+
+# --- 5. 검색 엔진 비교 (Supabase RPC vs 로컬 엔진) ---
+SAMPLE_QUESTIONS = [
+    "장애검사", "짝치료 프로그램", "언어치료 바우처", "3살 아이 발달검사 비용",
+    "복지관 부모교육", "기저귀 지원", "장애아 통합보육 어린이집", "아이돌봄 서비스",
+]
+
+def _timed_ms(func, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+def bench_search(args):
+    """같은 질의 임베딩/키워드로 match_documents RPC와 로컬 엔진의 지연시간과 결과 일치도를 비교합니다."""
+    import utils
+    from local_search import LocalSearchEngine
+
+    supabase = utils.get_supabase()
+    if not utils.get_genai() or not supabase:
+        print("❌ 실제 GEMINI_API_KEY / SUPABASE_URL / SUPABASE_KEY 설정이 필요합니다.")
+        return
+
+    engine = LocalSearchEngine()
+    started = time.perf_counter()
+    engine.load()
+    print(f"📚 로컬 엔진 로드: {time.perf_counter() - started:.2f}s")
+
+    rpc_all, local_all, overlaps = [], [], []
+    for question in args.questions or SAMPLE_QUESTIONS:
+        embedding = utils.get_gemini_embedding(question, task_type="RETRIEVAL_QUERY")
+        keywords = [k for k in question.split() if len(k) >= 2]
+        params = {"query_embedding": embedding, "match_count": args.match_count, "keywords": keywords}
+
+        rpc_rows, rpc_ms = _timed_ms(lambda: supabase.rpc("match_documents", params).execute().data, args.repeat)
+        local_rows, local_ms = _timed_ms(lambda: engine.search(embedding, keywords, args.match_count), args.repeat)
+        rpc_all += rpc_ms
+        local_all += local_ms
+
+        rpc_top = [r.get("metadata", {}).get("page_id") for r in rpc_rows[:args.top]]
+        local_top = [r.get("metadata", {}).get("page_id") for r in local_rows[:args.top]]
+        overlap = len(set(rpc_top) & set(local_top)) / max(1, len(rpc_top))
+        overlaps.append(overlap)
+        print(f"   - {question:<20} RPC {statistics.median(rpc_ms):7.1f}ms | 로컬 {statistics.median(local_ms):6.2f}ms"
+              f" | 상위 {args.top} 일치 {overlap:.0%}")
+
+    print(f"📊 p50: RPC {statistics.median(rpc_all):.1f}ms, 로컬 {statistics.median(local_all):.2f}ms"
+          f" | 평균 상위 {args.top} 일치율 {statistics.mean(overlaps):.0%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="챗봇 파이프라인 벤치마크 (스텁 클라이언트)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_worker = sub.add_parser("worker", help="동시 처리 수에 따른 워커 처리량 측정")
+    p_worker.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    p_worker.add_argument("--jobs", type=int, default=40)
+    p_worker.add_argument("--llm-latency", type=float, default=0.2)
+    p_worker.add_argument("--embed-latency", type=float, default=0.05)
+    p_worker.add_argument("--db-latency", type=float, default=0.05)
+    p_worker.set_defaults(func=bench_worker)
+
+    p_api = sub.add_parser("api", help="/chat 동시 요청 수용량 측정 (async 경로 vs 동기 경로)")
+    p_api.add_argument("--concurrency", type=int, nargs="+", default=[20, 40, 80, 120])
+    p_api.add_argument("--requests", type=int, default=240)
+    # 동기 경로의 상한(스레드 40개 / LLM 지연)이 잘 드러나도록 지연을 길게 잡습니다.
+    p_api.add_argument("--llm-latency", type=float, default=2.0)
+    p_api.set_defaults(func=bench_api)
+
+    p_replay = sub.add_parser("replay", help="기록된 질문 재생: process_job / (/chat → /get_result) 처리량, 지연, Redis 메모리")
+    p_replay.add_argument("--mode", choices=["all", "worker", "api"], default="all")
+    p_replay.add_argument("--questions-file", help="JSONL (줄마다 question, 선택: chat_history/last_result_ids/shown_count)")
+    p_replay.add_argument("--aof", help="Redis AOF 파일 또는 appendonlydir (작업 큐 등록 기록을 재생)")
+    p_replay.add_argument("--limit", type=int)
+    p_replay.add_argument("--concurrency", type=int, default=8)
+    p_replay.add_argument("--llm-latency", type=float, default=0.2)
+    p_replay.add_argument("--llm-prefill-latency", type=float, default=0.0,
+                          help="프롬프트 1000토큰당 추가 지연(초). 프롬프트 크기가 지연에 미치는 영향을 볼 때 사용")
+    p_replay.add_argument("--embed-latency", type=float, default=0.05)
+    p_replay.add_argument("--db-latency", type=float, default=0.05)
+    p_replay.add_argument("--rerank-mode", choices=["local", "llm", "hybrid"], help="RERANK_MODE (기본: 환경 변수 또는 hybrid)")
+    p_replay.add_argument("--redis-db", type=int, default=int(os.getenv("BENCH_REDIS_DB", "15")))
+    p_replay.add_argument("--output", help="결과 JSON 저장 경로 (다른 커밋과 --compare로 비교)")
+    p_replay.add_argument("--compare", help="이전에 --output으로 저장한 결과 JSON")
+    p_replay.set_defaults(func=bench_replay)
+
+    p_search = sub.add_parser("search", help="Supabase RPC와 로컬 검색 엔진의 지연시간/결과 비교")
+    p_search.add_argument("questions", nargs="*")
+    p_search.add_argument("--repeat", type=int, default=5)
+    p_search.add_argument("--match-count", type=int, default=100)
+    p_search.add_argument("--top", type=int, default=10)
+    p_search.set_defaults(func=bench_search)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
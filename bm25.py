@@ -0,0 +1,108 @@
+# bm25.py (한국어 BM25 키워드 색인)
+"""
+조사/띄어쓰기에 강한 한국어 BM25 색인입니다.
+
+- 토큰화: 특수문자 제거 → 어절 단위로 자르고 조사를 뗀 어간("어린이집에서" → "어린이집")과
+  어간의 글자 2-gram("어린", "린이", "이집")을 함께 씁니다.
+  2-gram 덕분에 "발달검사"처럼 붙여 쓴 질문도 "발달 정밀 검사" 문서와 맞춰집니다.
+- 색인: 용어별 (문서 번호 배열, 등장 횟수 배열) 포스팅과 IDF를 미리 계산해 둡니다.
+- 점수: 질의 용어의 포스팅만 NumPy로 누적하므로, 전체 문서를 훑지 않습니다.
+"""
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from utils import STOP_WORDS, _strip_particle
+
+WORD_PREFIX = "w:"
+
+def tokenize_korean(text: str) -> List[str]:
+    tokens = []
+    for word in re.sub(r'[^\w\s]', ' ', (text or "").lower()).split():
+        if word in STOP_WORDS: continue
+        stem = _strip_particle(word)
+        if stem in STOP_WORDS: continue
+        tokens.append(WORD_PREFIX + stem)
+        if len(stem) >= 2:
+            tokens.extend(stem[i:i + 2] for i in range(len(stem) - 1))
+    return tokens
+
+@lru_cache(maxsize=4096)
+def term_counts(text: str) -> Counter:
+    """문서 텍스트의 용어별 등장 횟수. 같은 문서가 여러 질의의 후보로 반복되므로 캐시합니다. (반환값은 수정하지 마세요)"""
+    return Counter(tokenize_korean(text))
+
+def score_documents(query: str, documents: Sequence[Counter], k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """
+    색인을 만들지 않고 적은 수의 문서(리랭킹 후보 등)에 바로 BM25 점수를 매깁니다. (BM25Index.scores와 같은 식)
+    documents는 term_counts()의 결과이며, IDF와 평균 길이는 이 문서 집합 안에서 계산합니다.
+    """
+    size = len(documents)
+    scores = np.zeros(size, dtype=np.float32)
+    if not size: return scores
+    lengths = np.array([sum(counts.values()) for counts in documents], dtype=np.float32)
+    norms = k1 * (1 - b + b * lengths / (float(lengths.mean()) or 1.0))
+    for term, qtf in Counter(tokenize_korean(query)).items():
+        tfs = np.array([counts.get(term, 0) for counts in documents], dtype=np.float32)
+        df = np.count_nonzero(tfs)
+        if not df: continue
+        idf = np.log(1 + (size - df + 0.5) / (df + 0.5))
+        scores += qtf * idf * tfs * (k1 + 1) / (tfs + norms)
+    return scores
+
+class BM25Index:
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+
+        postings = defaultdict(list)
+        doc_lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize_korean(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+        avg_length = float(doc_lengths.mean()) if self.size else 0.0
+        # 문서 길이 정규화 항(k1 * (1 - b + b * dl / avgdl))을 문서별로 미리 계산
+        self._norms = self.k1 * (1 - self.b + self.b * doc_lengths / (avg_length or 1.0))
+        self._postings: Dict[str, tuple] = {}
+        for term, entries in postings.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((t for _, t in entries), dtype=np.float32, count=len(entries))
+            idf = np.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            self._postings[term] = (doc_ids, tfs, np.float32(idf))
+
+    def scores(self, query: str) -> np.ndarray:
+        """모든 문서의 BM25 점수 (문서 순서대로, 일치 없는 문서는 0)"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term, qtf in Counter(tokenize_korean(query)).items():
+            posting = self._postings.get(term)
+            if posting is None: continue
+            doc_ids, tfs, idf = posting
+            scores[doc_ids] += qtf * idf * tfs * (self.k1 + 1) / (tfs + self._norms[doc_ids])
+        return scores
+
+    def ranking(self, query: str, limit: int = None) -> List[int]:
+        return rank_matches(self.scores(query), limit)
+
+def rank_matches(scores: np.ndarray, limit: int = None) -> List[int]:
+    """점수가 0보다 큰 문서 번호를 점수 내림차순으로 반환합니다."""
+    matched = np.flatnonzero(scores > 0)
+    ordered = matched[np.argsort(-scores[matched], kind="stable")]
+    return ordered[:limit].tolist() if limit else ordered.tolist()
+
+def rrf_fuse(rankings: Iterable[Sequence[int]], k: int = 60) -> Dict[int, float]:
+    """
+    Reciprocal Rank Fusion: 여러 순위 목록을 1 / (k + 순위) 합으로 합칩니다.
+    점수 척도가 다른 벡터 유사도와 BM25를 보정 없이 섞을 수 있습니다.
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return dict(fused)
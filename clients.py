@@ -0,0 +1,103 @@
+# clients.py (지연 초기화 클라이언트 레지스트리)
+"""
+외부 클라이언트(Redis, Supabase, Notion, Gemini)를 프로세스당 한 번, 처음 쓸 때 만듭니다.
+
+- import 시점에는 아무것도 연결하지 않으므로 API 서버가 바로 뜨고,
+  의존 서비스가 준비되는 동안에도 정적 파일과 /health는 응답할 수 있습니다.
+- 설정이 없으면(factory가 None 반환) None을 돌려주고, 생성 중 오류가 나면
+  RETRY_AFTER초 동안은 다시 시도하지 않고 None을 돌려줍니다. (요청마다 느린 재시도 방지)
+- health()는 등록된 확인 함수로 각 클라이언트의 실제 상태(지연 시간 포함)를 점검합니다.
+- per_loop=True인 비동기 클라이언트(redis.asyncio, httpx 기반)는 연결이 만든 이벤트 루프에 묶이므로
+  실행 중인 이벤트 루프마다 하나씩 만듭니다. (루프가 사라지면 함께 정리됨)
+"""
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, Optional
+
+RETRY_AFTER = 10.0
+
+class _Entry:
+    def __init__(self, factory: Callable[[], Any], check: Optional[Callable[[Any], Any]], per_loop: bool = False):
+        self.factory = factory
+        self.check = check
+        self.per_loop = per_loop
+        self.loops = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.built = False
+        self.instance = None
+        self.error = None
+        self.failed_at = 0.0
+
+class ClientRegistry:
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], check: Optional[Callable[[Any], Any]] = None,
+                 per_loop: bool = False):
+        """factory()는 클라이언트(설정이 없으면 None)를, check(client)는 실패 시 예외를 던집니다."""
+        self._entries[name] = _Entry(factory, check, per_loop)
+
+    def _build(self, name: str, entry: _Entry):
+        """(성공 여부, 클라이언트)를 반환합니다. 최근 RETRY_AFTER초 안에 실패했으면 시도하지 않습니다."""
+        if entry.error and time.monotonic() - entry.failed_at < RETRY_AFTER: return False, None
+        try:
+            instance = entry.factory()
+            entry.error = None
+            return True, instance
+        except Exception as e:
+            entry.error, entry.failed_at = str(e), time.monotonic()
+            print(f"⚠️ [Clients] '{name}' 초기화 실패: {e}")
+            return False, None
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        if entry.built: return entry.instance
+        if entry.per_loop: return self._get_for_loop(name, entry)
+        with entry.lock:
+            if entry.built: return entry.instance
+            ok, instance = self._build(name, entry)
+            if ok: entry.instance, entry.built = instance, True
+            return instance
+
+    def _get_for_loop(self, name: str, entry: _Entry) -> Any:
+        """실행 중인 이벤트 루프 전용 클라이언트 (코루틴 안에서만 부를 수 있음)"""
+        loop = asyncio.get_running_loop()
+        with entry.lock:
+            if loop in entry.loops: return entry.loops[loop]
+            ok, instance = self._build(name, entry)
+            if ok: entry.loops[loop] = instance
+            return instance
+
+    def override(self, name: str, instance: Any):
+        """이미 만든 객체(또는 테스트/벤치마크용 스텁)로 교체합니다."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.instance, entry.built, entry.error = instance, True, None
+
+    def reset(self, name: str):
+        entry = self._entries[name]
+        with entry.lock:
+            entry.instance, entry.built, entry.error = None, False, None
+            entry.loops.clear()
+
+    def health(self, names: Iterable[str] = None) -> Dict[str, dict]:
+        """{이름: {"ok", "configured", "latency_ms", "error"}} (아직 안 만든 클라이언트는 이때 만듭니다)"""
+        report = {}
+        for name in (names or [n for n, e in self._entries.items() if not e.per_loop]):
+            entry = self._entries[name]
+            started = time.perf_counter()
+            client = self.get(name)
+            status = {"configured": client is not None, "ok": False, "error": entry.error}
+            if client is not None:
+                try:
+                    if entry.check: entry.check(client)
+                    status["ok"] = True
+                except Exception as e:
+                    status["error"] = str(e)
+            status["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            report[name] = status
+        return report
+
+registry = ClientRegistry()
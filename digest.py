@@ -0,0 +1,72 @@
+# digest.py (리랭킹용 문서 요약 카드)
+"""
+리랭킹 프롬프트에 넣을 문서별 짧은 요약 카드(digest)를 만듭니다.
+
+- 색인기(index.py)가 페이지마다 한 번 만들어 metadata["digest"]에 pre_summary와 함께 저장합니다.
+- 형식: "제목 | 대상: 0~72개월 (장애/발달지연) | 지원: 검사비 최대 40만원, ... | 자격: ..."
+  지원 내용은 금액/횟수 같은 숫자나 지원 관련 단어가 있는 구절을 앞에 둡니다.
+- 길이는 토큰 예산(DIGEST_TOKEN_BUDGET)에 맞춰 자릅니다. 토크나이저 없이 UTF-8 바이트 수 / 4로
+  어림합니다. (한글 1자 ≈ 0.75토큰, 실제 Gemini 토큰 수와 같은 자릿수)
+- digest가 없는 예전 행은 content(사업명/대상/지원 내용/추가 자격요건 줄 형식)에서 같은 방식으로 만듭니다.
+"""
+import os
+import re
+from functools import lru_cache
+
+DIGEST_TOKEN_BUDGET = int(os.getenv("DIGEST_TOKEN_BUDGET", "80"))
+BYTES_PER_TOKEN = 4
+ELLIPSIS = "…"
+
+# 이 단어가 있는 구절을 핵심 지원 내용으로 봅니다. (숫자가 있는 구절과 함께 앞에 둠)
+BENEFIT_WORDS = ["지원", "무료", "감면", "바우처", "제공", "지급", "할인", "대여"]
+
+def estimate_tokens(text: str) -> int:
+    return -(-len((text or "").encode("utf-8")) // BYTES_PER_TOKEN)
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """어림 토큰 수가 budget을 넘으면 글자 단위로 자르고 '…'를 붙입니다."""
+    limit = budget * BYTES_PER_TOKEN
+    encoded = (text or "").encode("utf-8")
+    if len(encoded) <= limit: return text or ""
+    return encoded[:max(limit - len(ELLIPSIS.encode("utf-8")), 0)].decode("utf-8", "ignore").rstrip(" ,|") + ELLIPSIS
+
+def _benefit_phrases(detail: str) -> list:
+    """지원 내용을 구절로 나눠, 금액/횟수 등 숫자가 있는 구절 → 지원 관련 단어가 있는 구절 → 나머지 순으로 (중복 제거)"""
+    phrases = []
+    for phrase in re.split(r'[\n·•▶※;]|(?<=[다요])\.\s*|^\s*-\s*', detail or "", flags=re.MULTILINE):
+        phrase = re.sub(r'[*#]+', '', re.sub(r'\s+', ' ', phrase)).strip(" -:,.")
+        phrase = re.sub(r'^(?:지원\s*내용|내용)\s*:\s*', '', phrase)
+        if len(phrase) >= 2 and phrase not in phrases: phrases.append(phrase)
+    key = lambda p: 0 if re.search(r'\d', p) else 1 if any(w in p for w in BENEFIT_WORDS) else 2
+    return sorted(phrases, key=key)
+
+def build_digest(title: str, target: str, detail: str, extra_req: str = "", budget: int = DIGEST_TOKEN_BUDGET) -> str:
+    parts = [title or ""]
+    if target: parts.append(f"대상: {target}")
+    benefits = _benefit_phrases(detail)
+    if benefits: parts.append(f"지원: {', '.join(benefits)}")
+    if extra_req and extra_req.strip() not in ("", "—"): parts.append("자격: " + re.sub(r'\s+', ' ', extra_req).strip())
+    return truncate_to_tokens(" | ".join(p for p in parts if p), budget)
+
+@lru_cache(maxsize=4096)
+def digest_from_content(content: str, title: str = "", budget: int = DIGEST_TOKEN_BUDGET) -> str:
+    """색인기가 저장한 content('사업명: ...' 줄 형식)에서 digest를 만듭니다. (digest가 없는 예전 행용)"""
+    target, extra_req, detail = "", "", []
+    for line in (content or "").splitlines():
+        if line.startswith("사업명:"): title = title or line.split(":", 1)[1].strip()
+        elif line.startswith("대상:"): target = line.split(":", 1)[1].strip()
+        elif line.startswith("추가 자격요건:"): extra_req = line.split(":", 1)[1].strip()
+        elif line.startswith("문의처:"): continue
+        else: detail.append(line)
+    return build_digest(title, target, "\n".join(detail), extra_req, budget)
+
+def get_digest(doc: dict, budget: int = DIGEST_TOKEN_BUDGET) -> str:
+    """검색 결과 행의 digest (저장된 값이 있으면 그대로, 없으면 content에서 계산). budget에 맞춰 자릅니다."""
+    meta = doc.get("metadata") or {}
+    title = meta.get("title", "")
+    # 리랭킹 후보는 티어 표시(★(우선추천) 등)가 제목 앞에 붙어 있으므로 저장된 digest의 제목 대신 이 제목을 씁니다.
+    stored = meta.get("digest")
+    if stored:
+        body = stored.split(" | ", 1)[1] if " | " in stored else ""
+        return truncate_to_tokens(f"{title} | {body}" if body else title, budget)
+    return digest_from_content(doc.get("content") or "", title, budget)
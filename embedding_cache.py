@@ -0,0 +1,93 @@
+# embedding_cache.py (내용 주소 기반 임베딩 캐시)
+"""
+(모델명, task_type, 텍스트 sha256)을 키로 임베딩을 저장합니다.
+같은 텍스트는 어디서 임베딩하든(인덱서/워커) 한 번만 API를 부릅니다.
+
+- 값은 JSON 목록이 아니라 float32 바이트(768차원 = 3KB)로 저장합니다.
+- 2단 캐시: 프로세스 메모리 LRU(최근 사용 순 제거) → Redis(TTL, 읽을 때마다 TTL 연장)
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+class EmbeddingCache:
+    def __init__(self, redis_client, prefix: str = "emb:v1", ttl: int = 30 * 24 * 3600, local_size: int = 2048):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.prefix}:{model}:{task_type}:{digest}"
+
+    @staticmethod
+    def encode(vector: Sequence[float]) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def decode(raw: bytes) -> List[float]:
+        return np.frombuffer(raw, dtype=np.float32).tolist()
+
+    def _remember(self, key: str, raw: bytes):
+        with self._lock:
+            self._local[key] = raw
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get_many(self, model: str, task_type: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """입력 순서대로 캐시된 임베딩(없으면 None)을 반환합니다."""
+        keys = [self.key(model, task_type, text) for text in texts]
+        found: Dict[int, bytes] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                raw = self._local.get(key)
+                if raw is not None:
+                    self._local.move_to_end(key)
+                    found[i] = raw
+
+        missing = [i for i in range(len(keys)) if i not in found]
+        if missing:
+            try:
+                values = self.redis.mget([keys[i] for i in missing])
+                pipe = self.redis.pipeline()
+                for i, raw in zip(missing, values):
+                    if raw is None: continue
+                    found[i] = raw
+                    self._remember(keys[i], raw)
+                    pipe.expire(keys[i], self.ttl)
+                pipe.execute()
+            except Exception as e:
+                print(f"⚠️ 임베딩 캐시 조회 실패: {e}")
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return [self.decode(found[i]) if i in found else None for i in range(len(keys))]
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, task_type, [text])[0]
+
+    def set_many(self, model: str, task_type: str, texts: Sequence[str], vectors: Sequence[Optional[Sequence[float]]]):
+        """임베딩 결과를 저장합니다. (None은 건너뜀)"""
+        try:
+            pipe = self.redis.pipeline()
+            for text, vector in zip(texts, vectors):
+                if not vector: continue
+                key, raw = self.key(model, task_type, text), self.encode(vector)
+                self._remember(key, raw)
+                pipe.set(key, raw, ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ 임베딩 캐시 저장 실패: {e}")
+
+    def set(self, model: str, task_type: str, text: str, vector: Sequence[float]):
+        self.set_many(model, task_type, [text], [vector])
@@ -0,0 +1,56 @@
+# gemini_async.py (비동기 Gemini REST 클라이언트)
+"""
+API 요청 경로(/chat)에서 쓰는 Gemini generateContent 비동기 호출입니다.
+
+google.generativeai의 비동기 클라이언트는 transport="rest" 설정에서 동작하지 않으므로
+같은 REST 엔드포인트를 httpx.AsyncClient로 직접 부릅니다.
+응답 객체는 SDK처럼 .text / .resolve()를 제공해 동기 코드와 같은 방식으로 다룰 수 있습니다.
+"""
+from typing import Optional
+
+import httpx
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+class GeminiResponse:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def resolve(self):
+        return None
+
+    @property
+    def text(self) -> str:
+        candidates = self.data.get("candidates") or []
+        parts = ((candidates[0].get("content") or {}).get("parts") or []) if candidates else []
+        if not parts:
+            # SDK와 마찬가지로 차단/빈 응답은 예외로 알립니다.
+            reason = (candidates[0].get("finishReason") if candidates else None) or \
+                     (self.data.get("promptFeedback") or {}).get("blockReason")
+            raise ValueError(f"Gemini 응답에 텍스트가 없습니다. (사유: {reason})")
+        return "".join(part.get("text", "") for part in parts)
+
+class AsyncGeminiModel:
+    """
+    genai.GenerativeModel.generate_content와 같은 모양의 비동기 버전.
+    httpx.AsyncClient는 만든 이벤트 루프에서만 쓸 수 있으므로 루프마다 하나씩 만듭니다. (clients.py per_loop)
+    """
+    def __init__(self, model_name: str, api_key: str, max_connections: int = 100):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.client = httpx.AsyncClient(base_url=GEMINI_API_BASE,
+                                        limits=httpx.Limits(max_connections=max_connections))
+
+    async def generate_content(self, prompt: str, request_options: Optional[dict] = None, **kwargs) -> GeminiResponse:
+        timeout = (request_options or {}).get("timeout", 120)
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if kwargs.get("generation_config"): body["generationConfig"] = kwargs["generation_config"]
+        if kwargs.get("safety_settings"): body["safetySettings"] = kwargs["safety_settings"]
+
+        response = await self.client.post(f"/models/{self.model_name}:generateContent", json=body,
+                                          headers={"x-goog-api-key": self.api_key}, timeout=timeout)
+        response.raise_for_status()
+        return GeminiResponse(response.json())
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -1,19 +1,40 @@
 import os
+import sys
 import json
 import time
+import hashlib
+import hmac
+import threading
+import signal
+import argparse
 import traceback
-from supabase import create_client
-from notion_client import Client as NotionClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from pipeline import Pipeline, TokenBucket, print_stage_report
+from batch_writer import BatchWriter
+from digest import build_digest
 from utils import (
-    LLM_MODEL,  
+    get_llm_model,
+    get_notion,
+    get_supabase,
+    wait_for_redis,
     summarize_content_with_llm, 
     _get_title, 
     _get_number, 
     _get_rich_text,
     _get_url,
-    get_gemini_embedding,
-    _get_multi_select
+    get_gemini_embeddings_batch,
+    _get_multi_select,
+    reserve_index_version,
+    activate_index_version,
+    get_index_manifest,
+    index_row_id,
+    INDEX_RETIRED_KEY,
+    INDEX_PENDING_ROWS_KEY,
+    update_indexer_status,
+    get_indexer_status,
+    redis_client
 )
 
 print("[Indexer] 설정 로드 중...")
@@ -39,217 +60,611 @@ NOTION_PROPERTY_NAMES = {
     "url3": "관련 홈페이지 3", "extra_req": "추가 자격요건"
 }
 
+# [증분 색인 상태] Redis에 영구 저장 (docker-compose의 redis_cache는 AOF로 디스크에 보존)
+# - 페이지별: last_edited_time + 색인 텍스트 해시 → 바뀌지 않은 페이지는 Gemini 호출 없이 건너뜀
+# - DB별 커서: 마지막 성공 시각 → 다음 실행은 그 이후 수정된 페이지만 Notion에서 조회
+INDEXER_STATE_KEY = "indexer:page_state"
+INDEXER_CURSOR_KEY = "indexer:cursors"
+# Notion의 last_edited_time은 분 단위로 잘리므로 커서를 조금 앞당겨 조회합니다.
+CURSOR_SAFETY_MARGIN = timedelta(minutes=2)
+# [레거시] 예전 JSON 상태 파일 (있으면 최초 1회 Redis로 옮겨옵니다)
 STATE_FILE_PATH = "./chroma-data/indexing_state.json"
 
-print("[Indexer] 클라이언트 초기화 중...")
-notion = NotionClient(auth=NOTION_KEY)
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-print("[Indexer] 초기화 완료.")
+# [파이프라인] 단계별 작업자 수와 단계 사이 큐 크기
+INDEXER_QUEUE_SIZE = int(os.getenv("INDEXER_QUEUE_SIZE", "64"))
+INDEXER_ASSEMBLE_WORKERS = int(os.getenv("INDEXER_ASSEMBLE_WORKERS", "2"))
+INDEXER_SUMMARIZE_WORKERS = int(os.getenv("INDEXER_SUMMARIZE_WORKERS", "4"))
+INDEXER_EMBED_WORKERS = int(os.getenv("INDEXER_EMBED_WORKERS", "2"))
+# 임베딩은 요약이 끝난 문서를 최대 N개(또는 N초 동안 모인 만큼)씩 묶어 배치 요청 1회로 처리합니다.
+INDEXER_EMBED_BATCH = int(os.getenv("INDEXER_EMBED_BATCH", "50"))
+INDEXER_EMBED_BATCH_WAIT = float(os.getenv("INDEXER_EMBED_BATCH_WAIT", "2.0"))
+INDEXER_WRITE_WORKERS = int(os.getenv("INDEXER_WRITE_WORKERS", "2"))
+# [속도 제한] 외부 API별 초당 요청 수 (0이면 제한 없음). Notion 공식 한도는 평균 초당 3회입니다.
+NOTION_RPS = float(os.getenv("NOTION_RPS", "3"))
+GEMINI_LLM_RPS = float(os.getenv("GEMINI_LLM_RPS", "2"))
+GEMINI_EMBED_RPS = float(os.getenv("GEMINI_EMBED_RPS", "10"))
+SUPABASE_RPS = float(os.getenv("SUPABASE_RPS", "10"))
+# [일괄 쓰기] site_pages upsert/delete 배치 크기와 최대 대기 시간(초)
+INDEXER_WRITE_BATCH = int(os.getenv("INDEXER_WRITE_BATCH", "100"))
+INDEXER_WRITE_FLUSH_INTERVAL = float(os.getenv("INDEXER_WRITE_FLUSH_INTERVAL", "5"))
+
+# [블루/그린 색인] 새 버전 행을 옆에 써 두고 검증한 뒤 활성 버전 포인터만 바꿉니다.
+# - 교체되어 쓰이지 않는 옛 행은 INDEX_RETIRED_KEY에 (행 id, 교체 시각)으로 쌓였다가
+#   INDEX_GC_GRACE초가 지나면 일괄 삭제됩니다. (교체 순간 처리 중이던 검색 보호)
+# - 빌드 중에 쓴 새 행 수는 INDEX_PENDING_ROWS_KEY에 남겨, 워커의 RPC 검색이 그만큼 더 가져오게 합니다.
+# - 새 매니페스트가 이전보다 INDEX_MAX_SHRINK 비율 넘게 줄면 교체하지 않습니다. (Notion 조회 이상 대비)
+INDEX_GC_GRACE = int(os.getenv("INDEX_GC_GRACE", "600"))
+INDEX_MAX_SHRINK = float(os.getenv("INDEX_MAX_SHRINK", "0.5"))
+
+# Notion/Supabase/Gemini 클라이언트는 utils의 공용 레지스트리에서 처음 쓸 때 만들어집니다.
+notion_limiter = TokenBucket(NOTION_RPS, name="notion")
+llm_limiter = TokenBucket(GEMINI_LLM_RPS, name="gemini-llm")
+embed_limiter = TokenBucket(GEMINI_EMBED_RPS, name="gemini-embed")
+supabase_limiter = TokenBucket(SUPABASE_RPS, name="supabase")
 
 def load_state():
+    """page_id -> {"last_edited_time", "content_hash", "category", "version"} (행이 없는 페이지는 "version" 대신 "skipped")"""
+    raw = redis_client.hgetall(INDEXER_STATE_KEY)
+    if raw:
+        return {k.decode('utf-8'): json.loads(v.decode('utf-8')) for k, v in raw.items()}
+
     if os.path.exists(STATE_FILE_PATH):
         try:
-            with open(STATE_FILE_PATH, "r", encoding="utf-8") as f: return json.load(f)
-        except: pass
+            with open(STATE_FILE_PATH, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            print(f"[Indexer] 📦 레거시 상태 파일에서 {len(legacy)}건을 불러옵니다.")
+            return {page_id: {"last_edited_time": edited, "content_hash": None} for page_id, edited in legacy.items()}
+        except Exception: pass
     return {}
 
-def save_state(state):
-    try:
-        with open(STATE_FILE_PATH, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-    except Exception: pass
+def save_state(updated: dict, removed=()):
+    """바뀐 페이지 상태만 덮어쓰고, 삭제된 페이지 상태는 지웁니다."""
+    pipe = redis_client.pipeline()
+    if updated:
+        pipe.hset(INDEXER_STATE_KEY, mapping={k: json.dumps(v, ensure_ascii=False) for k, v in updated.items()})
+    if removed:
+        pipe.hdel(INDEXER_STATE_KEY, *removed)
+    pipe.execute()
+
+def load_cursors() -> dict:
+    return {k.decode('utf-8'): v.decode('utf-8') for k, v in redis_client.hgetall(INDEXER_CURSOR_KEY).items()}
+
+def save_cursor(db_id: str, timestamp: str):
+    redis_client.hset(INDEXER_CURSOR_KEY, db_id, timestamp)
+
+def iter_pages(db_id: str, since: str = None):
+    """DB의 페이지를 차례로 내보냅니다. since(ISO 시각)를 주면 그 이후 수정된 페이지만 가져옵니다."""
+    # [수정 2] 안전한 페이지네이션(Pagination) 로직
+    has_more = True
+    next_cursor = None
+
+    while has_more:
+        # cursor가 있으면 넣고, 없으면 뺌
+        query_params = {"database_id": db_id}
+        if next_cursor: query_params["start_cursor"] = next_cursor
+        if since:
+            query_params["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+
+        notion_limiter.acquire() # API 속도 제한 준수
+        response = get_notion().databases.query(**query_params)
+
+        yield from response.get("results", [])
+        has_more = response.get("has_more")
+        next_cursor = response.get("next_cursor")
 
-def run_indexing():
+def build_page_document(page: dict, category_name: str) -> dict:
+    """Notion 페이지에서 요약용/임베딩용 텍스트와 메타데이터 재료를 만듭니다. (외부 API 호출 없음)"""
+    page_id = page.get("id")
+
+    # 데이터 추출
+    props = page.get("properties", {})
+    title = _get_title(props, NOTION_PROPERTY_NAMES["title"])
+    support_detail = _get_rich_text(props, NOTION_PROPERTY_NAMES["support_detail"])
+    extra_req = _get_rich_text(props, NOTION_PROPERTY_NAMES["extra_req"])
+    contact = _get_rich_text(props, NOTION_PROPERTY_NAMES["contact"])
+    page_url = page.get("url", "")
+    start_age = _get_number(props, NOTION_PROPERTY_NAMES["start_age"])
+    end_age = _get_number(props, NOTION_PROPERTY_NAMES["end_age"])
+    if end_age == -1: end_age = 99999
+
+    targets = _get_multi_select(props, NOTION_PROPERTY_NAMES["sub_category"])
+    targets_text = ", ".join(targets) if targets else ""
+    
+    age_text = ""
+    if start_age != -1 and start_age is not None:
+        if end_age != 99999 and end_age is not None: age_text = f"{int(start_age)}~{int(end_age)}개월"
+        else: age_text = f"{int(start_age)}개월 이상"
+    elif end_age != 99999 and end_age is not None: age_text = f"~{int(end_age)}개월"
+    
+    final_target = f"{age_text} ({targets_text})" if targets_text else age_text
+
+    # =========================================================
+    # [1] 요약용 텍스트 생성 (사용자에게 보여줄 전체 정보)
+    text_parts = [
+        f"사업명: {title}",
+        f"대상: {final_target}",
+        support_detail,
+        f"추가 자격요건: {extra_req}",
+        f"문의처: {contact}"
+    ]
+    full_text_for_summary = "\n".join([p.strip() for p in text_parts if p and p.strip()])
+
+    # [2] 임베딩용 텍스트 생성 (검색 정확도 향상용)
+    # [★전략 수정★] 중요도에 따라 반복 횟수를 다르게 적용합니다.
+    
+    search_keywords = f"{title} {category_name} {targets_text}".replace(" ", ", ")
+    req_text = f"자격요건: {extra_req}" if extra_req and extra_req != "—" else ""
+    
+    # 가중치 설정 (반복 횟수)
+    weight_title = 3        # 제목: 절대적 기준
+    weight_target = 2       # 대상 특성: 장애, 다문화 등 중요
+    weight_req = 1          # 자격요건: 소득, 거주지 등
+    
+    # 리스트 컴프리헨션으로 반복 생성
+    title_repeats = [f"문서제목: {title}" for _ in range(weight_title)]
+    target_repeats = [f"대상특성: {targets_text}" for _ in range(weight_target)] if targets_text else []
+    req_repeats = [f"자격요건: {req_text}" for _ in range(weight_req)] if req_text else []
+    
+    embedding_parts = [
+        f"핵심키워드: {search_keywords}",
+        f"카테고리: {category_name}",
+        f"대상: {final_target}",
+        f"내용: {support_detail}",
+    ] + title_repeats + target_repeats + req_repeats
+    
+    # (내용 support_detail은 노이즈 방지를 위해 여전히 제외합니다)
+    
+    full_text_for_embedding = "\n".join([p.strip() for p in embedding_parts if p and p.strip()])
+    # =========================================================
+
+    # 색인 결과를 바꾸는 입력 전체의 해시 (같으면 요약/임베딩을 다시 할 필요가 없음)
+    hash_source = json.dumps([full_text_for_summary, full_text_for_embedding, page_url, start_age, end_age, targets],
+                             ensure_ascii=False)
+    content_hash = hashlib.sha256(hash_source.encode('utf-8')).hexdigest()
+
+    return {
+        "page_id": page_id,
+        "last_edited_time": page.get("last_edited_time"),
+        "category": category_name,
+        "title": title,
+        "full_text_for_summary": full_text_for_summary,
+        "full_text_for_embedding": full_text_for_embedding,
+        "content_hash": content_hash,
+        "metadata": {
+            "page_id": page_id,
+            "category": category_name,
+            "sub_category_list": targets, # [★수정 3] 리스트 원본 저장 (필터링용)
+            "start_age": start_age,
+            "end_age": end_age,
+            "title": title,
+            "page_url": page_url,
+            # 리랭킹 프롬프트용 요약 카드 (제목/대상/핵심 지원 내용, DIGEST_TOKEN_BUDGET 토큰 이내)
+            "digest": build_digest(title, final_target, support_detail, extra_req),
+        },
+    }
+
+def summarize_document(doc: dict) -> dict:
+    print(f"[Indexer] ⚡️ '{doc['title']}' 요약 중... (ID: {doc['page_id']})")
+    pre_summary = summarize_content_with_llm(doc["full_text_for_summary"], doc["title"], [], limiter=llm_limiter)
+    return dict(doc, metadata=dict(doc["metadata"], pre_summary=pre_summary))
+
+def embed_documents(docs: list) -> list:
+    """여러 문서를 배치 임베딩 요청으로 한꺼번에 임베딩합니다. 실패한 문서는 embedding이 None입니다."""
+    # [★수정 1★] 문서 저장용 태스크 타입 사용!
+    # 검색할 때(Query)와 저장할 때(Document)의 타입이 달라야 정확도가 올라갑니다.
+    embeddings = get_gemini_embeddings_batch(
+        [doc["full_text_for_embedding"] for doc in docs],
+        task_type="RETRIEVAL_DOCUMENT", # <--- 핵심 수정!
+        limiter=embed_limiter
+    )
+    return [dict(doc, embedding=embedding) for doc, embedding in zip(docs, embeddings)]
+
+def build_record(doc: dict, version: str) -> dict:
+    """페이지 전체를 하나의 청크로, 색인 버전별 id(`{page_id}_0@v{version}`)의 site_pages 행으로 만듭니다."""
+    page_id = doc["page_id"]
+    return {
+        "id": index_row_id(page_id, version),
+        "page_id": page_id,
+        "content": doc["full_text_for_summary"], # DB에는 전체 내용 저장
+        "metadata": dict(doc["metadata"], index_version=version),
+        "embedding": doc["embedding"] # 벡터는 핵심 내용으로만 계산
+    }
+
+def count_existing_rows(row_ids: list, chunk_size: int = 100) -> int:
+    """site_pages에 실제로 저장된 행 수를 셉니다. (교체 전 검증용)"""
+    found = 0
+    for start in range(0, len(row_ids), chunk_size):
+        supabase_limiter.acquire()
+        response = get_supabase().table("site_pages").select("id").in_("id", row_ids[start:start + chunk_size]).execute()
+        found += len(response.data or [])
+    return found
+
+def retire_rows(row_ids: list) -> int:
+    """
+    더 이상 어떤 활성 버전에도 속하지 않는 행을 정리 대기열에 올리고, 새로 올린 행 수를 반환합니다.
+    (이미 올라간 행은 처음 시각을 유지)
+    """
+    if not row_ids: return 0
+    return redis_client.zadd(INDEX_RETIRED_KEY, {row_id: time.time() for row_id in row_ids}, nx=True)
+
+def list_row_ids(page_size: int = 1000) -> list:
+    """site_pages에 저장된 모든 행 id"""
+    row_ids, start = [], 0
+    while True:
+        supabase_limiter.acquire()
+        response = get_supabase().table("site_pages").select("id").order("id").range(start, start + page_size - 1).execute()
+        rows = response.data or []
+        row_ids.extend(row["id"] for row in rows)
+        if len(rows) < page_size: return row_ids
+        start += page_size
+
+def retire_orphan_rows(manifest: dict) -> int:
+    """
+    매니페스트에 없는 행을 테이블에서 직접 찾아 정리 대기열에 올립니다.
+    상태에 기록되지 않은 행(상태 없이 처음 빌드할 때의 블루/그린 이전 `{page_id}_0` 행 등)은
+    저장된 상태 기준의 정리로는 찾을 수 없습니다.
+    """
+    active_ids = {index_row_id(page_id, version) for page_id, version in manifest.items()}
+    return retire_rows([row_id for row_id in list_row_ids() if row_id not in active_ids])
+
+def collect_retired_rows(writer: BatchWriter) -> int:
+    """교체된 지 INDEX_GC_GRACE초가 지난 옛 행을 일괄 삭제합니다. 지운 행 수를 반환합니다."""
+    expired = [r.decode('utf-8') for r in redis_client.zrangebyscore(INDEX_RETIRED_KEY, 0, time.time() - INDEX_GC_GRACE)]
+    if not expired: return 0
+    if writer.delete_in("id", expired):
+        print("[Indexer] ⚠️ 옛 버전 행 일부를 지우지 못했습니다. 다음 실행에서 다시 시도합니다.")
+        return 0
+    redis_client.zrem(INDEX_RETIRED_KEY, *expired)
+    return len(expired)
+
+def run_indexing(full: bool = False, force: bool = False):
+    """
+    증분 색인을 실행합니다.
+    - 기본: DB별 커서 이후 수정된 페이지만 Notion에서 가져오고, 내용 해시가 같으면 Gemini 호출 없이 건너뜁니다.
+    - full=True: 모든 페이지를 조회해 Notion에서 지워진 페이지까지 정리합니다. (커서가 없으면 자동으로 full)
+    - force=True: 저장된 상태를 무시하고 모든 페이지를 다시 요약/임베딩합니다.
+
+    처리는 [Notion 조회 → 텍스트 조립 → 요약 → 임베딩 → 저장] 단계의 파이프라인으로 동시에 진행됩니다.
+    바뀐 페이지는 새 색인 버전의 행으로 옆에 쓰고, 검증이 끝나면 활성 버전을 한 번에 바꿉니다. (블루/그린)
+    """
     print("\n🔥🔥🔥 [코드 업데이트] 문서 임베딩 최적화 모드 (RETRIEVAL_DOCUMENT) 🔥🔥🔥\n")
-    print("[Indexer] 🚀 Supabase 증분 색인 시작...")
     
-    if not LLM_MODEL:
+    if not get_llm_model():
         print("❌ [Indexer] FATAL: Gemini 모델 로드 실패.")
-        return
+        return {"ok": False, "error": "Gemini 모델 로드 실패"}
+
+    # stored_state는 현재 활성 색인의 실제 구성(페이지별 행 버전)이고, prev_state는 건너뛰기 판단용입니다.
+    stored_state = load_state()
+    prev_state = {} if force else stored_state
+    cursors = {} if (full or force) else load_cursors()
+    # 이번 빌드의 새 행은 모두 이 버전으로 기록되고, 검증이 끝나야 활성화됩니다.
+    build_version = reserve_index_version()
+    # 커서는 이번 실행 '시작' 시각으로 남깁니다. (실행 중 수정된 페이지는 다음 실행에서 다시 확인)
+    run_started = datetime.now(timezone.utc)
+    mode = "전체" if (full or force or not cursors) else "증분"
+    print(f"[Indexer] 🚀 Supabase {mode} 색인 시작... (빌드 v{build_version}, 저장된 페이지 상태 {len(stored_state)}건)")
 
-    # prev_state = load_state()  <-- 이걸 주석 처리하고
-    prev_state = {} 
-    current_state = {}
-    total_processed = 0
-    total_skipped = 0
+    # 여러 단계의 작업자 스레드가 함께 갱신하는 실행 상태
+    lock = threading.Lock()
+    updated_state = {}
+    seen_ids = set()
+    failed_dbs = set()
+    counts = {"processed": 0, "skipped": 0}
     has_critical_error = False
-    
+
+    db_tasks = []
     for category_name, db_id in DATABASE_IDS.items():
-        print(f"\n[Indexer] '{category_name}' DB 확인 중...")
-        try:
-            results = []
-            
-            # [수정 2] 안전한 페이지네이션(Pagination) 로직
-            has_more = True
-            next_cursor = None
-            
-            while has_more:
-                # cursor가 있으면 넣고, 없으면 뺌
-                query_params = {"database_id": db_id}
-                if next_cursor: query_params["start_cursor"] = next_cursor
-                
-                response = notion.databases.query(**query_params)
-                
-                results.extend(response.get("results", []))
-                has_more = response.get("has_more")
-                next_cursor = response.get("next_cursor")
-                time.sleep(0.3) # API 속도 제한 준수
-            
-            print(f" - {len(results)}개 페이지 발견.")
-
-            for page in results:
-                page_id = page.get("id")
-                last_edited = page.get("last_edited_time")
-                if not page_id: continue
-                
-                current_state[page_id] = last_edited
-
-                if page_id in prev_state and prev_state[page_id] == last_edited:
-                    total_skipped += 1
-                    continue
-
-                print(f"\n[Indexer] ⚡️ 처리 시작 (ID: {page_id})")
-
-                try:
-                    supabase.table("site_pages").delete().eq("page_id", page_id).execute()
-                except: pass
-
-                # 데이터 추출
-                props = page.get("properties", {})
-                title = _get_title(props, NOTION_PROPERTY_NAMES["title"])
-                support_detail = _get_rich_text(props, NOTION_PROPERTY_NAMES["support_detail"])
-                extra_req = _get_rich_text(props, NOTION_PROPERTY_NAMES["extra_req"])
-                contact = _get_rich_text(props, NOTION_PROPERTY_NAMES["contact"])
-                page_url = page.get("url", "")
-                start_age = _get_number(props, NOTION_PROPERTY_NAMES["start_age"])
-                end_age = _get_number(props, NOTION_PROPERTY_NAMES["end_age"])
-                if end_age == -1: end_age = 99999
-
-                targets = _get_multi_select(props, NOTION_PROPERTY_NAMES["sub_category"])
-                targets_text = ", ".join(targets) if targets else ""
-                
-                age_text = ""
-                if start_age != -1 and start_age is not None:
-                    if end_age != 99999 and end_age is not None: age_text = f"{int(start_age)}~{int(end_age)}개월"
-                    else: age_text = f"{int(start_age)}개월 이상"
-                elif end_age != 99999 and end_age is not None: age_text = f"~{int(end_age)}개월"
-                
-                final_target = f"{age_text} ({targets_text})" if targets_text else age_text
-
-                # =========================================================
-                # [1] 요약용 텍스트 생성 (사용자에게 보여줄 전체 정보)
-                text_parts = [
-                    f"사업명: {title}",
-                    f"대상: {final_target}",
-                    support_detail,
-                    f"추가 자격요건: {extra_req}",
-                    f"문의처: {contact}"
-                ]
-                full_text_for_summary = "\n".join([p.strip() for p in text_parts if p and p.strip()])
-
-                # [2] 임베딩용 텍스트 생성 (검색 정확도 향상용)
-                # [★전략 수정★] 중요도에 따라 반복 횟수를 다르게 적용합니다.
-                
-                search_keywords = f"{title} {category_name} {targets_text}".replace(" ", ", ")
-                req_text = f"자격요건: {extra_req}" if extra_req and extra_req != "—" else ""
-                
-                # 가중치 설정 (반복 횟수)
-                weight_title = 3        # 제목: 절대적 기준
-                weight_target = 2       # 대상 특성: 장애, 다문화 등 중요
-                weight_req = 1          # 자격요건: 소득, 거주지 등
-                
-                # 리스트 컴프리헨션으로 반복 생성
-                title_repeats = [f"문서제목: {title}" for _ in range(weight_title)]
-                target_repeats = [f"대상특성: {targets_text}" for _ in range(weight_target)] if targets_text else []
-                req_repeats = [f"자격요건: {req_text}" for _ in range(weight_req)] if req_text else []
-                
-                embedding_parts = [
-                    f"핵심키워드: {search_keywords}",
-                    f"카테고리: {category_name}",
-                    f"대상: {final_target}",
-                    f"내용: {support_detail}",
-                ] + title_repeats + target_repeats + req_repeats
-                
-                # (내용 support_detail은 노이즈 방지를 위해 여전히 제외합니다)
-                
-                full_text_for_embedding = "\n".join([p.strip() for p in embedding_parts if p and p.strip()])
-                
-                # [★확인용★] 
-                if total_processed == 0: 
-                     print(f"🔍 [X-RAY] 가중치 적용된 검색 데이터 예시:\n{full_text_for_embedding[:300]}...")
-                # =========================================================
-
-                # =========================================================
-                
-                # 페이지 전체를 하나의 청크로 처리
-                chunks = [full_text_for_summary] 
-                records_to_insert = []
-                
-                for i, chunk_text in enumerate(chunks):
-                    if len(chunk_text.strip()) < 10: continue
-                    chunk_id = f"{page_id}_{i}"
-
-                    print(f"[Indexer] ... '{title}' 요약 및 임베딩 중...")
-                    
-                    # 1. 요약
-                    pre_summary = summarize_content_with_llm(chunk_text, title, [])
-
-                    # 2. 임베딩 [★수정 1★] 문서 저장용 태스크 타입 사용!
-                    # 검색할 때(Query)와 저장할 때(Document)의 타입이 달라야 정확도가 올라갑니다.
-                    embedding = get_gemini_embedding(
-                        full_text_for_embedding, 
-                        task_type="RETRIEVAL_DOCUMENT" # <--- 핵심 수정!
-                    )
-
-                    if not embedding:
-                        print(f"❌ 임베딩 실패! 건너뜀.")
-                        continue
-
-                    metadata = {
-                        "page_id": page_id,
-                        "category": category_name,
-                        "sub_category_list": targets, # [★수정 3] 리스트 원본 저장 (필터링용)
-                        "start_age": start_age,
-                        "end_age": end_age,
-                        "title": title,
-                        "page_url": page_url,
-                        "pre_summary": pre_summary
-                    }
-
-                    records_to_insert.append({
-                        "id": chunk_id,
-                        "page_id": page_id,
-                        "content": full_text_for_summary, # DB에는 전체 내용 저장
-                        "metadata": metadata,
-                        "embedding": embedding # 벡터는 핵심 내용으로만 계산
-                    })
-
-                if records_to_insert:
-                    try:
-                        supabase.table("site_pages").upsert(records_to_insert).execute()
-                        total_processed += 1
-                    except Exception as e:
-                        print(f"❌ 저장 실패: {e}")
-
-        except Exception as e:
-            print(f"❌ 오류 ({category_name}): {e}")
+        # 커서가 없는 DB(첫 실행, --full/--force)는 전체 조회
+        since = None
+        if db_id in cursors:
+            since = (datetime.fromisoformat(cursors[db_id]) - CURSOR_SAFETY_MARGIN).isoformat()
+        db_tasks.append((category_name, db_id, since))
+    listed_all = all(since is None for _, _, since in db_tasks)
+
+    def fetch_stage(task):
+        category_name, db_id, since = task
+        print(f"[Indexer] '{category_name}' DB 조회 중..." + (f" ({since} 이후 수정분)" if since else ""))
+        for page in iter_pages(db_id, since):
+            yield (category_name, db_id, page)
+
+    def assemble_stage(item):
+        category_name, db_id, page = item
+        page_id = page.get("id")
+        last_edited = page.get("last_edited_time")
+        if not page_id: return []
+        with lock: seen_ids.add(page_id)
+
+        prev = prev_state.get(page_id)
+        if prev and prev.get("last_edited_time") == last_edited:
+            with lock: counts["skipped"] += 1
+            return []
+
+        doc = build_page_document(page, category_name)
+        state = {"last_edited_time": last_edited, "content_hash": doc["content_hash"], "category": category_name}
+        too_short = len(doc["full_text_for_summary"].strip()) < 10
+        if too_short or (prev and prev.get("content_hash") == doc["content_hash"]):
+            # 편집은 있었지만 색인에 쓰는 내용은 그대로(또는 색인할 내용이 없음) → Gemini 호출 없이 상태만 갱신
+            stored = stored_state.get(page_id)
+            if too_short:
+                # 행이 없는 페이지는 '건너뜀' 상태로만 남기고 매니페스트에서 뺍니다. (예전 행이 있었다면 정리)
+                state["skipped"] = "too_short"
+            elif stored:
+                # 활성 행은 그대로이므로 기존 행 버전을 유지합니다.
+                state["version"] = stored.get("version", "0")
+            with lock:
+                updated_state[page_id] = state
+                counts["skipped"] += 1
+            return []
+        doc.update(db_id=db_id, state=dict(state, version=build_version))
+        return [doc]
+
+    def embed_stage(docs):
+        for doc in embed_documents(docs):
+            if doc["embedding"]: yield doc
+            else: on_error("embed", doc, RuntimeError("임베딩 실패"))
+
+    def on_written(docs):
+        with lock:
+            for doc in docs:
+                updated_state[doc["page_id"]] = doc["state"]
+            first = counts["processed"] == 0
+            counts["processed"] += len(docs)
+        # 빌드가 비정상 종료되어도 남지 않도록 색인 락과 같은 TTL을 둡니다.
+        pipe = redis_client.pipeline()
+        pipe.incrby(INDEX_PENDING_ROWS_KEY, len(docs))
+        pipe.expire(INDEX_PENDING_ROWS_KEY, INDEXER_LOCK_TTL)
+        pipe.execute()
+        if first:
+            # [★확인용★]
+            print(f"🔍 [X-RAY] 가중치 적용된 검색 데이터 예시:\n{docs[0]['full_text_for_embedding'][:300]}...")
+
+    # 옛 버전 행은 활성 버전이 바뀐 뒤 GC가 지우므로, 쓰면서 같은 page_id 행을 정리하지 않습니다.
+    writer = BatchWriter(get_supabase(), "site_pages", batch_size=INDEXER_WRITE_BATCH,
+                         flush_interval=INDEXER_WRITE_FLUSH_INTERVAL, limiter=supabase_limiter, key_column=None,
+                         on_flush=on_written, on_error=lambda docs, exc: on_error("write", docs, exc))
+
+    def write_stage(doc):
+        writer.add(build_record(doc, build_version), doc)
+        return [doc]
+
+    def on_error(stage_name, item, exc):
+        nonlocal has_critical_error
+        if stage_name == "fetch":
+            category_name, db_id, _ = item
+            print(f"❌ 오류 ({category_name}): {exc}")
             traceback.print_exc()
-            has_critical_error = True
+            with lock:
+                has_critical_error = True
+                failed_dbs.add(db_id)
+        else:
+            # 배치 단계는 문서 목록이 통째로 넘어옵니다.
+            for entry in (item if isinstance(item, list) else [item]):
+                db_id = entry[1] if isinstance(entry, tuple) else entry["db_id"]
+                page_id = entry[2].get("id") if isinstance(entry, tuple) else entry["page_id"]
+                print(f"❌ [{stage_name}] 페이지 처리 실패 (ID: {page_id}): {exc}")
+                # 실패한 페이지가 있는 DB는 커서를 전진시키지 않습니다. (다음 실행에서 재시도)
+                with lock: failed_dbs.add(db_id)
+
+    pipeline = Pipeline(queue_size=INDEXER_QUEUE_SIZE, on_error=on_error)
+    pipeline.add_stage("fetch", fetch_stage, workers=len(db_tasks))
+    pipeline.add_stage("assemble", assemble_stage, workers=INDEXER_ASSEMBLE_WORKERS)
+    pipeline.add_stage("summarize", lambda doc: [summarize_document(doc)], workers=INDEXER_SUMMARIZE_WORKERS)
+    pipeline.add_stage("embed", embed_stage, workers=INDEXER_EMBED_WORKERS,
+                       batch_size=INDEXER_EMBED_BATCH, batch_wait=INDEXER_EMBED_BATCH_WAIT)
+    pipeline.add_stage("write", write_stage, workers=INDEXER_WRITE_WORKERS)
+    run_clock = time.perf_counter()
+    stage_stats = pipeline.run(db_tasks)
+    writer.close()
 
-    # 삭제 처리 로직
+    # 삭제 판단 (모든 페이지를 조회한 전체 실행에서만 가능)
+    deleted_ids = []
     if has_critical_error:
         print("\n[Indexer] ⚠️ 오류 발생으로 삭제 단계 건너뜀.")
+    elif listed_all:
+        deleted_ids = list(set(stored_state.keys()) - seen_ids)
+        if deleted_ids: print(f"\n[Indexer] 🗑️ 삭제된 페이지 {len(deleted_ids)}건은 새 버전에서 제외합니다.")
+
+    written_ids = [page_id for page_id, state in updated_state.items() if state.get("version") == build_version]
+    # 내용이 비어 색인에서 빠지는 페이지 (이전 실행까지는 행이 있었던 경우)
+    emptied_ids = [page_id for page_id, state in updated_state.items()
+                   if state.get("skipped") and page_id in stored_state and not stored_state[page_id].get("skipped")]
+    activated = True
+    manifest = None
+    if written_ids or deleted_ids or emptied_ids:
+        # 새 매니페스트 = 기존 구성 + 이번에 쓴 행 - 삭제된 페이지 - 행이 없는(건너뜀) 페이지
+        final_state = dict(stored_state)
+        final_state.update(updated_state)
+        for page_id in deleted_ids: final_state.pop(page_id, None)
+        manifest = {page_id: state.get("version", "0") for page_id, state in final_state.items() if not state.get("skipped")}
+
+        # [검증] 새 행이 모두 저장되었는지, 색인이 비정상적으로 줄지 않았는지 확인
+        new_row_ids = [index_row_id(page_id, build_version) for page_id in written_ids]
+        stored_rows = count_existing_rows(new_row_ids)
+        active_size = sum(1 for state in stored_state.values() if not state.get("skipped"))
+        min_size = int(active_size * (1 - INDEX_MAX_SHRINK))
+        if stored_rows != len(new_row_ids):
+            print(f"[Indexer] ❌ 검증 실패: 새 행 {len(new_row_ids)}건 중 {stored_rows}건만 저장됨. 버전을 교체하지 않습니다.")
+            activated = False
+        elif len(manifest) < min_size:
+            print(f"[Indexer] ❌ 검증 실패: 색인이 {active_size}건 → {len(manifest)}건으로 줄어듭니다. 버전을 교체하지 않습니다.")
+            activated = False
+
+        if activated:
+            activate_index_version(build_version, manifest)
+            # 새 버전에 포함되지 않게 된 옛 행 (바뀐 페이지의 이전 행 + 삭제되거나 내용이 빈 페이지의 행)
+            retire_rows([index_row_id(page_id, stored_state[page_id].get("version", "0"))
+                         for page_id in written_ids + deleted_ids + emptied_ids
+                         if page_id in stored_state and not stored_state[page_id].get("skipped")])
+            print(f"[Indexer] 🔖 활성 색인 버전 교체: v{build_version} ({len(manifest)}개 페이지)")
+        else:
+            # 활성화되지 못한 새 행은 바로 정리 대상입니다. 상태/커서를 남기지 않아 다음 실행에서 다시 시도합니다.
+            retire_rows(new_row_ids)
+
+    # 새 행은 이제 활성 버전이거나 정리 대기열에 있습니다.
+    redis_client.delete(INDEX_PENDING_ROWS_KEY)
+
+    # 모든 페이지를 조회한 실행에서는 매니페스트에 없는 행을 테이블 기준으로도 정리합니다.
+    if activated and listed_all and not has_critical_error:
+        active_manifest = manifest if manifest is not None else get_index_manifest()
+        if active_manifest is not None:
+            try:
+                orphaned = retire_orphan_rows(active_manifest)
+                if orphaned: print(f"[Indexer] 🧹 매니페스트에 없는 행 {orphaned}건을 정리 대기열에 올렸습니다.")
+            except Exception as e:
+                print(f"[Indexer] ⚠️ 남은 행 확인 실패 (다음 전체 실행에서 다시 시도): {e}")
+
+    if activated:
+        save_state(updated_state, removed=deleted_ids)
+        for _, db_id, _ in db_tasks:
+            if db_id not in failed_dbs:
+                save_cursor(db_id, run_started.isoformat())
+
+    collected = collect_retired_rows(writer)
+    print_stage_report(stage_stats, title="[Indexer]")
+    print(f"[Indexer] 💾 Supabase 일괄 쓰기: 배치 {writer.batches}회, {writer.records_written}건 저장, "
+          f"실패 배치 {writer.failed_batches}회, 옛 버전 행 정리 {collected}건")
+    elapsed = time.perf_counter() - run_clock
+    print(f"\n[Indexer] ✨ 완료. (업데이트: {counts['processed']}, 건너뜀: {counts['skipped']}, 삭제: {len(deleted_ids)}, "
+          f"{elapsed:.1f}초, 전체 {counts['processed'] / elapsed if elapsed else 0:.2f} pages/s)")
+
+    return {
+        "ok": activated and not has_critical_error and not failed_dbs,
+        "mode": mode,
+        "version": build_version if activated and (written_ids or deleted_ids or emptied_ids) else None,
+        "processed": counts["processed"],
+        "skipped": counts["skipped"],
+        "deleted": len(deleted_ids) if activated else 0,
+        "failed_dbs": len(failed_dbs),
+        "elapsed": round(elapsed, 2),
+        "run_started": run_started.isoformat(),
+    }
+
+# --- 데몬 모드 (cron 대체) ---
+# 주기적으로(또는 웹훅을 받으면 즉시) 증분 색인을 돌리고, 하루 한 번은 전체 조회로 삭제된 페이지를 정리합니다.
+INDEXER_POLL_INTERVAL = int(os.getenv("INDEXER_POLL_INTERVAL", "30"))
+INDEXER_FULL_INTERVAL = int(os.getenv("INDEXER_FULL_INTERVAL", str(24 * 3600)))
+INDEXER_PORT = int(os.getenv("INDEXER_PORT", "8090"))
+INDEXER_WEBHOOK_SECRET = os.getenv("INDEXER_WEBHOOK_SECRET")
+# 색인기가 둘 이상 떠 있어도(데몬 + 수동 실행) 동시에 돌지 않도록 하는 Redis 락
+INDEXER_LOCK_KEY = "indexer:lock"
+INDEXER_LOCK_TTL = int(os.getenv("INDEXER_LOCK_TTL", "1800"))
+
+def run_indexing_once(full: bool = False, force: bool = False) -> dict:
+    """락을 잡고 한 번 색인한 뒤, 결과를 상태(indexer:status)에 기록합니다."""
+    lock = redis_client.lock(INDEXER_LOCK_KEY, timeout=INDEXER_LOCK_TTL, blocking_timeout=0)
+    if not lock.acquire(blocking=False):
+        print("[Indexer] ⏳ 다른 색인 작업이 실행 중이라 이번 회차는 건너뜁니다.")
+        return {"ok": False, "error": "locked"}
+
+    update_indexer_status(state="running", last_run_at=time.time())
+    try:
+        result = run_indexing(full=full, force=force)
+    except Exception as e:
+        traceback.print_exc()
+        result = {"ok": False, "error": str(e)}
+    finally:
+        try: lock.release()
+        except Exception: pass
+
+    status = {"state": "idle", "last_result": result}
+    if result.get("ok"):
+        cursors = load_cursors()
+        status.update(last_success_at=time.time(), last_error=None,
+                      oldest_cursor=min(cursors.values()) if cursors else None)
+        if full or force or result.get("mode") == "전체": status["last_full_at"] = time.time()
     else:
-        deleted_ids = list(set(prev_state.keys()) - set(current_state.keys()))
-        if deleted_ids:
-            print(f"\n[Indexer] 🗑️ 삭제된 페이지 {len(deleted_ids)}건 정리 중...")
-            for del_id in deleted_ids:
-                try:
-                    supabase.table("site_pages").delete().eq("page_id", del_id).execute()
-                except: pass
-        
-        save_state(current_state)
-        print(f"\n[Indexer] ✨ 완료. (업데이트: {total_processed}, 건너뜀: {total_skipped})")
+        status["last_error"] = result.get("error") or "일부 페이지/DB 처리 실패"
+    update_indexer_status(**status)
+    return result
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """POST /webhook → 즉시 색인 요청, GET /status → 색인 지연/마지막 성공 시각"""
+    trigger = None
+
+    def _send_json(self, code: int, body: dict):
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.split("?")[0] in ("/status", "/health"):
+            return self._send_json(200, get_indexer_status())
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/webhook":
+            return self._send_json(404, {"error": "not found"})
+        # 비밀값이 없으면 누구나 색인을 돌려 Notion/Gemini 사용량을 쓸 수 있으므로 웹훅을 받지 않습니다.
+        if not INDEXER_WEBHOOK_SECRET:
+            return self._send_json(503, {"error": "webhook disabled (INDEXER_WEBHOOK_SECRET not set)"})
+        # 비밀값은 접근 로그/프록시에 남지 않도록 헤더로만 받고, 타이밍 공격을 막기 위해 상수 시간으로 비교합니다.
+        if not hmac.compare_digest(
+                self.headers.get("X-Webhook-Secret", "").encode(), INDEXER_WEBHOOK_SECRET.encode()):
+            return self._send_json(401, {"error": "unauthorized"})
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        # Notion 웹훅 구독 시 최초 1회 오는 검증 토큰은 로그로 남겨 콘솔에 입력할 수 있게 합니다.
+        if isinstance(body, dict) and body.get("verification_token"):
+            print(f"[Indexer] 🔑 Notion 웹훅 검증 토큰: {body['verification_token']}")
+        print(f"[Indexer] 📨 웹훅 수신 ({body.get('type', 'unknown') if isinstance(body, dict) else 'unknown'}) → 즉시 색인")
+        self.trigger.set()
+        self._send_json(202, {"status": "queued"})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_webhook_server(trigger: threading.Event) -> ThreadingHTTPServer:
+    _WebhookHandler.trigger = trigger
+    server = ThreadingHTTPServer(("0.0.0.0", INDEXER_PORT), _WebhookHandler)
+    threading.Thread(target=server.serve_forever, name="indexer-webhook", daemon=True).start()
+    print(f"[Indexer] 🌐 웹훅/상태 서버 시작 (:{INDEXER_PORT}  POST /webhook, GET /status)")
+    if not INDEXER_WEBHOOK_SECRET:
+        print("[Indexer] ⚠️ INDEXER_WEBHOOK_SECRET이 없어 POST /webhook을 받지 않습니다. (폴링만 사용)")
+    return server
+
+def run_daemon(stop_event: threading.Event):
+    trigger = threading.Event()
+    server = start_webhook_server(trigger)
+    print(f"[Indexer] 🔁 데몬 모드 시작 (폴링 {INDEXER_POLL_INTERVAL}초, 전체 조회 {INDEXER_FULL_INTERVAL}초마다)")
+    try:
+        while not stop_event.is_set():
+            trigger.clear()
+            last_full_at = get_indexer_status().get("last_full_at") or 0
+            run_indexing_once(full=time.time() - last_full_at >= INDEXER_FULL_INTERVAL)
+            # 다음 폴링 시각까지 기다리되, 웹훅이나 종료 신호가 오면 바로 깹니다.
+            deadline = time.time() + INDEXER_POLL_INTERVAL
+            while not stop_event.is_set() and not trigger.is_set() and time.time() < deadline:
+                trigger.wait(min(1.0, max(0.0, deadline - time.time())))
+    finally:
+        server.shutdown()
+        update_indexer_status(state="stopped")
+        print("[Indexer] 👋 데몬 종료")
+
+def _install_signal_handlers(stop_event):
+    def _handle_signal(signum, _frame):
+        print(f"[Indexer] 🛑 종료 신호 수신 ({signal.Signals(signum).name}) - 진행 중인 회차가 끝나면 종료합니다.")
+        stop_event.set()
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
 
 if __name__ == "__main__":
-    run_indexing()
\ No newline at end of file
+    wait_for_redis()
+    parser = argparse.ArgumentParser(description="Notion → Supabase 색인")
+    parser.add_argument("--full", action="store_true", help="모든 페이지를 조회하고 삭제된 페이지까지 정리")
+    parser.add_argument("--force", action="store_true", help="저장된 상태를 무시하고 모두 다시 요약/임베딩")
+    parser.add_argument("--daemon", action="store_true", help="상주하며 주기적/웹훅으로 증분 색인 (cron 대체)")
+    args = parser.parse_args(sys.argv[1:])
+    if args.daemon:
+        stop = threading.Event()
+        _install_signal_handlers(stop)
+        run_daemon(stop)
+    else:
+        result = run_indexing_once(full=args.full, force=args.force)
+        sys.exit(0 if result.get("ok") else 1)
@@ -0,0 +1,134 @@
+# intent_rules.py (규칙 기반 의도 사전 분류)
+"""
+/chat 요청을 Gemini 없이 바로 분류할 수 있는 흔한 경우를 규칙으로 처리합니다.
+
+- 비속어 / 종료 / 초기화 / 인사·감사 / '더 보기' → 즉시 정해진 답변
+- 질문 확장 사전(QUERY_EXPANSION_MAP)의 트리거나 복지 서비스 키워드가 있으면 → 명백한 검색 (바로 작업 등록)
+- 그 밖의 애매한 입력만 None을 반환하고, 워커가 작업을 처리할 때 Gemini로 의도를 분석합니다.
+"""
+import re
+from typing import Optional
+
+from utils import DATABASE_IDS
+
+# --- 질문 확장 사전 (워커의 룰 키워드 주입에도 사용) ---
+QUERY_EXPANSION_MAP = {
+    "장애검사": "영유아 발달 정밀 검사비 지원 장애인 등록 진단서 발급비",
+    "발달검사": "영유아 발달 정밀 검사비 지원",
+    "치료지원": "발달재활서비스 바우처 짝치료 그룹치료",
+    "짝치료": "또래 그룹치료 두리활동 사회성 향상 프로그램 그룹 활동",
+    "그룹치료": "또래 두리활동 사회성 향상 프로그램 짝치료",
+    "언어치료": "발달재활서비스 바우처",
+    "부모교육": "양육 코칭 상담",
+}
+
+# 의도 분석 프롬프트의 분류별 키워드 (이 중 하나라도 있으면 검색 질문으로 봅니다)
+SERVICE_KEYWORDS = [
+    "병원", "치료", "검사", "진단", "재활", "어린이집", "유치원", "보육", "교육", "상담",
+    "돌봄", "양육", "활동지원", "바우처", "지원금", "수당", "셔틀", "기저귀", "통장", "복지관", "센터",
+]
+
+# 어절 첫머리에서만 찾습니다. ('씹지 않아요', '시발점'처럼 보통 낱말 안에 든 글자는 막지 않도록 한 음절 항목은 두지 않음)
+PROFANITY = ["시발(?!점|역)", "씨발", "ㅅㅂ", "ㅆㅂ", "병신", "ㅂㅅ", "개새", "존나", "좆같", "좆나", "씹새", "씹할", "씹년",
+             "미친놈", "미친년", "닥쳐", "꺼져"]
+PROFANITY_PATTERN = re.compile(r'^(?:' + '|'.join(PROFANITY) + r')')
+EXIT_PHRASES = {"그만", "그만할게", "그만할래", "종료", "끝", "끝내기", "나갈게", "됐어", "bye", "exit", "quit",
+                "안녕히계세요", "잘있어"}
+RESET_PHRASES = {"처음으로", "초기화", "리셋", "reset", "다시시작", "새로시작", "처음부터", "대화초기화"}
+SMALL_TALK_PHRASES = {"안녕", "안녕하세요", "하이", "hi", "hello", "ㅎㅇ", "반가워", "반가워요", "반갑습니다",
+                      "고마워", "고마워요", "고맙습니다", "감사", "감사해요", "감사합니다", "땡큐", "thanks", "thankyou"}
+SHOW_MORE_KEYWORDS = ["더", "다음", "계속", "more", "next"]
+
+# 분류별 키워드 (의도 분석 프롬프트의 category 규칙과 같은 목록, 키는 DATABASE_IDS의 분류명)
+CATEGORY_KEYWORDS = {
+    "의료재활": ["병원", "치료", "검사", "진단", "재활"],
+    "교육보육": ["어린이집", "유치원", "교육", "보육", "학습"],
+    "가족지원": ["상담", "부모", "가족"],
+    "돌봄양육": ["돌봄", "양육", "활동지원", "아이돌봄"],
+    "생활지원": ["바우처", "지원금", "수당", "셔틀", "교통", "차량", "기저귀", "통장"],
+}
+# 대상 특성 (의도 분석 프롬프트의 sub_category 규칙, 색인 메타데이터 sub_category_list 값에 포함된 단어)
+TARGET_TRAITS = ["장애", "발달지연", "다문화", "한부모", "저소득", "다자녀"]
+KOREAN_COUNTS = {"한": 1, "두": 2, "세": 3, "네": 4, "다섯": 5, "여섯": 6, "일곱": 7}
+
+def _compact(text: str) -> str:
+    """공백/문장부호와 끝에 붙은 ㅋㅋ, ㅎㅎ, ~ 등을 없앤 소문자 문자열"""
+    return re.sub(r'[ㅋㅎㅠㅜ]+$', '', re.sub(r'[^\w]', '', text.lower()))
+
+def classify_intent_locally(question: str, has_results: bool = False) -> Optional[dict]:
+    """
+    규칙으로 확실히 분류되면 extract_info_from_question과 같은 모양의 dict를,
+    애매하면 None(→ 워커에서 Gemini로 분석)을 반환합니다. 명백한 검색은 intent가 None인 dict입니다.
+    """
+    normalized = question.strip().lower()
+    compact = _compact(normalized)
+    if not compact: return None
+    info = {"intent": None, "category": None, "sub_category": None, "age": None, "keywords": None, "source": "rule"}
+
+    if any(PROFANITY_PATTERN.match(token) for token in re.findall(r'\w+', normalized)): return dict(info, intent="safety_block")
+    if compact in EXIT_PHRASES: return dict(info, intent="exit")
+    if compact in RESET_PHRASES: return dict(info, intent="reset")
+    if compact in SMALL_TALK_PHRASES: return dict(info, intent="small_talk")
+    if has_results and any(k in normalized for k in SHOW_MORE_KEYWORDS): return dict(info, intent="show_more")
+
+    triggers = [t for t in QUERY_EXPANSION_MAP if t in compact]
+    if triggers or any(k in compact for k in SERVICE_KEYWORDS):
+        return dict(info, keywords=triggers or None)
+    return None
+
+def build_intent_response(intent: Optional[str], extracted_info: dict, question: str = "") -> Optional[dict]:
+    """검색이 필요 없는 의도의 정해진 답변. (검색/더 보기 의도면 None)"""
+    if intent == "safety_block":
+        return {"status": "complete", "answer": "비속어는 삼가주세요. 😥 복지 정보에 대해 질문해 주세요.", "last_result_ids": [], "total_found": 0}
+
+    if intent == "exit":
+        return {"status": "complete", "answer": "네, 알겠습니다. 언제든 다시 찾아주세요! 😊", "last_result_ids": [], "total_found": 0}
+
+    if intent == "reset":
+        return {"status": "complete", "answer": "대화를 초기화했습니다. 무엇이 궁금하신가요? 🤖", "last_result_ids": [], "total_found": 0}
+
+    if intent == "out_of_scope":
+        return {"status": "complete", "answer": "저는 도봉구 영유아 복지 정보만 알려드릴 수 있어요. 😅", "last_result_ids": [], "total_found": 0}
+
+    if intent == "small_talk":
+        normalized_input = question.strip().lower()
+        answer = "안녕하세요! 도봉구 영유아 복지 챗봇입니다. 무엇을 도와드릴까요?"
+        if "고마" in normalized_input or "감사" in normalized_input:
+            answer = "도움이 되어 기쁩니다! 😊 언제든 또 물어봐 주세요."
+        return {"status": "complete", "answer": answer, "last_result_ids": [], "total_found": 0}
+
+    if intent == "clarify_category":
+        age_info = extracted_info.get("age")
+        age_text = f"{age_info}개월 아기" if age_info else "자녀"
+        return {
+            "status": "clarify",
+            "answer": f"{age_text}를 위한 어떤 정보가 궁금하신가요?",
+            "options": list(DATABASE_IDS.keys()),
+            "last_result_ids": [],
+            "total_found": 0
+        }
+    return None
+
+def normalize_category(category: Optional[str]) -> str:
+    """'의료/재활', '가족 지원' 같은 표기를 DATABASE_IDS의 분류명('의료재활', '가족지원')으로 맞춥니다."""
+    return re.sub(r'[^\w]', '', category or "")
+
+def guess_categories(question: str) -> set:
+    """질문의 키워드로 짐작되는 분류명 집합 (없으면 빈 집합)"""
+    compact = _compact(question)
+    return {category for category, words in CATEGORY_KEYWORDS.items() if any(w in compact for w in words)}
+
+def guess_targets(question: str) -> set:
+    """질문에 나온 대상 특성 집합 (예: '장애 아동 언어치료' → {'장애'})"""
+    compact = _compact(question)
+    return {trait for trait in TARGET_TRAITS if trait in compact}
+
+def parse_age_months(question: str) -> Optional[int]:
+    """질문의 월령(개월). '18개월' → 18, '3살'/'3세' → 36, '두 돌' → 24. 없으면 None"""
+    match = re.search(r'(\d+)\s*개월', question)
+    if match: return int(match.group(1))
+    match = re.search(r'(\d+)\s*(?:살|세|돌)', question)
+    if match: return int(match.group(1)) * 12
+    match = re.search(r'(' + '|'.join(KOREAN_COUNTS) + r')\s*(?:살|돌)', question)
+    if match: return KOREAN_COUNTS[match.group(1)] * 12
+    return None
@@ -0,0 +1,370 @@
+# job_queue.py (Redis 신뢰성 작업 큐)
+"""
+BLMOVE 기반 신뢰성 큐입니다.
+
+- 워커는 작업을 꺼낼 때 큐에서 자신의 처리 중 리스트(chatbot:job_processing:{워커ID})로 옮깁니다.
+- 처리 중인 작업은 주기적으로 하트비트를 남기고, 완료(ack) 시 처리 중 리스트에서 지웁니다.
+- 리퍼(reaper)는 하트비트가 끊긴 작업을 큐로 되돌리고,
+  JOB_MAX_ATTEMPTS번 실패한 작업은 데드레터 리스트로 보내며 클라이언트에게 오류 결과를 남깁니다.
+
+따라서 워커가 죽거나 Gemini 호출이 멈춰도 작업이 사라지지 않고,
+여러 워커 레플리카를 안전하게 띄울 수 있습니다.
+"""
+import os
+import sys
+import json
+import time
+import socket
+
+from utils import redis_client, get_async_redis
+
+# --- 1. Redis 키 / 설정 ---
+JOB_QUEUE_KEY = "chatbot:job_queue"
+# 작업 결과는 작업별 키(chatbot:job_result:{job_id})에 TTL과 함께 저장합니다.
+JOB_RESULT_PREFIX = "chatbot:job_result:"
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# [레거시] 예전에는 모든 결과를 하나의 해시에 TTL 없이 쌓았습니다. (migrate_legacy_results로 이전)
+JOB_RESULTS_KEY = "chatbot:job_results"
+JOB_PROCESSING_PREFIX = "chatbot:job_processing:"
+JOB_HEARTBEATS_KEY = "chatbot:job_heartbeats"
+JOB_ATTEMPTS_KEY = "chatbot:job_attempts"
+JOB_DEAD_LETTER_KEY = "chatbot:job_dead_letter"
+# 작업별 이벤트 채널 (결과가 저장되는 즉시 API가 구독자에게 전달)
+JOB_EVENTS_PREFIX = "chatbot:job_events:"
+
+# 하트비트가 이 시간(초) 이상 끊기면 리퍼가 작업을 큐로 되돌립니다.
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "90"))
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+# 이 시간(초)을 넘긴 작업은 멈춘 것으로 보고 하트비트를 더 보내지 않습니다. (→ 리퍼가 회수)
+JOB_MAX_PROCESSING_SECONDS = int(os.getenv("JOB_MAX_PROCESSING_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_REAPER_INTERVAL = int(os.getenv("JOB_REAPER_INTERVAL", "15"))
+
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+FAILED_ANSWER = "요청을 처리하지 못했습니다. 잠시 후 다시 질문해 주세요. 😥"
+
+# 처리 중 리스트에서 작업을 빼고 재시도/데드레터를 정하는 과정을 한 번에 실행합니다. (중간에 죽어도 작업이 사라지지 않게)
+# KEYS: 처리 중 리스트, 작업 큐, 시도 횟수 해시, 하트비트 해시, 데드레터 리스트
+# ARGV: job_json, job_id(없으면 ""), 최대 시도 횟수, 사유, 현재 시각
+# 반환: {0, 0} 이미 다른 리퍼/워커가 가져감, {1, 시도 횟수} 큐로 되돌림, {2, 시도 횟수} 데드레터 이동
+RELEASE_JOB_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then return {0, 0} end
+local attempts = tonumber(ARGV[3])
+if ARGV[2] ~= '' then attempts = tonumber(redis.call('HGET', KEYS[3], ARGV[2]) or '0') end
+if ARGV[2] ~= '' then redis.call('HDEL', KEYS[4], ARGV[2]) end
+if attempts >= tonumber(ARGV[3]) then
+    local dead = cjson.encode({job = ARGV[1], reason = ARGV[4], attempts = attempts, failed_at = tonumber(ARGV[5])})
+    redis.call('RPUSH', KEYS[5], dead)
+    if ARGV[2] ~= '' then redis.call('HDEL', KEYS[3], ARGV[2]) end
+    return {2, attempts}
+end
+-- 이미 오래 기다린 작업이므로 큐의 맨 앞으로 되돌립니다.
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return {1, attempts}
+"""
+# 처리 중 리스트에서 지운 경우에만 추적 해시를 지웁니다. (리퍼가 이미 큐로 되돌린 작업의 시도 횟수를 지우지 않도록)
+# KEYS: 처리 중 리스트, 하트비트 해시, 시도 횟수 해시 / ARGV: job_json, job_id(없으면 "")
+ACK_JOB_SCRIPT = """
+local removed = redis.call('LREM', KEYS[1], 1, ARGV[1])
+if removed > 0 and ARGV[2] ~= '' then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+    redis.call('HDEL', KEYS[3], ARGV[2])
+end
+return removed
+"""
+_release_job_script = redis_client.register_script(RELEASE_JOB_SCRIPT)
+_ack_job_script = redis_client.register_script(ACK_JOB_SCRIPT)
+
+def processing_key(worker_id: str = WORKER_ID) -> str:
+    return f"{JOB_PROCESSING_PREFIX}{worker_id}"
+
+def _job_id_of(job_json: bytes):
+    try:
+        return json.loads(job_json.decode('utf-8')).get("job_id")
+    except Exception:
+        return None
+
+# --- 2. 생산자 (API) ---
+
+def enqueue_job(job_data: dict):
+    redis_client.rpush(JOB_QUEUE_KEY, json.dumps(job_data, ensure_ascii=False).encode('utf-8'))
+
+async def enqueue_job_async(job_data: dict):
+    await get_async_redis().rpush(JOB_QUEUE_KEY, json.dumps(job_data, ensure_ascii=False).encode('utf-8'))
+
+# --- 3. 소비자 (Worker) ---
+
+def claim_job(timeout: float = 1, worker_id: str = WORKER_ID):
+    """
+    큐에서 작업 1건을 꺼내 처리 중 리스트로 옮깁니다. (원자적 BLMOVE)
+    작업이 없으면 None, 있으면 원본 job_json(bytes)을 반환합니다.
+    """
+    job_json = redis_client.blmove(JOB_QUEUE_KEY, processing_key(worker_id), timeout, "LEFT", "RIGHT")
+    if not job_json: return None
+
+    job_id = _job_id_of(job_json)
+    if job_id:
+        pipe = redis_client.pipeline()
+        pipe.hset(JOB_HEARTBEATS_KEY, job_id, time.time())
+        pipe.hincrby(JOB_ATTEMPTS_KEY, job_id, 1)
+        pipe.execute()
+    return job_json
+
+def heartbeat(job_ids):
+    if not job_ids: return
+    now = time.time()
+    redis_client.hset(JOB_HEARTBEATS_KEY, mapping={job_id: now for job_id in job_ids})
+
+def result_key(job_id: str) -> str:
+    return f"{JOB_RESULT_PREFIX}{job_id}"
+
+def save_job_result(job_id: str, result: dict):
+    """결과를 JOB_RESULT_TTL초 동안 저장하고, 같은 내용을 작업 이벤트 채널로 발행합니다."""
+    payload = json.dumps(result).encode('utf-8')
+    pipe = redis_client.pipeline()
+    pipe.set(result_key(job_id), payload, ex=JOB_RESULT_TTL)
+    pipe.publish(job_events_channel(job_id), payload)
+    pipe.execute()
+
+def ack_job(job_json: bytes, worker_id: str = WORKER_ID) -> bool:
+    """
+    처리가 끝난 작업을 처리 중 리스트와 추적 해시에서 지웁니다.
+    리퍼가 이미 회수한 작업이면(처리 중 리스트에 없음) 아무것도 지우지 않고 False를 반환합니다.
+    """
+    removed = _ack_job_script(keys=[processing_key(worker_id), JOB_HEARTBEATS_KEY, JOB_ATTEMPTS_KEY],
+                              args=[job_json, _job_id_of(job_json) or ""])
+    return bool(removed)
+
+def _release_job(source_key: str, job_json: bytes, reason: str) -> bool:
+    """
+    처리 중 리스트에서 작업을 빼내 큐로 되돌리거나(재시도) 데드레터로 보냅니다. (RELEASE_JOB_SCRIPT로 원자적 실행)
+    job_id가 없는 잘못된 작업은 바로 데드레터로 보냅니다.
+    다른 리퍼/워커가 먼저 가져간 경우(LREM 결과 0) False를 반환합니다.
+    """
+    job_id = _job_id_of(job_json)
+    outcome, attempts = _release_job_script(
+        keys=[source_key, JOB_QUEUE_KEY, JOB_ATTEMPTS_KEY, JOB_HEARTBEATS_KEY, JOB_DEAD_LETTER_KEY],
+        args=[job_json, job_id or "", JOB_MAX_ATTEMPTS, reason, time.time()])
+    if outcome == 0: return False
+
+    if outcome == 2:
+        # 클라이언트가 /get_result 를 무한히 폴링하지 않도록 오류 결과를 남깁니다.
+        if job_id:
+            save_job_result(job_id, {"status": "error", "answer": FAILED_ANSWER, "last_result_ids": [], "total_found": 0})
+        print(f"☠️ [Queue] 데드레터 이동 (Job ID: {job_id}, 시도 {attempts}회, 사유: {reason})")
+    else:
+        print(f"♻️ [Queue] 작업 재시도 등록 (Job ID: {job_id}, 시도 {attempts}회, 사유: {reason})")
+    return True
+
+def fail_job(job_json: bytes, reason: str, worker_id: str = WORKER_ID):
+    """처리 중 예외가 난 작업을 재시도하거나 데드레터로 보냅니다."""
+    _release_job(processing_key(worker_id), job_json, reason)
+
+# --- 4. 결과 푸시 (Pub/Sub) ---
+# clarify: 워커의 의도 분석 결과 분류를 되묻는 최종 응답
+TERMINAL_STATUSES = ("complete", "error", "clarify")
+
+def job_events_channel(job_id: str) -> str:
+    return f"{JOB_EVENTS_PREFIX}{job_id}"
+
+def publish_job_event(job_id: str, event: dict):
+    redis_client.publish(job_events_channel(job_id), json.dumps(event).encode('utf-8'))
+
+def _decode_result(result_bytes):
+    return json.loads(result_bytes.decode('utf-8')) if result_bytes else None
+
+def get_job_result(job_id: str):
+    result_bytes = redis_client.get(result_key(job_id))
+    if result_bytes is None:
+        # 이전 전(레거시 해시)에 저장된 결과
+        result_bytes = redis_client.hget(JOB_RESULTS_KEY, job_id)
+    return _decode_result(result_bytes)
+
+def iter_job_events(job_id: str, timeout: float, idle_interval: float = 15):
+    """
+    작업 이벤트를 도착하는 대로 내보냅니다. 최종 결과(complete/error)를 내보내면 끝납니다.
+    idle_interval 동안 이벤트가 없으면 None을 내보냅니다. (SSE keep-alive용)
+
+    구독을 먼저 시작한 뒤 저장된 결과를 확인하므로, 그 사이에 완료된 작업도 놓치지 않습니다.
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(job_events_channel(job_id))
+        stored = get_job_result(job_id)
+        if stored:
+            yield stored
+            return
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return
+            message = pubsub.get_message(timeout=min(idle_interval, remaining))
+            if not message:
+                yield None
+                continue
+            event = json.loads(message["data"].decode('utf-8'))
+            yield event
+            if event.get("status") in TERMINAL_STATUSES: return
+    finally:
+        pubsub.close()
+
+def wait_for_job_result(job_id: str, timeout: float):
+    """최종 결과가 나올 때까지 최대 timeout초 기다립니다. (롱폴링용, 시간 초과 시 None)"""
+    for event in iter_job_events(job_id, timeout, idle_interval=timeout):
+        if event and event.get("status") in TERMINAL_STATUSES:
+            return event
+    return None
+
+# [비동기] API 요청 경로용. 결과를 기다리는 동안 스레드를 잡지 않습니다.
+
+async def get_job_result_async(job_id: str):
+    redis_async = get_async_redis()
+    result_bytes = await redis_async.get(result_key(job_id))
+    if result_bytes is None:
+        result_bytes = await redis_async.hget(JOB_RESULTS_KEY, job_id)
+    return _decode_result(result_bytes)
+
+async def aiter_job_events(job_id: str, timeout: float, idle_interval: float = 15):
+    """iter_job_events의 비동기 버전 (async for로 사용)"""
+    pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(job_events_channel(job_id))
+        stored = await get_job_result_async(job_id)
+        if stored:
+            yield stored
+            return
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return
+            message = await pubsub.get_message(timeout=min(idle_interval, remaining))
+            if not message:
+                yield None
+                continue
+            event = json.loads(message["data"].decode('utf-8'))
+            yield event
+            if event.get("status") in TERMINAL_STATUSES: return
+    finally:
+        await pubsub.aclose()
+
+async def wait_for_job_result_async(job_id: str, timeout: float):
+    async for event in aiter_job_events(job_id, timeout, idle_interval=timeout):
+        if event and event.get("status") in TERMINAL_STATUSES:
+            return event
+    return None
+
+# --- 5. 결과 보존 관리 (TTL / 이전 / 통계) ---
+
+def migrate_legacy_results(batch_size: int = 500) -> int:
+    """
+    레거시 해시(JOB_RESULTS_KEY)에 쌓인 결과를 TTL이 있는 작업별 키로 옮기고 해시에서 지웁니다.
+    이미 작업별 키가 있으면 덮어쓰지 않습니다. 옮긴 건수를 반환합니다.
+    """
+    migrated, batch = 0, {}
+
+    def _flush():
+        nonlocal migrated
+        pipe = redis_client.pipeline()
+        for job_id, payload in batch.items():
+            pipe.set(result_key(job_id.decode('utf-8')), payload, ex=JOB_RESULT_TTL, nx=True)
+        pipe.hdel(JOB_RESULTS_KEY, *batch.keys())
+        pipe.execute()
+        migrated += len(batch)
+        batch.clear()
+
+    # HSCAN 도중 필드를 지워도 남아 있는 필드는 모두 한 번 이상 반환됩니다.
+    for job_id, payload in redis_client.hscan_iter(JOB_RESULTS_KEY, count=batch_size):
+        batch[job_id] = payload
+        if len(batch) >= batch_size: _flush()
+    if batch: _flush()
+    return migrated
+
+def get_result_stats(batch_size: int = 500) -> dict:
+    """현재 Redis에 보존 중인 작업 결과의 건수와 바이트 수를 집계합니다."""
+    count, total_bytes, keys = 0, 0, []
+
+    def _flush():
+        nonlocal count, total_bytes
+        pipe = redis_client.pipeline()
+        for key in keys: pipe.strlen(key)
+        sizes = pipe.execute()
+        count += sum(1 for size in sizes if size)
+        total_bytes += sum(sizes)
+        keys.clear()
+
+    for key in redis_client.scan_iter(match=f"{JOB_RESULT_PREFIX}*", count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size: _flush()
+    if keys: _flush()
+
+    return {
+        "results": count,
+        "bytes": total_bytes,
+        "ttl_seconds": JOB_RESULT_TTL,
+        "legacy_results": redis_client.hlen(JOB_RESULTS_KEY),
+    }
+
+async def get_queue_stats_async() -> dict:
+    """대기 중인 작업 수와 (하트비트 기준) 모든 워커에서 처리 중인 작업 수 (/metrics용)"""
+    pipe = get_async_redis().pipeline(transaction=False)
+    pipe.llen(JOB_QUEUE_KEY)
+    pipe.hlen(JOB_HEARTBEATS_KEY)
+    depth, in_flight = await pipe.execute()
+    return {"queue_depth": depth, "in_flight": in_flight}
+
+# --- 6. 리퍼 (멈춘 작업 회수) ---
+
+def reap_stale_jobs() -> int:
+    """모든 워커의 처리 중 리스트를 훑어 하트비트가 끊긴 작업을 회수합니다."""
+    now = time.time()
+    reaped = 0
+    for key in redis_client.scan_iter(match=f"{JOB_PROCESSING_PREFIX}*"):
+        for job_json in redis_client.lrange(key, 0, -1):
+            job_id = _job_id_of(job_json)
+            if not job_id:
+                reaped += _release_job(key, job_json, "잘못된 작업 데이터")
+                continue
+
+            last_beat = redis_client.hget(JOB_HEARTBEATS_KEY, job_id)
+            if last_beat is None:
+                # BLMOVE 직후 하트비트 기록 전일 수 있으므로, 처음 본 시점부터 시간을 잽니다.
+                redis_client.hsetnx(JOB_HEARTBEATS_KEY, job_id, now)
+                continue
+
+            if now - float(last_beat) > JOB_VISIBILITY_TIMEOUT:
+                reaped += _release_job(key, job_json, f"하트비트 {JOB_VISIBILITY_TIMEOUT}초 초과")
+    return reaped
+
+def run_reaper(stop_event):
+    """stop_event가 설정될 때까지 주기적으로 reap_stale_jobs를 실행합니다. (스레드용)"""
+    while not stop_event.wait(JOB_REAPER_INTERVAL):
+        try:
+            reaped = reap_stale_jobs()
+            if reaped: print(f"🧹 [Reaper] 멈춘 작업 {reaped}건 회수")
+        except Exception as e:
+            print(f"⚠️ [Reaper] 오류: {e}")
+
+def run_heartbeats(inflight: dict, lock, stop_event):
+    """
+    inflight(job_id -> 시작 시각)에 있는 작업들의 하트비트를 주기적으로 갱신합니다. (스레드용)
+    JOB_MAX_PROCESSING_SECONDS를 넘긴 작업은 멈춘 것으로 보고 하트비트를 끊습니다.
+    """
+    while not stop_event.wait(JOB_HEARTBEAT_INTERVAL):
+        now = time.time()
+        with lock:
+            alive = [job_id for job_id, started in inflight.items() if now - started < JOB_MAX_PROCESSING_SECONDS]
+        try:
+            heartbeat(alive)
+        except Exception as e:
+            print(f"⚠️ [Heartbeat] 오류: {e}")
+
+if __name__ == "__main__":
+    # python job_queue.py migrate  : 레거시 결과 해시를 작업별 TTL 키로 이전
+    # python job_queue.py stats    : 보존 중인 결과 건수/바이트 출력
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "migrate":
+        print(f"📦 레거시 결과 {migrate_legacy_results()}건 이전 완료 (TTL {JOB_RESULT_TTL}초)")
+    print(f"📊 결과 보존 현황: {get_result_stats()}")
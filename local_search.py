@@ -0,0 +1,128 @@
+# local_search.py (인메모리 하이브리드 검색 엔진)
+"""
+Supabase `match_documents` RPC를 대신하는 프로세스 내 검색 엔진입니다. (LOCAL_SEARCH_ENABLED=1)
+
+- 시작 시(그리고 색인 버전이 바뀔 때마다) site_pages 전체를 불러와
+  임베딩은 연속된 float32 행렬(LocalVectorIndex)로, 제목/본문은 한국어 BM25 색인(bm25.py)으로 만듭니다.
+- 검색은 벡터 유사도 순위와 BM25 순위를 RRF(Reciprocal Rank Fusion)로 합치고, RPC와 같은
+  match_count 의미(상위 N개, similarity 필드 포함)로 결과를 돌려줍니다.
+- 연령/분류/대상 조건(search_filters.py)이 주어지면 스냅샷의 메타데이터 색인으로 허용 문서를 먼저 정하고,
+  그 밖의 문서는 두 순위 목록에 넣지 않습니다.
+
+전체 코퍼스가 수백 페이지 규모이므로 메모리는 수 MB 수준이고, 검색은 네트워크 왕복 없이 끝납니다.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+
+from utils import get_supabase, get_index_version, filter_active_rows, _parse_embedding
+from vector_index import LocalVectorIndex
+from bm25 import BM25Index, rank_matches, rrf_fuse
+from search_filters import MetadataIndex
+
+LOCAL_SEARCH_ENABLED = os.getenv("LOCAL_SEARCH_ENABLED", "0") == "1"
+# RRF 상수 k (클수록 하위 순위의 영향이 커짐)와 융합에 쓸 각 순위 목록의 길이
+LOCAL_SEARCH_RRF_K = int(os.getenv("LOCAL_SEARCH_RRF_K", "60"))
+LOCAL_SEARCH_CANDIDATES = int(os.getenv("LOCAL_SEARCH_CANDIDATES", "200"))
+# 색인 버전 확인 주기 (초)
+LOCAL_SEARCH_VERSION_CHECK = int(os.getenv("LOCAL_SEARCH_VERSION_CHECK", "10"))
+PAGE_SIZE = 1000
+
+class _Snapshot:
+    """한 색인 버전의 검색 데이터. 만든 뒤에는 바꾸지 않고 통째로 교체합니다."""
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = []
+        vectors = []
+        for row in rows:
+            embedding = _parse_embedding(row.get("embedding"))
+            if not embedding: continue
+            self.rows.append({k: v for k, v in row.items() if k != "embedding"})
+            vectors.append(embedding)
+
+        self.vectors = LocalVectorIndex()
+        self.vectors.replace(vectors, list(range(len(self.rows))))
+
+        # 제목은 두 번 넣어 본문보다 가중치를 줍니다.
+        self.bm25 = BM25Index([
+            f"{row.get('metadata', {}).get('title', '')} " * 2 + (row.get("content") or "")
+            for row in self.rows
+        ])
+        self.metadata = MetadataIndex([row.get("metadata") or {} for row in self.rows])
+
+class LocalSearchEngine:
+    def __init__(self):
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def load(self, version: str = None) -> int:
+        """site_pages 전체를 읽어 새 스냅샷으로 교체합니다. 불러온 문서 수를 반환합니다."""
+        supabase = get_supabase()
+        if not supabase: raise RuntimeError("Supabase 설정이 없습니다.")
+        version = version or get_index_version()
+        started = time.perf_counter()
+
+        rows, start = [], 0
+        while True:
+            response = supabase.table("site_pages").select("id, page_id, content, metadata, embedding") \
+                .range(start, start + PAGE_SIZE - 1).execute()
+            batch = response.data or []
+            rows.extend(batch)
+            if len(batch) < PAGE_SIZE: break
+            start += PAGE_SIZE
+
+        snapshot = _Snapshot(version, filter_active_rows(rows, version))
+        self._snapshot = snapshot
+        print(f"📚 [Local Search] 색인 v{version} 로드 완료 ({len(snapshot.rows)}건, {time.perf_counter() - started:.2f}초)")
+        return len(snapshot.rows)
+
+    def ensure_fresh(self):
+        """처음 호출 시 로드하고, 이후에는 주기적으로 색인 버전을 확인해 바뀌었으면 다시 로드합니다."""
+        now = time.time()
+        if self._snapshot and now - self._checked_at < LOCAL_SEARCH_VERSION_CHECK: return
+        with self._load_lock:
+            if self._snapshot and now - self._checked_at < LOCAL_SEARCH_VERSION_CHECK: return
+            version = get_index_version()
+            if not self._snapshot or self._snapshot.version != version:
+                self.load(version)
+            self._checked_at = now
+
+    def search(self, query_embedding, keywords, match_count=50, filters=None) -> list:
+        """
+        match_documents RPC와 같은 형태(similarity 포함 행 목록)로 상위 match_count개를 반환합니다.
+        filters(search_filters.build_search_filter)를 넘기면 조건에 맞는 문서 안에서만 순위를 매깁니다.
+        """
+        self.ensure_fresh()
+        snapshot = self._snapshot
+        if not snapshot.rows: return []
+
+        allowed, applied = snapshot.metadata.select(filters) if filters else (None, {})
+        similarities = snapshot.vectors.scores(query_embedding)
+        query_text = " ".join(k for k in dict.fromkeys(keywords or []) if k and k.strip())
+        lexical_scores = snapshot.bm25.scores(query_text) if query_text else np.zeros(len(snapshot.rows), dtype=np.float32)
+
+        candidates = min(LOCAL_SEARCH_CANDIDATES, len(snapshot.rows))
+        ranked_similarities = similarities
+        if allowed is not None:
+            print(f"🧮 [Filter] {applied} -> {int(allowed.sum())}/{len(snapshot.rows)}건")
+            candidates = min(candidates, int(allowed.sum()))
+            ranked_similarities = np.where(allowed, similarities, -np.inf)
+            lexical_scores = np.where(allowed, lexical_scores, 0).astype(np.float32)
+        vector_ranking = np.argsort(-ranked_similarities, kind="stable")[:candidates].tolist()
+        lexical_ranking = rank_matches(lexical_scores, candidates)
+
+        fused = rrf_fuse([vector_ranking, lexical_ranking], k=LOCAL_SEARCH_RRF_K)
+        top = sorted(fused, key=lambda i: -fused[i])[:match_count]
+        # 워커가 metadata를 고쳐 쓰므로 스냅샷 원본이 바뀌지 않게 복사해서 내보냅니다.
+        return [dict(snapshot.rows[i], metadata=dict(snapshot.rows[i].get("metadata") or {}),
+                     similarity=float(similarities[i]), bm25=float(lexical_scores[i]), rrf_score=fused[i])
+                for i in top]
+
+local_search_engine = LocalSearchEngine()
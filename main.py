@@ -2,11 +2,12 @@
 import os
 import json
 import uuid
+import time
 import logging
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from dotenv import load_dotenv
@@ -14,13 +15,27 @@ from dotenv import load_dotenv
 # [최적화] utils import 최상단 배치
 from utils import (
     redis_client,
-    MAIN_ANSWER_CACHE_KEY,
-    extract_info_from_question,
-    notion,                     
-    LLM_MODEL,
-    DATABASE_IDS,
-    get_supabase_pages_by_ids, 
-    format_search_results      
+    get_cached_answer_async,
+    extract_info_from_question_async,
+    get_notion,
+    get_supabase_pages_by_ids_async,
+    show_more_target_ids,
+    build_show_more_result,
+    INDEX_VERSION_KEY,
+    INDEX_MANIFEST_PREFIX,
+    INDEX_BUILD_SEQ_KEY,
+    get_indexer_status
+)
+from clients import registry
+import metrics
+from intent_rules import classify_intent_locally, build_intent_response
+from job_queue import (
+    enqueue_job_async,
+    get_job_result_async,
+    wait_for_job_result_async,
+    aiter_job_events,
+    get_result_stats,
+    get_queue_stats_async
 )
 
 # ------------------------------------
@@ -31,6 +46,11 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 ADMIN_SECRET_KEY = os.getenv("ADMIN_SECRET_KEY", "your_strong_admin_password_here")
+# 롱폴링(/get_result?wait=) 최대 대기 시간, SSE(/stream_result) 연결 유지 시간 (초)
+RESULT_WAIT_MAX = int(os.getenv("RESULT_WAIT_MAX", "30"))
+RESULT_STREAM_TIMEOUT = int(os.getenv("RESULT_STREAM_TIMEOUT", "180"))
+# 규칙으로 분류되지 않은 질문의 Gemini 의도 분석을 API에서 할지 (기본: 워커 작업에서 분석)
+INTENT_LLM_IN_API = os.getenv("INTENT_LLM_IN_API", "0") == "1"
 
 app = FastAPI()
 
@@ -50,14 +70,38 @@ app.add_middleware(
 
 # [삭제됨] 불필요한 SessionMiddleware 제거 (Stateless 지향)
 
+class RequestTimingMiddleware:
+    """
+    요청별 소요시간을 metrics.HTTP_REQUEST_SECONDS에 기록합니다.
+    라벨은 실제 경로가 아닌 라우트 템플릿(/get_result/{job_id})이라 job_id마다 시계열이 늘지 않습니다.
+    스트리밍 응답(SSE)은 응답 헤더를 보낼 때까지만 잽니다.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                route = scope.get("route")
+                metrics.HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=scope["method"],
+                    route=getattr(route, "path", "unmatched"), status=status["code"])
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+app.add_middleware(RequestTimingMiddleware)
+
 # --- 정적 파일 서빙 ---
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# --- Redis 키 이름 ---
-JOB_QUEUE_KEY = "chatbot:job_queue"
-JOB_RESULTS_KEY = "chatbot:job_results"
-
 # --- 요청 모델 ---
 class ChatRequest(BaseModel):
     question: str
@@ -68,6 +112,9 @@ class ChatRequest(BaseModel):
 # [삭제됨] FeedbackRequest 모델 삭제 (Google Forms 사용)
 
 # --- API 엔드포인트 ---
+# 요청 경로(/chat, /get_result, /stream_result)는 async def + redis.asyncio / 비동기 Gemini·Supabase 호출이라
+# 외부 API를 기다리는 동안 스레드풀(기본 40개)을 잡지 않습니다.
+# 드물게 호출되는 /health, /admin/* 는 동기(def)로 두어 스레드풀에서 실행됩니다.
 
 @app.get("/")
 async def read_root():
@@ -75,6 +122,27 @@ async def read_root():
         return FileResponse('static/index.html')
     return {"message": "Server is running. (No index.html found)"}
 
+@app.get("/health")
+def health(deep: bool = Query(False)):
+    """
+    서버 상태. 기본은 Redis만 확인하고, deep=true면 Supabase/Notion/Gemini까지 점검합니다.
+    (의존 서비스가 준비 중이어도 이 엔드포인트와 정적 파일은 응답합니다)
+    """
+    checks = registry.health(["redis", "supabase", "notion", "llm"] if deep else ["redis"])
+    ok = all(c["ok"] for c in checks.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"status": "ok" if ok else "degraded", "checks": checks})
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 텍스트 형식 지표 (이 API 프로세스의 요청/캐시/Redis 지표 + 큐 깊이, 전체 워커 처리 중 작업 수)"""
+    try:
+        stats = await get_queue_stats_async()
+        metrics.QUEUE_DEPTH.set(stats["queue_depth"])
+        metrics.JOBS_IN_FLIGHT.set(stats["in_flight"])
+    except Exception as e:
+        logger.warning(f"큐 지표 조회 실패: {e}")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/admin/clear_cache")
 def clear_all_caches(secret: str = Query(None)):
     if secret != ADMIN_SECRET_KEY: raise HTTPException(status_code=401, detail="Unauthorized")
@@ -83,6 +151,10 @@ def clear_all_caches(secret: str = Query(None)):
         keys_to_delete = []
         for key_pattern in ["extract:*", "summary:*", "chatbot:*"]: 
             keys_to_delete.extend(redis_client.keys(key_pattern))
+        # 활성 색인 버전 포인터와 매니페스트는 캐시가 아니므로 남깁니다. (지우면 옛/빌드 중 행까지 검색됨)
+        keys_to_delete = [k for k in keys_to_delete
+                          if k != INDEX_VERSION_KEY.encode() and not k.startswith(INDEX_MANIFEST_PREFIX.encode())
+                          and k != INDEX_BUILD_SEQ_KEY.encode()]
         
         if keys_to_delete:
             redis_client.delete(*keys_to_delete)
@@ -92,134 +164,125 @@ def clear_all_caches(secret: str = Query(None)):
         logger.error(f"캐시 삭제 오류: {e}")
         raise HTTPException(status_code=500, detail=f"오류: {e}")
 
+@app.get("/admin/result_stats")
+def result_stats(secret: str = Query(None)):
+    """Redis에 보존 중인 작업 결과 건수/바이트 (TTL 만료 전 결과만 집계)"""
+    if secret != ADMIN_SECRET_KEY: raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        return get_result_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"오류: {e}")
+
+@app.get("/admin/indexer_status")
+def indexer_status(secret: str = Query(None)):
+    """색인 데몬의 마지막 성공 시각, 반영 지연(lag_seconds), 마지막 회차 결과"""
+    if secret != ADMIN_SECRET_KEY: raise HTTPException(status_code=401, detail="Unauthorized")
+    return get_indexer_status()
+
 @app.post("/chat")
-def chat_with_bot(chat_request: ChatRequest):
+async def chat_with_bot(chat_request: ChatRequest):
     question = chat_request.question.strip()
     chat_history = chat_request.chat_history
+    last_result_ids = chat_request.last_result_ids
     logger.info(f"📩 받은 질문: {question}")
 
-    if not notion: raise HTTPException(status_code=503, detail="Notion API Key 설정 오류")
-
-    normalized_input = question.strip().lower()
+    if not get_notion(): raise HTTPException(status_code=503, detail="Notion API Key 설정 오류")
 
-    # 1. AI 의도 분석
-    try:
-        extracted_info = extract_info_from_question(question, chat_history)
-        if extracted_info.get("error"):
-             logger.error(f"Intent Error: {extracted_info['error']}")
-             raise HTTPException(status_code=500, detail=extracted_info["error"])
-    except Exception as e:
-        logger.error(f"질문 분석 예외: {e}")
-        raise HTTPException(status_code=500, detail=f"질문 분석 중 오류: {e}")
+    # 1. 의도 분석: 흔한 의도/명백한 검색은 규칙으로 즉시 판단하고,
+    #    애매한 입력만 워커가 작업을 처리할 때 Gemini로 분석합니다. (INTENT_LLM_IN_API=1이면 여기서 분석)
+    extracted_info = classify_intent_locally(question, has_results=bool(last_result_ids))
+    if extracted_info is None and INTENT_LLM_IN_API:
+        try:
+            extracted_info = await extract_info_from_question_async(question, chat_history)
+            if extracted_info.get("error"):
+                 logger.error(f"Intent Error: {extracted_info['error']}")
+                 raise HTTPException(status_code=500, detail=extracted_info["error"])
+        except Exception as e:
+            logger.error(f"질문 분석 예외: {e}")
+            raise HTTPException(status_code=500, detail=f"질문 분석 중 오류: {e}")
 
     # 2. 안전 및 기본 의도 처리
-    intent = extracted_info.get("intent")
-
-    if intent == "safety_block":
-        return {"status": "complete", "answer": "비속어는 삼가주세요. 😥 복지 정보에 대해 질문해 주세요.", "last_result_ids": [], "total_found": 0}
-    
-    if intent == "exit":
-        return {"status": "complete", "answer": "네, 알겠습니다. 언제든 다시 찾아주세요! 😊", "last_result_ids": [], "total_found": 0}
-    
-    if intent == "reset":
-        return {"status": "complete", "answer": "대화를 초기화했습니다. 무엇이 궁금하신가요? 🤖", "last_result_ids": [], "total_found": 0}
-
-    if intent == "out_of_scope":
-        return {"status": "complete", "answer": "저는 도봉구 영유아 복지 정보만 알려드릴 수 있어요. 😅", "last_result_ids": [], "total_found": 0}
-
-    if intent == "small_talk":
-        answer = "안녕하세요! 도봉구 영유아 복지 챗봇입니다. 무엇을 도와드릴까요?"
-        if "고마" in normalized_input or "감사" in normalized_input: 
-            answer = "도움이 되어 기쁩니다! 😊 언제든 또 물어봐 주세요."
-        return {"status": "complete", "answer": answer, "last_result_ids": [], "total_found": 0}
-
-    if intent == "clarify_category":
-        age_info = extracted_info.get("age")
-        age_text = f"{age_info}개월 아기" if age_info else "자녀"
-        return {
-            "status": "clarify", 
-            "answer": f"{age_text}를 위한 어떤 정보가 궁금하신가요?", 
-            "options": list(DATABASE_IDS.keys()), 
-            "last_result_ids": [], 
-            "total_found": 0
-        }
+    intent = extracted_info.get("intent") if extracted_info else None
+    canned = build_intent_response(intent, extracted_info or {}, question)
+    if canned: return canned
 
     # 3. '더 보기' 처리
-    show_more_keywords = ["더", "다음", "계속", "more", "next"]
-    is_show_more = (any(k in normalized_input for k in show_more_keywords) or intent == "show_more")
-    
-    if is_show_more and chat_request.last_result_ids:
+    if intent == "show_more" and last_result_ids:
         logger.info("[API] '더 보기' 요청 처리")
         try:
-            start = chat_request.shown_count
-            end = start + 2
-            target_ids = chat_request.last_result_ids[start:end]
-            
-            if not target_ids:
-                return {
-                    "status": "complete", 
-                    "answer": "더 이상 표시할 결과가 없습니다.", 
-                    "last_result_ids": chat_request.last_result_ids, 
-                    "total_found": len(chat_request.last_result_ids),
-                    "shown_count": chat_request.shown_count
-                }
-
-            next_pages = get_supabase_pages_by_ids(target_ids)
-            formatted_body = format_search_results(next_pages)
-            
-            header = f"🔎 **추가 정보 ({start+1}~{start+len(next_pages)}번째)**"
-            answer_text = f"{header}\n\n<hr>\n\n{formatted_body}"
-            
-            remaining = len(chat_request.last_result_ids) - end
-            if remaining > 0:
-                answer_text += f"\n\n<hr>\n\n🔍 **아직 결과가 더 남아있습니다.**\n'더 보여줘' 또는 '다음'을 입력해 보세요."
-            else:
-                answer_text += "\n\n<hr>\n\n✅ **모든 결과를 확인했습니다.**"
-
-            return {
-                "status": "complete", 
-                "answer": answer_text, 
-                "last_result_ids": chat_request.last_result_ids,
-                "total_found": len(chat_request.last_result_ids),
-                "shown_count": end 
-            }
+            target_ids = show_more_target_ids(last_result_ids, chat_request.shown_count)
+            next_pages = await get_supabase_pages_by_ids_async(target_ids) if target_ids else []
+            return build_show_more_result(last_result_ids, chat_request.shown_count, next_pages)
         except Exception as e:
             logger.error(f"❌ 더 보기 처리 오류: {e}")
             return {"status": "error", "answer": "추가 정보를 불러오는 중 오류가 발생했습니다."}
 
-    # 4. 일반 검색
-    try:
-        cached_data = redis_client.hget(MAIN_ANSWER_CACHE_KEY, question)
-        if cached_data:
-            logger.info(f"✅ [API] Cache Hit!")
-            return json.loads(cached_data.decode('utf-8'))
-    except Exception: pass
+    # 4. 일반 검색 (정규화된 질문 + 색인 버전 기준 답변 캐시)
+    cached_answer = await get_cached_answer_async(question)
+    if cached_answer:
+        logger.info(f"✅ [API] Cache Hit!")
+        return cached_answer
 
-    logger.info("[API] Cache Miss. Job 생성.")
+    logger.info(f"[API] Cache Miss. Job 생성. (의도: {'규칙' if extracted_info else '워커에서 분석'})")
     try: 
         job_id = str(uuid.uuid4())
         job_data = {
             "job_id": job_id, 
             "question": question, 
-            "chat_history": chat_history
+            "chat_history": chat_history,
+            # 의도가 아직 정해지지 않은 작업은 워커가 먼저 Gemini로 분석합니다. ('더 보기'로 판정될 때를 위해 결과 ID 포함)
+            "intent_resolved": extracted_info is not None,
+            # 워커가 검색 조건(연령/분류/대상)을 만들 때 씁니다.
+            "extracted_info": extracted_info,
+            "last_result_ids": last_result_ids,
+            "shown_count": chat_request.shown_count
         }
-        redis_client.rpush(JOB_QUEUE_KEY, json.dumps(job_data, ensure_ascii=False).encode('utf-8'))
+        await enqueue_job_async(job_data)
         return {"message": "요청 접수 완료.", "job_id": job_id}
     except Exception as e: 
         logger.error(f"Job 생성 실패: {e}")
         raise HTTPException(status_code=500, detail=f"Job 생성 오류: {e}")
 
 @app.get("/get_result/{job_id}")
-def get_job_result(job_id: str):
+async def get_job_result(job_id: str, wait: int = Query(0, ge=0)):
+    """
+    작업 결과 조회. wait(초)를 주면 결과가 나올 때까지 최대 wait초 기다립니다. (롱폴링)
+    결과는 워커가 저장하는 즉시 Pub/Sub으로 전달되므로 폴링 간격만큼의 지연이 없습니다.
+    """
     try:
-        result_bytes = redis_client.hget(JOB_RESULTS_KEY, job_id)
-        if result_bytes:
-            return json.loads(result_bytes.decode('utf-8'))
-        else:
-            return {"status": "pending"}
+        result = await get_job_result_async(job_id)
+        if not result and wait:
+            result = await wait_for_job_result_async(job_id, min(wait, RESULT_WAIT_MAX))
+        return result or {"status": "pending"}
     except Exception as e: 
         raise HTTPException(status_code=500, detail=f"오류: {e}")
 
+@app.get("/stream_result/{job_id}")
+async def stream_job_result(job_id: str):
+    """
+    Server-Sent Events로 작업 결과를 푸시합니다.
+    이벤트 이름은 결과의 status이며, data는 /get_result와 같은 JSON입니다.
+    - partial: 검색 직후 미리보기 (리랭킹 전 상위 결과, 여러 번 올 수 있음)
+    - complete / error: 최종 답변 (스트림 종료)
+    """
+    async def event_stream():
+        try:
+            async for event in aiter_job_events(job_id, RESULT_STREAM_TIMEOUT):
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event.get('status', 'message')}\ndata: {data}\n\n"
+        except Exception as e:
+            logger.error(f"결과 스트림 오류: {e}")
+            yield f"event: error\ndata: {json.dumps({'status': 'error', 'answer': '결과를 불러오는 중 오류가 발생했습니다.'}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # [삭제됨] /feedback 엔드포인트 삭제
 # 이제 프론트엔드에서 Google Form 링크(<a> 태그)를 직접 띄우면 됩니다.
 
@@ -0,0 +1,212 @@
+# metrics.py (프로세스 내 지표 수집 + Prometheus 텍스트 형식 출력)
+"""
+단계별 소요시간 히스토그램, 캐시 적중/실패 카운터, 큐 깊이 같은 게이지를 모아
+Prometheus 텍스트 형식(text/plain; version=0.0.4)으로 내보냅니다.
+
+- 지표는 프로세스마다 따로 쌓입니다. API는 main.py의 GET /metrics,
+  워커는 start_http_server(WORKER_METRICS_PORT)로 띄운 GET /metrics에서 읽습니다.
+- 게이지에 함수를 연결하면(set_function) 수집(scrape) 시점에 값을 계산합니다. (예: Redis 큐 길이)
+- 외부 의존성 없이 표준 라이브러리만 사용합니다.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 초 단위. Redis 왕복(ms)부터 Gemini 재시도 포함 호출(수십 초)까지 담습니다.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra: pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func: Callable[[], float]):
+        """수집 시점에 func()를 불러 값으로 씁니다. (라벨 없는 게이지 전용, 예외가 나면 그 값은 생략)"""
+        self._function = func
+
+    def _samples(self) -> list:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 라벨 값 → [버킷별 개수..., +Inf 개수], 합계
+        self._counts: Dict[tuple, list] = {}
+        self._sums: Dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics: self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics: lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# --- 챗봇 공용 지표 ---
+STAGE_SECONDS = registry.histogram(
+    "chatbot_stage_seconds", "Hot-path stage latency (intent, expand, embed, sem_cache, search, tiering, rerank, format, total)",
+    ["stage"])
+REDIS_SECONDS = registry.histogram("chatbot_redis_command_seconds", "Redis command / pipeline round trip", ["command"])
+LLM_CALL_SECONDS = registry.histogram("chatbot_llm_call_seconds", "Gemini call latency per attempt", ["kind", "outcome"])
+LLM_PROMPT_TOKENS = registry.histogram("chatbot_llm_prompt_tokens", "Estimated prompt tokens per Gemini call (UTF-8 bytes / 4)",
+                                       ["kind"], buckets=(250, 500, 1000, 2000, 4000, 8000, 16000))
+LLM_RETRIES = registry.counter("chatbot_llm_retries_total", "Failed Gemini attempts that were retried (the final failed attempt is not counted)", ["kind"])
+CACHE_REQUESTS = registry.counter("chatbot_cache_requests_total", "Cache lookups by cache and result (hit/miss)",
+                                  ["cache", "result"])
+HTTP_REQUEST_SECONDS = registry.histogram("chatbot_http_request_seconds", "API request latency", ["method", "route", "status"])
+RERANK_TOTAL = registry.counter("chatbot_rerank_total", "Rerank calls by reranker mode and method (local, llm, llm_failed)",
+                                ["mode", "method"])
+JOBS_TOTAL = registry.counter("chatbot_jobs_total", "Worker jobs by outcome (search, intent, error)", ["outcome"])
+QUEUE_DEPTH = registry.gauge("chatbot_job_queue_depth", "Jobs waiting in the Redis job queue")
+JOBS_IN_FLIGHT = registry.gauge("chatbot_jobs_in_flight", "Jobs being processed (worker: this process, API: all workers)")
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+def render() -> str:
+    return registry.render()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 수집기가 몇 초마다 부르므로 접근 로그는 남기지 않습니다.
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """GET /metrics를 응답하는 서버를 데몬 스레드로 띄웁니다. (워커 등 FastAPI가 없는 프로세스용)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
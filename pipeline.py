@@ -0,0 +1,188 @@
+# pipeline.py (색인용 생산자/소비자 파이프라인 + 토큰 버킷)
+"""
+단계(stage)마다 고정 크기의 작업자 스레드를 두고, 단계 사이를 크기 제한 큐로 잇는 파이프라인입니다.
+
+- 앞 단계가 빠르면 큐가 차서 자연스럽게 멈추므로(backpressure) 메모리가 불어나지 않습니다.
+- 외부 API 호출 속도는 TokenBucket으로 API별로 제한합니다. (고정 time.sleep 대신)
+- 단계별 처리량(건/초)을 집계해 실행이 끝나면 출력합니다.
+"""
+import time
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 capacity개까지 쌓이는 토큰 버킷 (rate <= 0이면 제한 없음)"""
+    def __init__(self, rate: float, capacity: float = None, name: str = ""):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """토큰이 생길 때까지 기다렸다가 가져갑니다. 기다린 시간(초)을 반환합니다."""
+        if self.rate <= 0: return 0.0
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.waited += waited
+                    return waited
+                shortfall = (tokens - self._tokens) / self.rate
+            time.sleep(shortfall)
+            waited += shortfall
+
+class StageStats:
+    def __init__(self, name: str, workers: int, source: bool = False):
+        self.name = name
+        self.workers = workers
+        # 첫 단계는 입력(예: DB 목록)이 아니라 내보낸 항목(페이지) 수로 처리량을 셉니다.
+        self.source = source
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, started: float, ended: float, outputs: int, failed: bool, inputs: int = 1):
+        with self._lock:
+            self.items_in += inputs
+            self.items_out += outputs
+            self.errors += int(failed)
+            self.busy += ended - started
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    @property
+    def wall(self) -> float:
+        if self.first_start is None: return 0.0
+        return self.last_end - self.first_start
+
+    @property
+    def throughput(self) -> float:
+        """처리한 건수 / (첫 작업 시작 ~ 마지막 작업 종료)"""
+        processed = self.items_out if self.source else self.items_in
+        return processed / self.wall if self.wall > 0 else 0.0
+
+_DONE = object()
+
+class Pipeline:
+    """
+    add_stage(name, func, workers)로 단계를 순서대로 붙이고 run(items)로 실행합니다.
+    func(item)은 다음 단계로 넘길 항목들을 목록이나 생성기로 돌려줍니다. (비어 있으면 그 항목은 여기서 끝)
+    func에서 예외가 나면 on_error(stage_name, item, exc)를 부르고 그 항목만 버립니다.
+
+    batch_size > 1인 단계는 항목을 최대 batch_size개(또는 batch_wait초 동안 모인 만큼)씩 묶어
+    func(list)로 한 번에 넘깁니다. (배치 API 호출용, on_error에도 목록이 넘어감)
+    """
+    def __init__(self, queue_size: int = 64, on_error: Optional[Callable] = None):
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.stages = []
+
+    def add_stage(self, name: str, func: Callable[[object], Iterable], workers: int = 1,
+                  batch_size: int = 1, batch_wait: float = 0.5):
+        self.stages.append((name, func, max(1, workers), max(1, batch_size), batch_wait))
+        return self
+
+    @staticmethod
+    def _next_batch(inbox: queue.Queue, batch_size: int, batch_wait: float):
+        """(항목 목록, 종료 신호를 받았는지)를 반환합니다. 첫 항목은 기다리고, 나머지는 batch_wait까지만 모읍니다."""
+        first = inbox.get()
+        if first is _DONE: return [], True
+        batch = [first]
+        deadline = time.monotonic() + batch_wait
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try:
+                item = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _DONE: return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _report_error(self, name: str, item, exc: Exception):
+        """on_error 콜백 자체가 실패해도 작업자 스레드가 죽지 않도록 감쌉니다."""
+        if not self.on_error:
+            print(f"❌ [Pipeline] '{name}' 단계 오류: {exc}")
+            return
+        try:
+            self.on_error(name, item, exc)
+        except Exception as e:
+            print(f"❌ [Pipeline] '{name}' 단계 오류 처리 실패: {e} (원래 오류: {exc})")
+
+    def run(self, items: Iterable) -> List[StageStats]:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stats = [StageStats(name, workers, source=(i == 0)) for i, (name, _, workers, _, _) in enumerate(self.stages)]
+        threads = []
+
+        for index, (name, func, workers, batch_size, batch_wait) in enumerate(self.stages):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            downstream_workers = self.stages[index + 1][2] if outbox else 0
+            remaining = [workers]
+            remaining_lock = threading.Lock()
+
+            def work(name=name, func=func, inbox=inbox, outbox=outbox, stage=stats[index],
+                     batch_size=batch_size, batch_wait=batch_wait,
+                     downstream_workers=downstream_workers, remaining=remaining, remaining_lock=remaining_lock):
+                done = False
+                try:
+                    while not done:
+                        if batch_size > 1:
+                            batch, done = self._next_batch(inbox, batch_size, batch_wait)
+                            if not batch: continue
+                            item, inputs = batch, len(batch)
+                        else:
+                            item = inbox.get()
+                            if item is _DONE: break
+                            inputs = 1
+                        started = time.perf_counter()
+                        outputs, failed = 0, False
+                        try:
+                            # 생성기(generator)도 받으므로, 나오는 대로 바로 다음 단계에 넘깁니다.
+                            for output in func(item) or []:
+                                outputs += 1
+                                if outbox is not None: outbox.put(output)
+                        except Exception as e:
+                            failed = True
+                            self._report_error(name, item, e)
+                        stage.record(started, time.perf_counter(), outputs, failed, inputs)
+                finally:
+                    # 이 단계의 마지막 작업자가 끝나면 다음 단계 작업자 수만큼 종료 신호를 보냅니다.
+                    # (작업자가 예외로 끝나도 보내야 run()이 영원히 기다리지 않습니다)
+                    with remaining_lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last and outbox is not None:
+                        for _ in range(downstream_workers): outbox.put(_DONE)
+
+            for i in range(workers):
+                thread = threading.Thread(target=work, name=f"{name}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        if self.stages:
+            for item in items: queues[0].put(item)
+            for _ in range(self.stages[0][2]): queues[0].put(_DONE)
+        for thread in threads: thread.join()
+        return stats
+
+def print_stage_report(stats: List[StageStats], title: str = "[Pipeline]"):
+    print(f"\n{title} 📊 단계별 처리량")
+    for s in stats:
+        print(f"  - {s.name:<10} {s.items_in:>5}건 입력 → {s.items_out:>5}건 출력 | "
+              f"{s.throughput:6.2f} pages/s (경과 {s.wall:.1f}초, 작업자 {s.workers}, "
+              f"작업 시간 합 {s.busy:.1f}초, 오류 {s.errors})")
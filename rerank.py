@@ -0,0 +1,203 @@
+# rerank.py (검색 후보 재정렬: 로컬 특징 점수 / Gemini / 혼합)
+"""
+검색 결과를 질문에 맞는 순서로 다시 정렬합니다. RERANK_MODE로 방식을 고릅니다.
+
+- local: 벡터 유사도, BM25(후보 안에서), 티어(assign_tiers), 연령 적합도, 분류 일치를 섞은 점수. 외부 호출 없음
+- llm: 상위 10개를 Gemini에 보내 순서를 받습니다. (예전 방식, 작업마다 호출)
+  후보는 본문 대신 색인기가 만든 요약 카드(digest.py)로 보내고, 후보 목록 전체를
+  RERANK_PROMPT_TOKEN_BUDGET 토큰 안에 맞춥니다.
+- hybrid(기본): local로 정렬한 뒤, 화면에 보일 상위 RERANK_TOP_K개와 그다음 후보의 점수 차가
+  RERANK_LLM_MARGIN보다 작아 판단이 애매할 때만 local 상위 10개를 Gemini로 다시 정렬합니다.
+
+어느 방식으로 처리했는지는 metrics.RERANK_TOTAL{mode, method}에 남습니다.
+"""
+import os
+import re
+import textwrap
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bm25 import score_documents, term_counts
+from digest import estimate_tokens, get_digest
+from intent_rules import guess_categories, normalize_category, parse_age_months
+from metrics import LLM_PROMPT_TOKENS, RERANK_TOTAL
+from utils import get_llm_model, generate_content_safe
+
+RERANK_MODE = os.getenv("RERANK_MODE", "hybrid")
+# 화면에 처음 보이는 결과 수 (워커의 표시 개수와 같음). 이 경계의 순서가 애매할 때만 LLM을 부릅니다.
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "2"))
+RERANK_LLM_MARGIN = float(os.getenv("RERANK_LLM_MARGIN", "0.03"))
+LLM_RERANK_CANDIDATES = 10
+# Gemini 리랭킹 프롬프트의 후보 목록 전체 토큰 예산 (후보마다 같은 몫으로 digest를 자름)
+RERANK_PROMPT_TOKEN_BUDGET = int(os.getenv("RERANK_PROMPT_TOKEN_BUDGET", "800"))
+
+# 로컬 점수의 특징별 가중치 (각 특징은 0~1)
+FEATURE_WEIGHTS = {"vector": 0.35, "bm25": 0.25, "tier": 0.25, "age": 0.1, "category": 0.05}
+TIER_SCORES = {1: 1.0, 2: 0.5}
+OPEN_END_AGE = 99999
+
+# Gemini 리랭킹 프롬프트 (후보 목록은 {candidates}에 digest 줄로 들어갑니다)
+RERANK_PROMPT_TEMPLATE = textwrap.dedent("""
+    사용자 질문: "{question}"
+
+    위 질문에 가장 적합한 복지 서비스를 아래 후보 목록에서 찾아, 적합한 순서대로 [번호]를 나열하세요.
+
+    [★★통합 랭킹 심사 기준★★]
+    1. **키워드 우선:** 질문의 핵심 단어(검사, 진단서 등)가 제목에 포함된 것을 우선하세요. 질문의 핵심 단어(짝치료, 언어치료 등)가 포함된 문서는 최우선 순위입니다.
+    2. **[중요] 문맥 구분 (검사/치료):**
+       - 질문이 "특수교육", "학교" 언급 없이 단순 "**장애 검사**", "**치료**"라면 -> **병원/행정(의료비, 바우처, 검사비 지원)** 사업을 학교(특수교육)보다 우선하세요.
+       - 질문이 '검사'일 때, 직접적인 검사뿐만 아니라 **'비용 지원(발달검사비 지원)'**도 매우 중요한 정답입니다. **반드시 상위 3위 안에 포함**시키세요.
+       - "선천성 대사이상", "난청" 같은 특정 질환은 질문에 해당 병명이 없으면 후순위입니다. 일반적인 "발달 검사"나 "장애 진단"을 우선하세요.
+       - **"심리 상담", "양육 상담", "부모 교육", "돌봄 서비스"는 검사가 아닙니다.** - 질문이 명확히 검사를 요구한다면, 상담/돌봄 문서는 순위를 낮추거나 제외하세요.
+    3. **의미 매칭:** 질문의 단어가 정확히 없더라도 의미가 통하면 정답입니다.
+    4. **유사 서비스 주의:** "놀이치료"와 "짝치료"는 다릅니다. "베이비 마사지"와 같은 단순 프로그램은 '검사'가 아닙니다. 제외하세요.
+    5. **나이/조건 필터링:** 대상 연령이나 자격 요건이 맞지 않으면 순위를 내리세요.
+    6. **내용 확인:** 제목뿐만 아니라 '대상', '지원', '자격' 필드도 확인하세요.
+    7. **정확도:** 질문의 키워드(검사, 비용 등)가 제목에 포함된 것을 우선하세요.
+    8. **'짝치료/그룹치료' 질문 시**
+       - 이 질문은 **'사회성 향상'**이나 **'또래'**, **'두리활동'** 프로그램을 찾는 질문입니다.
+       - 제목이나 내용에 **'두리', '짝', '그룹', '사회성'**이 포함된 문서를 무조건 1순위로 올리세요.
+       - 단순 상담이나 부모 교육은 후순위 입니다.
+
+    [후보 목록]
+    {candidates}
+
+    [작성 규칙]
+    - 가장 적합한 후보의 번호 **5개**를 쉼표로 구분하여 적으세요.
+    - 예시: 3, 10, 1, 5, 2
+""")
+
+def _normalized(values: np.ndarray) -> np.ndarray:
+    """후보 안에서 0~1로 맞춥니다. (모두 같으면 0)"""
+    low, high = float(values.min()), float(values.max())
+    return (values - low) / (high - low) if high > low else np.zeros_like(values)
+
+def _age_fit(age: Optional[int], metadata: dict) -> float:
+    """질문 월령이 문서 대상 연령 안이면 1, 밖이면 0, 어느 한쪽을 모르면 0.5"""
+    start, end = metadata.get("start_age"), metadata.get("end_age")
+    if age is None or start is None or end is None: return 0.5
+    start = 0 if start == -1 else start
+    end = OPEN_END_AGE if end == -1 else end
+    return 1.0 if start <= age <= end else 0.0
+
+class LocalReranker:
+    """외부 호출 없이 특징 점수의 가중합으로 정렬합니다."""
+    name = "local"
+
+    def score(self, question: str, candidates: list, keywords: list = None, tiers: Dict[str, int] = None) -> np.ndarray:
+        tiers = tiers or {}
+        metas = [doc.get("metadata", {}) for doc in candidates]
+
+        vector = _normalized(np.array([float(doc.get("similarity") or 0.0) for doc in candidates], dtype=np.float32))
+        # 제목을 한 번 더 넣어 제목 일치에 무게를 줍니다.
+        documents = [term_counts(f"{m.get('title', '')} {m.get('title', '')} {doc.get('content', '')[:1500]}")
+                     for m, doc in zip(metas, candidates)]
+        lexical = score_documents(" ".join([question] + list(keywords or [])), documents)
+        lexical = lexical / lexical.max() if lexical.max() > 0 else lexical
+        tier = np.array([TIER_SCORES.get(tiers.get(m.get("page_id")), 0.0) for m in metas], dtype=np.float32)
+
+        age = parse_age_months(question)
+        age_fit = np.array([_age_fit(age, m) for m in metas], dtype=np.float32)
+        categories = guess_categories(question)
+        category = np.array([0.5 if not categories else float(normalize_category(m.get("category")) in categories)
+                             for m in metas], dtype=np.float32)
+
+        features = {"vector": vector, "bm25": lexical, "tier": tier, "age": age_fit, "category": category}
+        return sum(FEATURE_WEIGHTS[name] * values for name, values in features.items())
+
+    def rerank(self, question: str, candidates: list, keywords: list = None, tiers: Dict[str, int] = None) -> list:
+        if not candidates: return candidates
+        scores = self.score(question, candidates, keywords, tiers)
+        order = np.argsort(-scores, kind="stable")
+        RERANK_TOTAL.inc(mode=self.name, method="local")
+        return [candidates[i] for i in order]
+
+class LLMReranker:
+    """상위 LLM_RERANK_CANDIDATES개를 Gemini에 보내 받은 번호 순서로 정렬합니다. (실패하면 None)"""
+    name = "llm"
+
+    def rerank_or_none(self, question: str, candidates: list) -> Optional[list]:
+        llm_model = get_llm_model()
+        if not candidates or not llm_model: return None
+
+        rerank_candidates = candidates[:LLM_RERANK_CANDIDATES]
+        remaining_candidates = candidates[LLM_RERANK_CANDIDATES:]
+
+        # 후보마다 '[번호] '와 줄바꿈 몫(약 2토큰)을 빼고 digest에 나눠 줍니다.
+        share = max(RERANK_PROMPT_TOKEN_BUDGET // len(rerank_candidates) - 2, 1)
+        candidates_str = "\n".join(f"[{i}] {get_digest(doc, share)}" for i, doc in enumerate(rerank_candidates))
+
+        prompt = RERANK_PROMPT_TEMPLATE.format(question=question, candidates=candidates_str)
+        LLM_PROMPT_TOKENS.observe(estimate_tokens(prompt), kind="rerank")
+
+        try:
+            response = generate_content_safe(llm_model, prompt, timeout=60)
+            raw_indices = [int(s) for s in re.findall(r'\b\d+\b', response.text.strip())]
+        except Exception as e:
+            print(f"⚠️ 랭킹 실패: {e}")
+            return None
+
+        final_results = []
+        seen = set()
+        for idx in raw_indices:
+            if idx not in seen and 0 <= idx < len(rerank_candidates):
+                final_results.append(rerank_candidates[idx])
+                seen.add(idx)
+        for i, doc in enumerate(rerank_candidates):
+            if i not in seen: final_results.append(doc)
+        return final_results + remaining_candidates
+
+    def rerank(self, question: str, candidates: list, keywords: list = None, tiers: Dict[str, int] = None) -> list:
+        results = self.rerank_or_none(question, candidates)
+        RERANK_TOTAL.inc(mode=self.name, method="llm" if results is not None else "llm_failed")
+        return results if results is not None else candidates
+
+class HybridReranker:
+    """로컬 점수로 정렬하고, 상위 top_k 경계가 애매할 때만 LLM으로 다시 정렬합니다."""
+    name = "hybrid"
+
+    def __init__(self, local: LocalReranker, llm: LLMReranker, top_k: int = RERANK_TOP_K, margin: float = RERANK_LLM_MARGIN):
+        self.local = local
+        self.llm = llm
+        self.top_k = top_k
+        self.margin = margin
+
+    def rerank(self, question: str, candidates: list, keywords: list = None, tiers: Dict[str, int] = None) -> list:
+        if not candidates: return candidates
+        scores = self.local.score(question, candidates, keywords, tiers)
+        order = np.argsort(-scores, kind="stable")
+        ranked = [candidates[i] for i in order]
+        if len(ranked) <= self.top_k:
+            RERANK_TOTAL.inc(mode=self.name, method="local")
+            return ranked
+
+        gap = float(scores[order[self.top_k - 1]] - scores[order[self.top_k]])
+        if gap >= self.margin:
+            RERANK_TOTAL.inc(mode=self.name, method="local")
+            return ranked
+
+        print(f"🤖 [Rerank] 상위 {self.top_k}위 경계 점수 차 {gap:.3f} < {self.margin} -> Gemini 재정렬")
+        results = self.llm.rerank_or_none(question, ranked)
+        RERANK_TOTAL.inc(mode=self.name, method="llm" if results is not None else "llm_failed")
+        return results if results is not None else ranked
+
+local_reranker = LocalReranker()
+llm_reranker = LLMReranker()
+RERANKERS = {
+    "local": local_reranker,
+    "llm": llm_reranker,
+    "hybrid": HybridReranker(local_reranker, llm_reranker),
+}
+
+def rerank_search_results(question: str, candidates: list, keywords: List[str] = None,
+                          tiers: Dict[str, int] = None, mode: str = None) -> list:
+    """
+    후보를 RERANK_MODE(또는 mode) 방식으로 정렬해 반환합니다. (후보 수는 그대로)
+    keywords: 검색에 쓴 키워드 (BM25 질의에 추가), tiers: page_id -> 1/2 (assign_tiers 결과)
+    """
+    reranker = RERANKERS.get(mode or RERANK_MODE)
+    if reranker is None:
+        print(f"⚠️ 알 수 없는 RERANK_MODE '{mode or RERANK_MODE}' -> hybrid 사용")
+        reranker = RERANKERS["hybrid"]
+    return reranker.rerank(question, candidates, keywords, tiers)
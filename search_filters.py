@@ -0,0 +1,115 @@
+# search_filters.py (검색 전 연령/분류/대상 메타데이터 필터)
+"""
+질문에서 뽑은 연령(개월), 분류, 대상 특성으로 검색 후보를 미리 좁힙니다.
+
+- 조건(filters): {"age": 36, "categories": ["의료재활"], "targets": ["장애"]}
+  의도 분석 결과(extracted_info)가 있으면 그 값을, 없으면 질문에서 규칙으로 짐작한 값을 씁니다.
+  (규칙으로 짐작한 분류는 질문 확장 사전의 트리거가 있으면 쓰지 않습니다)
+- MetadataIndex: 연령 구간 색인(시작 월령 정렬 + 이분 탐색)과 분류/대상별 비트맵(bool 배열)
+  로컬 검색 엔진은 스냅샷을 만들 때 한 번, RPC 경로는 받은 행에 대해 만들어 같은 방식으로 거릅니다.
+- 조건을 만족하는 문서가 SEARCH_FILTER_MIN_MATCHES개 미만이면 분류 → 대상 → 연령 순으로 조건을 풀어
+  결과가 비는 일이 없게 합니다. (연령 정보가 없는 문서, 대상이 '일반'이거나 비어 있는 문서는 항상 통과)
+"""
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from intent_rules import QUERY_EXPANSION_MAP, TARGET_TRAITS, guess_categories, guess_targets, normalize_category, parse_age_months
+
+SEARCH_FILTERS_ENABLED = os.getenv("SEARCH_FILTERS_ENABLED", "1") == "1"
+SEARCH_FILTER_MIN_MATCHES = int(os.getenv("SEARCH_FILTER_MIN_MATCHES", "5"))
+# 조건이 너무 좁을 때 먼저 푸는 순서
+RELAXATION_ORDER = ("categories", "targets", "age")
+OPEN_END_AGE = 99999
+GENERAL_TARGET = "일반"
+
+def build_search_filter(question: str, extracted_info: dict = None) -> Optional[dict]:
+    """질문(과 의도 분석 결과)으로 검색 조건을 만듭니다. 걸 조건이 없으면 None"""
+    if not SEARCH_FILTERS_ENABLED: return None
+    info = extracted_info or {}
+
+    age = info.get("age") if isinstance(info.get("age"), int) else parse_age_months(question)
+    if info.get("category"):
+        categories = {normalize_category(info["category"])}
+    elif any(trigger in question.replace(" ", "") for trigger in QUERY_EXPANSION_MAP):
+        # 확장 사전은 일부러 여러 분류의 사업을 끌어오므로 (예: 짝치료 → 두리활동) 규칙으로 분류를 좁히지 않습니다.
+        categories = set()
+    else:
+        categories = guess_categories(question)
+    sub_category = info.get("sub_category") or ""
+    if isinstance(sub_category, list): sub_category = " ".join(sub_category)
+    targets = {trait for trait in TARGET_TRAITS if trait in sub_category} | guess_targets(question)
+
+    filters = {"age": age, "categories": sorted(categories), "targets": sorted(targets)}
+    return filters if age is not None or categories or targets else None
+
+def _age_bound(value, default: float) -> float:
+    return default if value is None or value == -1 else float(value)
+
+class AgeIntervalIndex:
+    """[start_age, end_age] 구간 색인. 시작 월령 순으로 정렬해 두고, 질의 월령 이하로 시작하는 구간의 끝만 확인합니다."""
+    def __init__(self, metadatas: List[dict]):
+        starts = np.array([_age_bound(m.get("start_age"), 0) for m in metadatas], dtype=np.float32)
+        self.ends = np.array([_age_bound(m.get("end_age"), OPEN_END_AGE) for m in metadatas], dtype=np.float32)
+        self.order = np.argsort(starts, kind="stable")
+        self.sorted_starts = starts[self.order]
+
+    def containing(self, age: float) -> np.ndarray:
+        mask = np.zeros(len(self.ends), dtype=bool)
+        started = self.order[:np.searchsorted(self.sorted_starts, age, side="right")]
+        mask[started[self.ends[started] >= age]] = True
+        return mask
+
+class MetadataIndex:
+    """문서 메타데이터(start_age, end_age, category, sub_category_list)의 연령 구간 색인 + 분류/대상 비트맵"""
+    def __init__(self, metadatas: List[dict]):
+        self.size = len(metadatas)
+        self.ages = AgeIntervalIndex(metadatas)
+        self.categories: Dict[str, np.ndarray] = defaultdict(lambda: np.zeros(self.size, dtype=bool))
+        self.targets: Dict[str, np.ndarray] = defaultdict(lambda: np.zeros(self.size, dtype=bool))
+        # 대상이 비어 있거나 '일반'이 포함된 문서는 어떤 대상 조건에도 통과
+        self.general = np.zeros(self.size, dtype=bool)
+
+        for i, meta in enumerate(metadatas):
+            self.categories[normalize_category(meta.get("category"))][i] = True
+            targets = meta.get("sub_category_list") or []
+            if not targets or any(GENERAL_TARGET in t for t in targets): self.general[i] = True
+            for trait in TARGET_TRAITS:
+                if any(trait in t for t in targets): self.targets[trait][i] = True
+        self.categories = dict(self.categories)
+        self.targets = dict(self.targets)
+
+    def _any(self, bitmaps: Dict[str, np.ndarray], values) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        for value in values:
+            if value in bitmaps: mask |= bitmaps[value]
+        return mask
+
+    def mask(self, filters: dict) -> np.ndarray:
+        mask = np.ones(self.size, dtype=bool)
+        if filters.get("age") is not None: mask &= self.ages.containing(filters["age"])
+        if filters.get("categories"): mask &= self._any(self.categories, filters["categories"])
+        if filters.get("targets"): mask &= self._any(self.targets, filters["targets"]) | self.general
+        return mask
+
+    def select(self, filters: Optional[dict], min_matches: int = SEARCH_FILTER_MIN_MATCHES) -> Tuple[Optional[np.ndarray], dict]:
+        """
+        조건을 만족하는 문서 마스크와 실제로 적용한 조건을 반환합니다.
+        결과가 min_matches개 미만이면 RELAXATION_ORDER 순서로 조건을 하나씩 풉니다. (모두 풀리면 (None, {}))
+        """
+        active = {k: v for k, v in (filters or {}).items() if v is not None and v != []}
+        for key in (None,) + RELAXATION_ORDER:
+            if key: active.pop(key, None)
+            if not active: return None, {}
+            mask = self.mask(active)
+            if mask.sum() >= min(min_matches, self.size): return mask, active
+        return None, {}
+
+def filter_rows(rows: list, filters: Optional[dict]) -> Tuple[list, dict]:
+    """RPC 결과처럼 이미 받은 행 목록을 같은 조건으로 거릅니다. (거른 행, 적용한 조건)"""
+    if not rows or not filters: return rows, {}
+    mask, applied = MetadataIndex([row.get("metadata") or {} for row in rows]).select(filters)
+    if mask is None: return rows, {}
+    return [row for row, keep in zip(rows, mask) if keep], applied
@@ -1,21 +1,27 @@
 import redis
+import redis.asyncio as aioredis
 import os
 import json
 import time
 import hashlib
 import re
+import threading
+from datetime import datetime
 from typing import List, Optional
 from dotenv import load_dotenv
-import google.generativeai as genai
-from notion_client import Client as NotionClient
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from supabase import create_client
+from clients import registry
+from vector_index import LocalVectorIndex
+from embedding_cache import EmbeddingCache
+from metrics import REDIS_SECONDS, LLM_CALL_SECONDS, LLM_RETRIES, record_cache
 
 # --- 1. 설정 로드 ---
 load_dotenv()
 NOTION_KEY = os.getenv("NOTION_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+# 벤치마크(benchmark.py replay)는 운영 캐시와 섞이지 않도록 별도 DB 번호를 씁니다.
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
@@ -34,44 +40,155 @@ NOTION_PROPERTY_NAMES = {
     "url3": "관련 홈페이지 3", "extra_req": "추가 자격요건"
 }
 
-# --- 3. 클라이언트 초기화 ---
-LLM_MODEL = None
-if GEMINI_API_KEY:
-    try:
-        # [핵심 수정] transport='rest' 추가! (이게 통신 안정성을 높여줍니다)
-        genai.configure(api_key=GEMINI_API_KEY, transport="rest")
-        
-        # [체크] 모델명이 '2.5'인지 꼭 확인하세요.
-        LLM_MODEL = genai.GenerativeModel('gemini-2.5-flash') 
-        print("✅ Utils: Gemini 모델 로드 완료 (Mode: REST)")
-    except Exception as e:
-        print(f"⚠️ Utils: Gemini API 설정 오류: {e}")
+# --- 3. 클라이언트 (지연 초기화) ---
+# import 시점에는 연결하지 않고, 처음 쓰는 순간 프로세스당 한 번 만듭니다. (clients.py)
+# 무거운 SDK(google.generativeai, supabase, notion_client) import도 이때 일어납니다.
+LLM_MODEL_NAME = 'gemini-2.5-flash'
 
-notion = NotionClient(auth=NOTION_KEY) if NOTION_KEY else None
-
-if SUPABASE_URL and SUPABASE_KEY:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-else:
-    print("⚠️ Utils: Supabase 설정이 없습니다.")
-    supabase = None
+def _build_genai():
+    if not GEMINI_API_KEY: return None
+    import google.generativeai as genai
+    # [핵심 수정] transport='rest' 추가! (이게 통신 안정성을 높여줍니다)
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest")
+    print("✅ Utils: Gemini 설정 완료 (Mode: REST)")
+    return genai
+
+def _build_llm_model():
+    genai = get_genai()
+    if not genai: return None
+    # [체크] 모델명이 '2.5'인지 꼭 확인하세요.
+    return genai.GenerativeModel(LLM_MODEL_NAME)
+
+def _build_notion():
+    if not NOTION_KEY: return None
+    from notion_client import Client as NotionClient
+    return NotionClient(auth=NOTION_KEY)
+
+def _build_supabase():
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        print("⚠️ Utils: Supabase 설정이 없습니다.")
+        return None
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# --- 4. Redis 클라이언트 초기화 ---
-redis_client = redis.Redis(host=REDIS_HOST, port=6379, db=0, decode_responses=False)
+# [비동기] API 요청 경로(main.py)용. 이벤트 루프마다 하나씩 만들어집니다. (clients.py per_loop)
+def _build_async_llm_model():
+    if not GEMINI_API_KEY: return None
+    from gemini_async import AsyncGeminiModel
+    return AsyncGeminiModel(LLM_MODEL_NAME, GEMINI_API_KEY)
+
+def _build_async_supabase():
+    if not (SUPABASE_URL and SUPABASE_KEY): return None
+    from supabase import AsyncClient
+    return AsyncClient(SUPABASE_URL, SUPABASE_KEY)
+
+# --- 4. Redis 클라이언트 ---
+# 모든 명령/파이프라인의 왕복 시간을 명령 이름별로 기록합니다. (metrics.REDIS_SECONDS)
+# 워커의 작업 대기(BLMOVE)는 타임아웃까지 막혀 있는 시간이 그대로 잡히니 따로 보세요.
+class _TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        with REDIS_SECONDS.time(command="PIPELINE"):
+            return super().execute(raise_on_error)
+
+class _TimedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        with REDIS_SECONDS.time(command=str(args[0]).upper()):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class _TimedAsyncPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        with REDIS_SECONDS.time(command="PIPELINE"):
+            return await super().execute(raise_on_error)
+
+class _TimedAsyncRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        with REDIS_SECONDS.time(command=str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# redis.Redis 생성은 연결을 만들지 않습니다. (첫 명령 때 연결)
+redis_client = _TimedRedis(host=REDIS_HOST, port=6379, db=REDIS_DB, decode_responses=False)
+
+registry.register("redis", lambda: redis_client, check=lambda client: client.ping())
+registry.register("genai", _build_genai)
+# 모델 메타데이터 조회(models.get)로 API 키와 Gemini 연결을 실제로 확인합니다. (토큰을 쓰지 않는 가벼운 호출)
+registry.register("llm", _build_llm_model,
+                  check=lambda model: get_genai().get_model(model.model_name, request_options={"timeout": 5}))
+registry.register("notion", _build_notion, check=lambda client: client.users.me())
+registry.register("supabase", _build_supabase,
+                  check=lambda client: client.table("site_pages").select("id").limit(1).execute())
+# 비동기 풀은 한도를 넘으면 곧바로 오류를 내므로, 한도에서 잠시 기다리는 BlockingConnectionPool을 씁니다.
+# (SSE/롱폴링 구독도 연결을 하나씩 잡으므로 동시 대기 클라이언트 수보다 넉넉하게)
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", "512"))
+
+def _build_async_redis():
+    pool = aioredis.BlockingConnectionPool(host=REDIS_HOST, port=6379, db=REDIS_DB,
+                                           max_connections=REDIS_ASYNC_MAX_CONNECTIONS, timeout=10)
+    return _TimedAsyncRedis(connection_pool=pool, decode_responses=False)
+
+registry.register("redis_async", _build_async_redis, per_loop=True)
+registry.register("llm_async", _build_async_llm_model, per_loop=True)
+registry.register("supabase_async", _build_async_supabase, per_loop=True)
+
+def get_genai():
+    """설정이 끝난 google.generativeai 모듈 (GEMINI_API_KEY가 없으면 None)"""
+    return registry.get("genai")
+
+def get_llm_model():
+    return registry.get("llm")
+
+def get_notion():
+    return registry.get("notion")
+
+def get_supabase():
+    return registry.get("supabase")
+
+# 아래 get_async_*는 코루틴 안에서만 부를 수 있습니다.
+def get_async_redis() -> aioredis.Redis:
+    return registry.get("redis_async")
+
+def get_async_llm_model():
+    return registry.get("llm_async")
+
+def get_async_supabase():
+    return registry.get("supabase_async")
+
+def wait_for_redis(retries: int = 10, interval: float = 1.0):
+    """Redis가 꼭 필요한 프로세스(워커/인덱서)가 시작할 때 부릅니다. 끝내 안 되면 예외."""
+    for _ in range(retries):
+        try:
+            redis_client.ping()
+            return
+        except redis.exceptions.ConnectionError:
+            time.sleep(interval)
+    raise Exception("Redis connection failed after retries")
 
 MAIN_ANSWER_CACHE_KEY = "chatbot:main_answers"
-MAIN_ANSWER_CACHE_TTL = 3600
-
-connected = False
-for i in range(10):
-    try:
-        redis_client.ping()
-        connected = True
-        break
-    except redis.exceptions.ConnectionError:
-        time.sleep(1)
-
-if not connected:
-    raise Exception("Redis connection failed after retries")
+MAIN_ANSWER_CACHE_TTL = int(os.getenv("MAIN_ANSWER_CACHE_TTL", "3600"))
+# 색인 버전: 인덱서가 문서를 바꿀 때마다 올라가며, 답변 캐시 키에 포함되어 자동 무효화됩니다.
+INDEX_VERSION_KEY = "chatbot:index_version"
+# [블루/그린 색인] 버전별 매니페스트(page_id → 그 페이지 행이 기록된 색인 버전)와 빌드 번호 발급 키
+INDEX_MANIFEST_PREFIX = "chatbot:index_manifest:"
+INDEX_BUILD_SEQ_KEY = "chatbot:index_build_seq"
+# 교체된 이전 버전 매니페스트를 남겨 둘 시간(초) (교체 순간 처리 중이던 요청용)
+INDEX_MANIFEST_RETAIN = int(os.getenv("INDEX_MANIFEST_RETAIN", "3600"))
+# site_pages에 있지만 활성 버전이 아닌 행: 정리 대기 중인 옛 행(id → 교체 시각)과 빌드 중에 쓴 새 행 수
+INDEX_RETIRED_KEY = "indexer:retired_rows"
+INDEX_PENDING_ROWS_KEY = "indexer:pending_rows"
+# RPC 검색에서 비활성 행 비율만큼 더 가져올 때의 최대 배수
+INDEX_OVERFETCH_MAX = float(os.getenv("INDEX_OVERFETCH_MAX", "4"))
+
+# [임베딩 캐시] (모델, task_type, 텍스트 해시) → float32 바이트. 인덱서와 워커가 함께 씁니다.
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))
+EMBEDDING_CACHE_LOCAL_SIZE = int(os.getenv("EMBEDDING_CACHE_LOCAL_SIZE", "2048"))
+embedding_cache = EmbeddingCache(redis_client, ttl=EMBEDDING_CACHE_TTL,
+                                 local_size=EMBEDDING_CACHE_LOCAL_SIZE) if EMBEDDING_CACHE_ENABLED else None
 
 # --- 5. 시스템 명령어 ---
 SYSTEM_INSTRUCTION_WORKER = (
@@ -83,56 +200,342 @@ SYSTEM_INSTRUCTION_WORKER = (
 
 # --- 6. 핵심 로직 함수들 ---
 
-def get_gemini_embedding(text: str, task_type: str = "SEMANTIC_SIMILARITY") -> Optional[List[float]]:
-    if not GEMINI_API_KEY: return None
+# [공통] 한국어 문장형 질문에서 자주 나오는 불필요한 단어들 (검색어 확장 / 캐시 키 정규화)
+STOP_WORDS = [
+    # 의문사/요청
+    "있어", "있니", "있나요", "어디", "어디야", "알려줘", "해줘", "궁금해", 
+    "무엇", "뭐야", "대한", "관한", "관련", "알고", "싶어", "해요", "되나요",
+    "나와", "저기", "그거", "이거", "요", "좀", "수", "것", "등", "및", "자세히",
+    # 서술어/어미 (로그에서 발견된 노이즈)
+    "하는", "있는", "좋을", "같다고", "하셨는데", "하셨습니다", "가야하는지",
+    "받아보는", "의심된다고", "같습니다", "합니다", "입니다",
+    # 호칭/주어 (검색에 방해됨)
+    "선생님께서", "섲ㄴ생님꼐서", "어린이집에서", "아이를", "아이가", "키우고", "우리", "제가"
+]
+
+# 명사 뒤에 붙는 조사 (긴 것부터 검사). 떼어낸 뒤 2글자 이상 남을 때만 제거합니다.
+PARTICLE_SUFFIXES = ("에서는", "에서", "에게", "한테", "으로", "부터", "까지", "이랑",
+                     "은", "는", "이", "가", "을", "를", "의", "도", "만", "로", "랑", "와", "과", "요")
+
+# 마지막 글자가 한 글자 조사와 같은 명사 (소아과→소아, 전문가→전문 처럼 잘리지 않도록 그대로 둡니다)
+# 진료과는 '과'로 끝나는 부분만 적습니다. (외과 → 정형외과/신경외과, 내과 → 소아내과)
+# '안과'는 넣지 않습니다. ('불안과'처럼 '과'가 조사인 경우가 더 흔하고, '안과' 자체는 두 글자라 잘리지 않음)
+PARTICLE_LIKE_NOUN_ENDINGS = ("소아과", "피부과", "부인과", "의학과", "청소년과", "인후과", "외과", "내과", "신경과",
+                              "정신과", "비뇨기과", "전문가", "평가", "효과", "결과",
+                              "어린이", "놀이", "나이", "전문의", "제도", "정도", "지도", "필요", "경로")
+
+def _strip_particle(token: str) -> str:
+    for suffix in PARTICLE_SUFFIXES:
+        if len(suffix) == 1 and token.endswith(PARTICLE_LIKE_NOUN_ENDINGS):
+            return token
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+def normalize_question(question: str) -> str:
+    """
+    답변 캐시 키용 질문 정규화.
+    특수문자/공백/대소문자 차이, 조사, 불용어를 없애고 단어 순서를 정렬합니다.
+    예) "장애검사 알려줘!" == "장애검사  알려줘" == "알려줘 장애검사요"
+    """
+    tokens = []
+    for token in re.sub(r'[^\w\s]', ' ', question.lower()).split():
+        if token in STOP_WORDS: continue
+        token = _strip_particle(token)
+        if token in STOP_WORDS: continue
+        tokens.append(token)
+
+    if not tokens:
+        return " ".join(question.lower().split())
+    return " ".join(sorted(set(tokens)))
+
+def get_index_version() -> str:
+    try:
+        version = redis_client.get(INDEX_VERSION_KEY)
+        return version.decode('utf-8') if version else "0"
+    except Exception:
+        return "0"
+
+async def get_index_version_async() -> str:
+    try:
+        version = await get_async_redis().get(INDEX_VERSION_KEY)
+        return version.decode('utf-8') if version else "0"
+    except Exception:
+        return "0"
+
+def reserve_index_version() -> str:
+    """새 색인 빌드에 쓸 버전 번호를 발급합니다. (항상 현재 활성 버전보다 큼)"""
+    version = redis_client.incr(INDEX_BUILD_SEQ_KEY)
+    active = int(get_index_version() or 0)
+    if version <= active:
+        version = active + 1
+        redis_client.set(INDEX_BUILD_SEQ_KEY, version)
+    return str(version)
+
+def index_row_id(page_id: str, version: str) -> str:
+    """색인 버전별 site_pages 행 id (버전 "0"은 블루/그린 이전에 만든 행)"""
+    return f"{page_id}_0" if version in (None, "", "0") else f"{page_id}_0@v{version}"
+
+def activate_index_version(version: str, manifest: dict):
+    """
+    매니페스트를 기록하고 활성 버전 포인터를 한 번의 트랜잭션(MULTI)으로 바꿉니다.
+    워커/API는 다음 조회부터 새 버전의 행과 새 캐시 키를 씁니다.
+    """
+    previous = get_index_version()
+    key = INDEX_MANIFEST_PREFIX + version
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key)
+    # 빈 색인이어도 매니페스트가 '없음'(= 필터 안 함)으로 보이지 않도록 표식 필드를 넣습니다.
+    pipe.hset(key, mapping=dict(manifest, __version__=version))
+    pipe.set(INDEX_VERSION_KEY, version)
+    pipe.expire(INDEX_MANIFEST_PREFIX + previous, INDEX_MANIFEST_RETAIN)
+    pipe.execute()
+
+_manifest_cache = {"version": None, "manifest": None}
+_manifest_lock = threading.Lock()
+
+def _remember_manifest(version: str, raw: dict) -> Optional[dict]:
+    manifest = {k.decode('utf-8'): v.decode('utf-8') for k, v in raw.items()} if raw else None
+    if manifest: manifest.pop("__version__", None)
+    with _manifest_lock:
+        _manifest_cache.update(version=version, manifest=manifest)
+    return manifest
+
+def get_index_manifest(version: str = None) -> Optional[dict]:
+    """활성(또는 지정) 버전의 page_id → 행 버전 매핑. 매니페스트가 없는 (블루/그린 이전) 색인이면 None."""
+    version = version or get_index_version()
+    with _manifest_lock:
+        if _manifest_cache["version"] == version: return _manifest_cache["manifest"]
+    try:
+        raw = redis_client.hgetall(INDEX_MANIFEST_PREFIX + version)
+    except Exception as e:
+        print(f"⚠️ 색인 매니페스트 조회 실패: {e}")
+        return None
+    return _remember_manifest(version, raw)
+
+async def get_index_manifest_async(version: str = None) -> Optional[dict]:
+    version = version or await get_index_version_async()
+    with _manifest_lock:
+        if _manifest_cache["version"] == version: return _manifest_cache["manifest"]
+    try:
+        raw = await get_async_redis().hgetall(INDEX_MANIFEST_PREFIX + version)
+    except Exception as e:
+        print(f"⚠️ 색인 매니페스트 조회 실패: {e}")
+        return None
+    return _remember_manifest(version, raw)
+
+def _rows_in_manifest(rows: list, manifest: Optional[dict]) -> list:
+    if manifest is None: return rows
+    return [row for row in rows
+            if manifest.get(row.get("page_id")) == str((row.get("metadata") or {}).get("index_version") or "0")]
+
+def filter_active_rows(rows: list, version: str = None) -> list:
+    """활성 색인 버전에 속한 site_pages 행만 남깁니다. (빌드 중인 새 행 / 교체된 옛 행 제외)"""
+    return _rows_in_manifest(rows, get_index_manifest(version))
+
+async def filter_active_rows_async(rows: list, version: str = None) -> list:
+    return _rows_in_manifest(rows, await get_index_manifest_async(version))
+
+def inactive_row_count() -> int:
+    """site_pages에 있지만 활성 버전이 아닌 행 수 (빌드 중에 쓴 새 행 + 정리 전의 옛 행)"""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(INDEX_PENDING_ROWS_KEY)
+        pipe.zcard(INDEX_RETIRED_KEY)
+        pending, retired = pipe.execute()
+        return int(pending or 0) + int(retired or 0)
+    except Exception:
+        return 0
+
+def overfetch_count(match_count: int) -> int:
+    """
+    RPC(match_documents)는 버전을 모른 채 상위 match_count건을 자르고, 비활성 행은 그 뒤에 버려집니다.
+    전체 재색인 중에는 행이 거의 두 배가 되므로 비활성 행 비율만큼 더 가져옵니다. (최대 INDEX_OVERFETCH_MAX배)
+    """
+    inactive = inactive_row_count()
+    if not inactive: return match_count
+    manifest = get_index_manifest()
+    factor = (len(manifest) + inactive) / len(manifest) if manifest else INDEX_OVERFETCH_MAX
+    return int(match_count * min(factor, INDEX_OVERFETCH_MAX))
+
+# [색인기 상태] 데몬이 회차마다 기록하고, API(/admin/indexer_status)와 데몬의 /status가 읽습니다.
+INDEXER_STATUS_KEY = "indexer:status"
+
+def update_indexer_status(**fields):
     try:
+        redis_client.hset(INDEXER_STATUS_KEY, mapping={k: json.dumps(v, ensure_ascii=False) for k, v in fields.items()})
+    except Exception as e:
+        print(f"⚠️ 색인기 상태 기록 실패: {e}")
+
+def get_indexer_status() -> dict:
+    """
+    색인기 상태 + 지연(lag_seconds: 가장 오래된 DB 커서 이후 흐른 시간 = 반영이 늦을 수 있는 최대 시간)
+    """
+    try:
+        raw = redis_client.hgetall(INDEXER_STATUS_KEY)
+    except Exception as e:
+        return {"state": "unknown", "error": str(e)}
+    status = {k.decode('utf-8'): json.loads(v) for k, v in raw.items()}
+    now = time.time()
+    if status.get("oldest_cursor"):
+        try:
+            cursor = datetime.fromisoformat(status["oldest_cursor"]).timestamp()
+            status["lag_seconds"] = round(now - cursor, 1)
+        except ValueError: pass
+    if status.get("last_success_at"):
+        status["seconds_since_success"] = round(now - status["last_success_at"], 1)
+    status["index_version"] = get_index_version()
+    return status
+
+def answer_cache_key(question: str, version: str = None) -> str:
+    question_hash = hashlib.md5(normalize_question(question).encode('utf-8')).hexdigest()
+    return f"{MAIN_ANSWER_CACHE_KEY}:v{version or get_index_version()}:{question_hash}"
+
+def get_cached_answer(question: str) -> Optional[dict]:
+    try:
+        cached = redis_client.get(answer_cache_key(question))
+        record_cache("main_answer", bool(cached))
+        if cached: return json.loads(cached.decode('utf-8'))
+    except Exception: pass
+    return None
+
+async def get_cached_answer_async(question: str) -> Optional[dict]:
+    try:
+        key = answer_cache_key(question, await get_index_version_async())
+        cached = await get_async_redis().get(key)
+        record_cache("main_answer", bool(cached))
+        if cached: return json.loads(cached.decode('utf-8'))
+    except Exception: pass
+    return None
+
+def save_cached_answer(question: str, result: dict):
+    try:
+        redis_client.set(answer_cache_key(question), json.dumps(result).encode('utf-8'), ex=MAIN_ANSWER_CACHE_TTL)
+    except Exception as e:
+        print(f"⚠️ 답변 캐시 저장 실패: {e}")
+
+EMBEDDING_MODEL = 'text-embedding-004'
+
+def get_gemini_embedding(text: str, task_type: str = "SEMANTIC_SIMILARITY", limiter=None) -> Optional[List[float]]:
+    """limiter(TokenBucket)를 주면 API 호출 직전에 토큰을 받아 호출 속도를 제한합니다."""
+    genai = get_genai()
+    if not genai: return None
+    if embedding_cache:
+        cached = embedding_cache.get(EMBEDDING_MODEL, task_type, text)
+        if cached: return cached
+    try:
+        if limiter: limiter.acquire()
         result = genai.embed_content(
-            model='text-embedding-004', 
+            model=EMBEDDING_MODEL, 
             content=text,
             task_type=task_type 
         )
-        return result['embedding']
+        embedding = result['embedding']
+        if embedding_cache: embedding_cache.set(EMBEDDING_MODEL, task_type, text, embedding)
+        return embedding
     except Exception as e:
         print(f"❌ Embed API 오류: {e}")
         return None
 
+# [배치 임베딩] batchEmbedContents는 요청 1회에 최대 100개까지 받습니다.
+EMBED_BATCH_LIMIT = int(os.getenv("EMBED_BATCH_LIMIT", "100"))
+EMBED_BATCH_RETRIES = 3
+
+def get_gemini_embeddings_batch(texts: List[str], task_type: str = "SEMANTIC_SIMILARITY", limiter=None) -> List[Optional[List[float]]]:
+    """
+    여러 텍스트를 EMBED_BATCH_LIMIT개씩 묶어 한 번의 요청으로 임베딩합니다.
+    - 결과는 입력과 같은 순서이며, 끝내 실패한 항목만 None입니다.
+    - 임베딩 캐시에 있는 텍스트와 중복 텍스트는 API로 보내지 않습니다.
+    - 묶음 요청이 실패하면 잠시 후 다시 시도하고, 그래도 안 되면 그 묶음만 한 건씩 나눠 다시 시도합니다.
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    genai = get_genai()
+    if not genai or not texts: return results
+
+    if embedding_cache:
+        results = embedding_cache.get_many(EMBEDDING_MODEL, task_type, texts)
+    pending = list(dict.fromkeys(text for text, embedding in zip(texts, results) if not embedding))
+
+    fetched = {}
+    for start in range(0, len(pending), EMBED_BATCH_LIMIT):
+        chunk = pending[start:start + EMBED_BATCH_LIMIT]
+        embeddings = None
+        for attempt in range(EMBED_BATCH_RETRIES):
+            try:
+                if limiter: limiter.acquire()
+                response = genai.embed_content(model=EMBEDDING_MODEL, content=chunk, task_type=task_type)
+                embeddings = response['embedding']
+                if len(embeddings) != len(chunk):
+                    raise ValueError(f"응답 개수 불일치: {len(embeddings)} != {len(chunk)}")
+                if embedding_cache: embedding_cache.set_many(EMBEDDING_MODEL, task_type, chunk, embeddings)
+                break
+            except Exception as e:
+                embeddings = None
+                print(f"⚠️ 배치 임베딩 실패 ({attempt + 1}/{EMBED_BATCH_RETRIES}, {len(chunk)}건): {e}")
+                if attempt + 1 < EMBED_BATCH_RETRIES:
+                    LLM_RETRIES.inc(kind="embed_batch")
+                    time.sleep(2 ** attempt)
+
+        if embeddings is None:
+            # 묶음 전체가 계속 실패하면 문제 항목만 걸러지도록 한 건씩 다시 시도
+            embeddings = [get_gemini_embedding(text, task_type=task_type, limiter=limiter) for text in chunk]
+        fetched.update(zip(chunk, embeddings))
+
+    return [embedding or fetched.get(text) for text, embedding in zip(texts, results)]
+
+def _count_llm_retry(retry_state):
+    """tenacity before_sleep 훅: 실제로 다시 시도할 때만 재시도 횟수를 셉니다. (마지막 실패는 세지 않음)"""
+    LLM_RETRIES.inc(kind="generate")
+
 # [수정] Gemini API 호출에 안전장치(Decorator) 달기
 # 1초 -> 2초 -> 4초 대기 후 재시도 (총 3번 시도)
 @retry(
     stop=stop_after_attempt(3), 
     wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type(Exception)
+    retry=retry_if_exception_type(Exception),
+    before_sleep=_count_llm_retry
 )
 # [수정] timeout 기본값을 15 -> 30으로 변경
 def generate_content_safe(model, prompt, timeout=120, **kwargs): 
-    """안전한 Gemini 호출 래퍼 함수"""
+    """안전한 Gemini 호출 래퍼 함수 (시도마다 소요시간, 실패 시 재시도 횟수를 기록)"""
+    started = time.perf_counter()
     try:
-        return model.generate_content(
+        response = model.generate_content(
             prompt, 
             request_options={"timeout": timeout},
             **kwargs 
         )
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, kind="generate", outcome="ok")
+        return response
     except Exception as e:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, kind="generate", outcome="error")
         print(f"⚠️ API 호출 실패 (재시도 중...): {e}")
         raise e
 
-def extract_info_from_question(question: str, chat_history: list[dict] = []) -> dict:
-    history_formatted = "(이전 대화 없음)"
-    if chat_history:
-        recent_history = chat_history[-6:]
-        history_formatted = "\n".join([f"  - {t['role']}: {t['content']}" for t in recent_history])
-
-    cache_key = None
-    if not chat_history:
-        question_hash = hashlib.md5(question.encode('utf-8')).hexdigest()
-        cache_key = f"extract_v2:{question_hash}"
-        try:
-            cached = redis_client.get(cache_key)
-            if cached: return json.loads(cached.decode('utf-8'))
-        except Exception: pass
+@retry(
+    stop=stop_after_attempt(3), 
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception_type(Exception),
+    before_sleep=_count_llm_retry
+)
+async def generate_content_safe_async(model, prompt, timeout=120, **kwargs):
+    """generate_content_safe의 비동기 버전 (model: gemini_async.AsyncGeminiModel, 재시도 대기도 비동기)"""
+    started = time.perf_counter()
+    try:
+        response = await model.generate_content(prompt, request_options={"timeout": timeout}, **kwargs)
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, kind="generate", outcome="ok")
+        return response
+    except Exception as e:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, kind="generate", outcome="error")
+        print(f"⚠️ API 호출 실패 (재시도 중...): {e}")
+        raise e
 
-    if not LLM_MODEL: return {"error": "Gemini 모델 로드 실패"}
+def _extract_cache_key(question: str, chat_history: list) -> Optional[str]:
+    """이전 대화가 없는 질문만 의도 분석 결과를 캐시합니다."""
+    if chat_history: return None
+    return f"extract_v2:{hashlib.md5(question.encode('utf-8')).hexdigest()}"
 
+def _build_extract_prompt(question: str, chat_history: list) -> str:
     # 2. 히스토리 요약 (최근 3개만)
     recent_history = chat_history[-3:] 
     history_str = "\n".join([f"{t['role']}: {t['content']}" for t in recent_history]) if recent_history else "None"
@@ -188,46 +591,77 @@ def extract_info_from_question(question: str, chat_history: list[dict] = []) ->
         "keywords": ["바우처", "신청"]
     }}
     """
-    try:
-        safety_settings=[ {"category": c, "threshold": "BLOCK_NONE"} for c in ["HARM_CATEGORY_HARASSMENT", "HARM_CATEGORY_HATE_SPEECH", "HARM_CATEGORY_SEXUALLY_EXPLICIT", "HARM_CATEGORY_DANGEROUS_CONTENT"]]
+    return prompt
+
+def _parse_extract_response(response_text: str) -> dict:
+    json_block_start = response_text.find('{')
+    json_block_end = response_text.rfind('}') + 1
+    
+    if json_block_start != -1 and json_block_end != -1:
+        # JSON 파싱
+        json_string = response_text[json_block_start:json_block_end]
+        default_info = {"age": None, "category": None, "sub_category": None, "intent": None, "keywords": None}
+        extracted_info = json.loads(json_string)
+        default_info.update(extracted_info)
+         
+        has_other_criteria = default_info.get("age") is not None or default_info.get("sub_category") is not None
         
+        if has_other_criteria and default_info.get("category") is None and default_info.get("intent") is None and not default_info.get("keywords"): 
+            default_info["intent"] = "clarify_category"
+        return default_info
+    return {"error": "Gemini 응답 JSON 없음"}
+
+def extract_info_from_question(question: str, chat_history: list[dict] = []) -> dict:
+    cache_key = _extract_cache_key(question, chat_history)
+    if cache_key:
+        try:
+            cached = redis_client.get(cache_key)
+            record_cache("extract", bool(cached))
+            if cached: return json.loads(cached.decode('utf-8'))
+        except Exception: pass
+
+    llm_model = get_llm_model()
+    if not llm_model: return {"error": "Gemini 모델 로드 실패"}
+    prompt = _build_extract_prompt(question, chat_history)
+    try:
         # 앞서 추가한 generate_content_safe 함수 사용
-        response = generate_content_safe(LLM_MODEL, prompt, timeout=15)
+        response = generate_content_safe(llm_model, prompt, timeout=15)
         response.resolve()
-        
-        response_text = response.text
-        json_block_start = response_text.find('{')
-        json_block_end = response_text.rfind('}') + 1
-        
-        if json_block_start != -1 and json_block_end != -1:
-             # JSON 파싱
-            json_string = response_text[json_block_start:json_block_end]
-            default_info = {"age": None, "category": None, "sub_category": None, "intent": None, "keywords": None}
-            extracted_info = json.loads(json_string)
-            default_info.update(extracted_info)
-             
-            has_other_criteria = default_info.get("age") is not None or default_info.get("sub_category") is not None
-            
-            # [수정 2] if 문 아래 들여쓰기 수정
-            if has_other_criteria and default_info.get("category") is None and default_info.get("intent") is None and not default_info.get("keywords"): 
-                default_info["intent"] = "clarify_category"
-
-            # [수정 3] 캐시 저장 로직 들여쓰기 맞춤
-            if cache_key:
-                try:
-                     redis_client.set(cache_key, json.dumps(default_info).encode('utf-8'))
-                except Exception: pass
-                 
-            return default_info
-        
-        else: 
-             return {"error": "Gemini 응답 JSON 없음"}
-             
-    # [수정 4] try와 짝이 맞는 except 위치
+        info = _parse_extract_response(response.text)
+        if cache_key and not info.get("error"):
+            try:
+                redis_client.set(cache_key, json.dumps(info).encode('utf-8'))
+            except Exception: pass
+        return info
     except Exception as e: 
         return {"error": f"질문 분석 중 오류: {e}"}
 
-def summarize_content_with_llm(context: str, original_question: str, chat_history: list[dict] = []) -> str:
+async def extract_info_from_question_async(question: str, chat_history: list[dict] = []) -> dict:
+    """extract_info_from_question의 비동기 버전 (API 요청 경로용, 대기 중 스레드를 잡지 않음)"""
+    cache_key = _extract_cache_key(question, chat_history)
+    redis_async = get_async_redis()
+    if cache_key:
+        try:
+            cached = await redis_async.get(cache_key)
+            record_cache("extract", bool(cached))
+            if cached: return json.loads(cached.decode('utf-8'))
+        except Exception: pass
+
+    llm_model = get_async_llm_model()
+    if not llm_model: return {"error": "Gemini 모델 로드 실패"}
+    prompt = _build_extract_prompt(question, chat_history)
+    try:
+        response = await generate_content_safe_async(llm_model, prompt, timeout=15)
+        info = _parse_extract_response(response.text)
+        if cache_key and not info.get("error"):
+            try:
+                await redis_async.set(cache_key, json.dumps(info).encode('utf-8'))
+            except Exception: pass
+        return info
+    except Exception as e: 
+        return {"error": f"질문 분석 중 오류: {e}"}
+
+def summarize_content_with_llm(context: str, original_question: str, chat_history: list[dict] = [], limiter=None) -> str:
     if not context: return ""
     
     # [버전 업] v11 (불렛 스타일 적용)
@@ -236,10 +670,12 @@ def summarize_content_with_llm(context: str, original_question: str, chat_histor
     
     try:
         cached = redis_client.get(cache_key)
+        record_cache("summary", bool(cached))
         if cached: return cached.decode('utf-8')
     except Exception: pass
 
-    if not LLM_MODEL: return "Gemini 모델 로드 실패"
+    llm_model = get_llm_model()
+    if not llm_model: return "Gemini 모델 로드 실패"
 
     prompt = f"""
     # 사용자 원본 질문: "{original_question}"
@@ -298,10 +734,13 @@ def summarize_content_with_llm(context: str, original_question: str, chat_histor
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
         ]
 
+        # 캐시에 없을 때만 실제 API를 부르므로, 속도 제한도 여기서만 적용합니다.
+        if limiter: limiter.acquire()
+
         # [수정] safety_settings를 인자로 전달!
         # 이제 generate_content_safe가 **kwargs로 받아서 처리해 줄 거야.
         response = generate_content_safe(
-            LLM_MODEL, 
+            llm_model, 
             prompt, 
             timeout=20, 
             safety_settings=safety_settings # <--- 여기 추가!
@@ -333,19 +772,6 @@ def expand_search_query(question: str) -> list:
     # 특수문자 제거
     clean_question = re.sub(r'[^\w\s]', '', question) 
     
-    # [업그레이드] 한국어 문장형 질문에서 자주 나오는 불필요한 단어들
-    STOP_WORDS = [
-        # 의문사/요청
-        "있어", "있니", "있나요", "어디", "어디야", "알려줘", "해줘", "궁금해", 
-        "무엇", "뭐야", "대한", "관한", "관련", "알고", "싶어", "해요", "되나요",
-        "나와", "저기", "그거", "이거", "요", "좀", "수", "것", "등", "및", "자세히",
-        # 서술어/어미 (로그에서 발견된 노이즈)
-        "하는", "있는", "좋을", "같다고", "하셨는데", "하셨습니다", "가야하는지",
-        "받아보는", "의심된다고", "같습니다", "합니다", "입니다",
-        # 호칭/주어 (검색에 방해됨)
-        "선생님께서", "섲ㄴ생님꼐서", "어린이집에서", "아이를", "아이가", "키우고", "우리", "제가"
-    ]
-    
     # 사용자 입력 단어 1차 필터링
     raw_tokens = clean_question.split()
     refined_user_keywords = [
@@ -372,7 +798,8 @@ def expand_search_query(question: str) -> list:
     # ---------------------------------------------------------
     
     ai_keywords = []
-    if LLM_MODEL:
+    llm_model = get_llm_model()
+    if llm_model:
         prompt = f"""
         사용자가 복지 정보를 찾고 있습니다. 검색을 위한 핵심 키워드 5개를 추출하세요.
         
@@ -395,7 +822,7 @@ def expand_search_query(question: str) -> list:
         """
         try:
             # 타임아웃 60초 (넉넉하게)
-            response = generate_content_safe(LLM_MODEL, prompt, timeout=60)
+            response = generate_content_safe(llm_model, prompt, timeout=60)
             ai_keywords = [k.strip() for k in response.text.strip().split(',')]
             print(f"⚡️ [AI 확장] {ai_keywords}")
         except Exception as e:
@@ -410,157 +837,70 @@ def expand_search_query(question: str) -> list:
     # 마지막 안전장치: 2글자 미만이나 불용어가 혹시라도 섞여있으면 제거
     return [k for k in final_keywords if len(k) >= 2 and k not in STOP_WORDS]
 
-def rerank_search_results(question: str, candidates: list) -> list:
-    if not candidates or not LLM_MODEL: return candidates
-
-    rerank_candidates = candidates[:10] 
-    remaining_candidates = candidates[10:]
-
-    candidate_texts = []
-    for i, doc in enumerate(rerank_candidates):
-        meta = doc.get("metadata", {})
-        title = meta.get("title", "")
-        # [최적화] 1500자 제한
-        content_preview = doc.get("content", "")[:1500].replace("\n", " ")
-        candidate_texts.append(f"[{i}] {title} (내용: {content_preview})")
-
-    candidates_str = "\n".join(candidate_texts)
-
-    prompt = f"""
-    사용자 질문: "{question}"
-    아래 후보 목록에서 질문에 가장 적합한 복지 서비스를 골라 순서대로 나열하세요.
-    
-    [★★심사 기준 - 시나리오별 엄격 적용★★]
-    
-    0. **[가산점] 우선 추천 표식:**
-       - 후보 문서 제목에 **"★(우선추천)"**이 있다면, 시스템이 키워드 매칭으로 찾은 유력 후보입니다.
-       - **이 문서가 질문의 의도와 일치한다면 최우선 순위로 배치하세요.**
-       - 단, 질문 내용과 전혀 맞지 않는다면(예: '학교 검사'를 묻는데 '의료비'가 추천된 경우) 무시해도 됩니다.
-
-    # CASE A. 사용자가 '검사', '진단', '판별'을 물어본 경우:
-    1. **[강제 매핑] '장애 검사' = '영유아 발달 정밀 검사':**
-       - 사용자가 "장애 검사"라고 묻는 것은 90% 이상 **'영유아 발달 정밀검사비 지원'**을 찾는 것입니다.
-       - 따라서 **'영유아 발달 정밀검사비 지원'** 문서를 발견하면 **무조건 1순위**로 올리세요.
-       - 그 다음으로 **'장애인 등록 진단서 발급비 지원'**을 2순위로 배치하세요.
-
-    2. **[절대 제외] 특수교육/학교/선별검사:**
-       - 질문에 "학교", "입학", "교육청"이라는 단어가 **명시적으로 없다면**,
-       - **'특수교육대상자 선정'**, **'장애선별검사(교육청)'**, **'배치'** 관련 문서는 **결과에서 아예 삭제(제외)하세요.**
-       - (이유: 이것은 병원 진단이 아니라 학교 행정 절차이므로, 일반적인 '검사' 질문의 정답이 아닙니다.)
-
-    3. **[예외] 특정 질환:**
-       - "난청", "대사이상" 등 구체적 병명이 질문에 있을 때만 해당 질환 검사를 1순위로 하세요.
-
-    # CASE B. 사용자가 '짝치료', '그룹치료', '사회성'을 물어본 경우:
-    1. **[동의어 매핑]** "짝치료"와 "그룹치료"는 **"두리활동"**, **"사회성 향상 프로그램"**과 같은 의미입니다.
-    2. **[정확도]** 제목이나 내용에 **"두리", "짝", "그룹", "사회성"**이 포함된 구체적인 프로그램 문서를 1순위로 선택하세요.
-    3. **[제외]** 단순 "놀이치료", "베이비 마사지", "부모 상담" 등은 짝치료가 아니므로 순위를 내리세요.
-
-    # CASE C. '기관/장소' 지정 질문 시:
-       - 질문에 "부모회", "보건소", "복지관" 등 특정 운영 기관이 언급되었다면,
-       - 제목뿐만 아니라 **'내용(문의처)'에 해당 기관명이 포함된 문서**를 1순위로 올리세요.
-
-    # CASE D. 공통 필터링 규칙:
-    1. **나이/조건:** 대상 연령이나 자격 요건이 질문과 맞지 않으면 과감하게 제외하세요.
-    2. **관련성 Cut-off:** 질문과 전혀 관련 없는 문서는 순위 번호를 적지 말고 아예 제외하세요.
-    3. **내용 확인:** 제목뿐만 아니라 '내용(content)'도 반드시 확인하여 판단하세요.
-
-    
-    [후보 목록]
-    {candidates_str}
-    
-    [작성 규칙]
-    - 가장 적합한 문서의 번호 **3개**만 쉼표로 구분해 적으세요.
-    """
-    if not candidates or not LLM_MODEL:
-        return candidates
-
-    # [전략 수정] 50개는 너무 많습니다. Supabase가 찾아준 상위 10개만 봅니다.
-    # (하이브리드 검색 덕분에 10등 안에 정답이 있을 확률이 매우 높습니다.)
-    rerank_candidates = candidates[:10] 
-    remaining_candidates = candidates[10:]
-
-    candidate_texts = []
-    for i, doc in enumerate(rerank_candidates):
-        meta = doc.get("metadata", {})
-        title = meta.get("title", "")
-        # [핵심] 원본 내용을 자르지 않고 (거의) 다 보냅니다.
-        # 2000자면 대부분의 Notion 페이지 전체가 들어갑니다. '짝치료' 같은 세부 단어를 놓치지 않습니다.
-        raw_content = doc.get("content", "")[:1500].replace("\n", " ")
-        candidate_texts.append(f"[{i}] 제목: {title} | 내용: {raw_content}")
-
-    candidates_str = "\n".join(candidate_texts)
-
-    # 2. 랭킹 프롬프트 (기존과 동일)
-    prompt = f"""
-    사용자 질문: "{question}"
-    
-    위 질문에 가장 적합한 복지 서비스를 아래 후보 목록에서 찾아, 적합한 순서대로 [번호]를 나열하세요.
-    
-    [★★통합 랭킹 심사 기준★★]
-    1. **키워드 우선:** 질문의 핵심 단어(검사, 진단서 등)가 제목에 포함된 것을 우선하세요. 질문의 핵심 단어(짝치료, 언어치료 등)가 포함된 문서는 최우선 순위입니다.
-    2. **[중요] 문맥 구분 (검사/치료):**
-       - 질문이 "특수교육", "학교" 언급 없이 단순 "**장애 검사**", "**치료**"라면 -> **병원/행정(의료비, 바우처, 검사비 지원)** 사업을 학교(특수교육)보다 우선하세요.
-       - 질문이 '검사'일 때, 직접적인 검사뿐만 아니라 **'비용 지원(발달검사비 지원)'**도 매우 중요한 정답입니다. **반드시 상위 3위 안에 포함**시키세요.
-       - "선천성 대사이상", "난청" 같은 특정 질환은 질문에 해당 병명이 없으면 후순위입니다. 일반적인 "발달 검사"나 "장애 진단"을 우선하세요.
-       - **"심리 상담", "양육 상담", "부모 교육", "돌봄 서비스"는 검사가 아닙니다.** - 질문이 명확히 검사를 요구한다면, 상담/돌봄 문서는 순위를 낮추거나 제외하세요.
-    3. **의미 매칭:** 질문의 단어가 정확히 없더라도 의미가 통하면 정답입니다.
-    4. **유사 서비스 주의:** "놀이치료"와 "짝치료"는 다릅니다. "베이비 마사지"와 같은 단순 프로그램은 '검사'가 아닙니다. 제외하세요.
-    5. **나이/조건 필터링:** 대상 연령이나 자격 요건이 맞지 않으면 순위를 내리세요.
-    6. **내용 확인:** 제목뿐만 아니라 '내용' 필드도 확인하세요.
-    7. **정확도:** 질문의 키워드(검사, 비용 등)가 제목에 포함된 것을 우선하세요.
-    8. **'짝치료/그룹치료' 질문 시**
-       - 이 질문은 **'사회성 향상'**이나 **'또래'**, **'두리활동'** 프로그램을 찾는 질문입니다.
-       - 제목이나 내용에 **'두리', '짝', '그룹', '사회성'**이 포함된 문서를 무조건 1순위로 올리세요.
-       - 단순 상담이나 부모 교육은 후순위 입니다.
-    
-    [후보 목록]
-    {candidates_str}
-    
-    [작성 규칙]
-    - 가장 적합한 후보의 번호 **5개**를 쉼표로 구분하여 적으세요.
-    - 예시: 3, 10, 1, 5, 2
-    """
-
-    try:
-        response = generate_content_safe(LLM_MODEL, prompt, timeout=60)
-        raw_indices = [int(s) for s in re.findall(r'\b\d+\b', response.text.strip())]
-        
-        final_results = []
-        seen = set()
-        
-        for idx in raw_indices:
-            if idx not in seen and 0 <= idx < len(rerank_candidates):
-                final_results.append(rerank_candidates[idx])
-                seen.add(idx)
-            
-        for i, doc in enumerate(rerank_candidates):
-            if i not in seen: final_results.append(doc)
-        
-        final_results.extend(remaining_candidates)
-        return final_results
-
-    except Exception as e:
-        print(f"⚠️ 랭킹 실패: {e}")
-        return candidates
-    
 # [utils.py] 파일 맨 아래에 추가
 
 # --- 7. [신규] '더 보기' 및 포맷팅 헬퍼 함수 ---
 
 def get_supabase_pages_by_ids(page_ids: list) -> list:
     """ID 목록으로 Supabase 데이터 조회"""
+    supabase = get_supabase()
     if not page_ids or not supabase: return []
     try:
         response = supabase.table("site_pages").select("*").in_("page_id", page_ids).execute()
         
-        # 중복 제거 및 정렬
-        unique_pages = {item['page_id']: item['metadata'] for item in response.data}
+        # 중복 제거 및 정렬 (빌드 중이거나 교체된 다른 버전의 행은 제외)
+        unique_pages = {item['page_id']: item['metadata'] for item in filter_active_rows(response.data)}
+        return [unique_pages[pid] for pid in page_ids if pid in unique_pages]
+    except Exception as e:
+        print(f"❌ Supabase 조회 오류: {e}")
+        return []
+
+async def get_supabase_pages_by_ids_async(page_ids: list) -> list:
+    supabase = get_async_supabase()
+    if not page_ids or not supabase: return []
+    try:
+        response = await supabase.table("site_pages").select("*").in_("page_id", page_ids).execute()
+        unique_pages = {item['page_id']: item['metadata'] for item in await filter_active_rows_async(response.data)}
         return [unique_pages[pid] for pid in page_ids if pid in unique_pages]
     except Exception as e:
         print(f"❌ Supabase 조회 오류: {e}")
         return []
 
+SHOW_MORE_PAGE_SIZE = 2
+
+def show_more_target_ids(last_result_ids: list, shown_count: int) -> list:
+    return last_result_ids[shown_count:shown_count + SHOW_MORE_PAGE_SIZE]
+
+def build_show_more_result(last_result_ids: list, shown_count: int, pages: list) -> dict:
+    """'더 보기' 응답 (API와 워커 공용). pages는 show_more_target_ids로 조회한 문서 메타데이터입니다."""
+    start, end = shown_count, shown_count + SHOW_MORE_PAGE_SIZE
+    if not show_more_target_ids(last_result_ids, shown_count):
+        return {
+            "status": "complete", 
+            "answer": "더 이상 표시할 결과가 없습니다.", 
+            "last_result_ids": last_result_ids, 
+            "total_found": len(last_result_ids),
+            "shown_count": shown_count
+        }
+
+    formatted_body = format_search_results(pages)
+    header = f"🔎 **추가 정보 ({start+1}~{start+len(pages)}번째)**"
+    answer_text = f"{header}\n\n<hr>\n\n{formatted_body}"
+    
+    remaining = len(last_result_ids) - end
+    if remaining > 0:
+        answer_text += f"\n\n<hr>\n\n🔍 **아직 결과가 더 남아있습니다.**\n'더 보여줘' 또는 '다음'을 입력해 보세요."
+    else:
+        answer_text += "\n\n<hr>\n\n✅ **모든 결과를 확인했습니다.**"
+
+    return {
+        "status": "complete", 
+        "answer": answer_text, 
+        "last_result_ids": last_result_ids,
+        "total_found": len(last_result_ids),
+        "shown_count": end 
+    }
+
 # --- 8. 포맷팅 함수 ---
 
 def clean_summary_text(text: str) -> str:
@@ -636,42 +976,118 @@ def format_search_results(pages_metadata: list) -> str:
     return "\n\n<hr>\n\n".join(cards)
 
 # --- 9. 의미 기반 캐시 (Semantic Cache) 함수 ---
-
-def check_semantic_cache(query_embedding: list) -> str | None:
+# chat_cache 테이블을 주기적으로 메모리(LocalVectorIndex)에 불러와 두고,
+# 조회는 Supabase RPC 왕복 없이 프로세스 안에서 내적 한 번으로 끝냅니다.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# 임계값을 넘은 후보 중 색인 버전/검색 조건이 맞는 것을 찾을 때 살펴볼 개수
+SEMANTIC_CACHE_CANDIDATES = 5
+SEMANTIC_CACHE_SYNC_INTERVAL = int(os.getenv("SEMANTIC_CACHE_SYNC_INTERVAL", "300"))
+SEMANTIC_CACHE_PAGE_SIZE = 1000
+
+semantic_cache_index = LocalVectorIndex()
+_semantic_cache_synced_at = 0.0
+_semantic_cache_sync_lock = threading.Lock()
+
+def _parse_embedding(value) -> Optional[List[float]]:
+    """pgvector 컬럼은 '[0.1,0.2,...]' 문자열로 올 수 있습니다."""
+    if isinstance(value, str):
+        try: value = json.loads(value)
+        except Exception: return None
+    return value if value else None
+
+def _decode_cached_answer(raw: str) -> dict:
     """
-    Supabase에서 의미가 유사한(0.92 이상) 질문이 있었는지 확인하고,
-    있다면 저장된 답변을 반환합니다.
+    chat_cache.answer 는 작업 결과 JSON(색인 버전 포함)으로 저장합니다.
+    예전 형식(답변 텍스트만 저장)도 읽을 수 있습니다.
     """
     try:
-        # [★수정★] 기준을 0.92 -> 0.98로 대폭 상향합니다.
-        # 0.98 이상이어야만 '같은 질문'으로 인정하고 캐시를 반환합니다.
-        response = supabase.rpc(
-            "match_chat_cache",
-            {
-                "query_embedding": query_embedding,
-                "match_threshold": 0.92, # <--- 여기를 수정하세요!
-                "match_count": 1
-            }
-        ).execute()
-        
-        if response.data and len(response.data) > 0:
-            cached_answer = response.data[0]['answer']
-            print(f"♻️ [Semantic Cache] 의미가 같은 질문 발견! (유사도: {response.data[0]['similarity']:.4f})")
-            return cached_answer
-            
+        data = json.loads(raw)
+        if isinstance(data, dict) and "answer" in data: return data
+    except Exception: pass
+    return {"status": "complete", "answer": raw, "last_result_ids": [], "total_found": 0}
+
+def sync_semantic_cache() -> int:
+    """chat_cache 테이블 전체를 읽어 로컬 벡터 인덱스를 교체합니다. 불러온 건수를 반환합니다."""
+    global _semantic_cache_synced_at
+    supabase = get_supabase()
+    if not supabase: return 0
+
+    vectors, payloads = [], []
+    start = 0
+    while True:
+        response = supabase.table("chat_cache").select("question, answer, embedding") \
+            .range(start, start + SEMANTIC_CACHE_PAGE_SIZE - 1).execute()
+        rows = response.data or []
+        for row in rows:
+            embedding = _parse_embedding(row.get("embedding"))
+            if not embedding or not row.get("answer"): continue
+            vectors.append(embedding)
+            payloads.append({"question": row.get("question"), "result": _decode_cached_answer(row["answer"])})
+        if len(rows) < SEMANTIC_CACHE_PAGE_SIZE: break
+        start += SEMANTIC_CACHE_PAGE_SIZE
+
+    semantic_cache_index.replace(vectors, payloads)
+    _semantic_cache_synced_at = time.time()
+    print(f"♻️ [Semantic Cache] 로컬 인덱스 동기화 완료 ({len(payloads)}건)")
+    return len(payloads)
+
+def _sync_semantic_cache_safely():
+    if not _semantic_cache_sync_lock.acquire(blocking=False): return
+    try:
+        sync_semantic_cache()
+    except Exception as e:
+        print(f"⚠️ 캐시 동기화 오류: {e}")
+    finally:
+        _semantic_cache_sync_lock.release()
+
+def _maybe_sync_semantic_cache():
+    """처음에는 바로 동기화하고, 이후에는 주기가 지나면 백그라운드에서 갱신합니다."""
+    if not _semantic_cache_synced_at:
+        _sync_semantic_cache_safely()
+    elif time.time() - _semantic_cache_synced_at > SEMANTIC_CACHE_SYNC_INTERVAL:
+        threading.Thread(target=_sync_semantic_cache_safely, daemon=True).start()
+
+def check_semantic_cache(query_embedding: list, search_filter: dict = None) -> Optional[dict]:
+    """
+    의미가 유사한(SEMANTIC_CACHE_THRESHOLD 이상) 질문이 있었는지 확인하고,
+    있다면 저장된 작업 결과(dict)를 반환합니다.
+    현재 색인 버전이고 검색 조건(search_filters.build_search_filter)이 같은 결과만 인정합니다.
+    ('18개월 언어치료'와 '36개월 언어치료'처럼 연령/대상만 다른 질문은 서로의 답을 쓰지 않음)
+    """
+    try:
+        _maybe_sync_semantic_cache()
+        version = get_index_version()
+        similarity, result, payload = None, None, None
+        for similarity, payload in semantic_cache_index.search(query_embedding, k=SEMANTIC_CACHE_CANDIDATES,
+                                                               threshold=SEMANTIC_CACHE_THRESHOLD):
+            candidate = dict(payload["result"])
+            if candidate.pop("index_version", None) != version: continue
+            if candidate.pop("search_filter", None) != search_filter: continue
+            result = candidate
+            break
+        hit = result is not None
+        record_cache("semantic", hit)
+        if not hit: return None
+
+        print(f"♻️ [Semantic Cache] 의미가 같은 질문 발견! ('{payload['question']}', 유사도: {similarity:.4f})")
+        return result
     except Exception as e:
         print(f"⚠️ 캐시 확인 중 오류: {e}")
-    
     return None
 
-def save_semantic_cache(question: str, answer: str, embedding: list):
+def save_semantic_cache(question: str, result: dict, embedding: list, search_filter: dict = None):
     """
-    새로운 질문과 답변, 벡터를 Supabase 캐시 테이블에 저장합니다.
+    새로운 질문과 작업 결과, 벡터를 Supabase 캐시 테이블과 로컬 인덱스에 저장합니다.
+    검색 조건(search_filter)도 함께 저장해, 조건이 같은 질문에만 재사용합니다.
     """
     try:
+        stored = dict(result, index_version=get_index_version(), search_filter=search_filter)
+        semantic_cache_index.add(embedding, {"question": question, "result": stored})
+        supabase = get_supabase()
+        if not supabase: return
         data = {
             "question": question,
-            "answer": answer,
+            "answer": json.dumps(stored, ensure_ascii=False),
             "embedding": embedding
         }
         supabase.table("chat_cache").insert(data).execute()
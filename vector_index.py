@@ -0,0 +1,64 @@
+# vector_index.py (인메모리 벡터 인덱스)
+"""
+정규화된 임베딩을 연속된 float32 NumPy 행렬로 보관하고,
+질의 벡터와의 내적(= 코사인 유사도)으로 전수 검색합니다.
+
+수백~수만 건 규모에서는 행렬-벡터 곱 한 번이면 되므로 1ms 안팎으로 끝납니다.
+"""
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+class LocalVectorIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._payloads: List[Any] = []
+
+    def __len__(self):
+        return len(self._payloads)
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        """벡터(또는 벡터 목록)를 L2 정규화한 2차원 float32 행렬로 바꿉니다."""
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def replace(self, vectors: Sequence[Sequence[float]], payloads: Sequence[Any]):
+        """인덱스 전체를 새 데이터로 교체합니다. (새 행렬을 다 만든 뒤 한 번에 바꿔 끼움)"""
+        matrix = self.normalize(vectors) if len(payloads) else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._matrix = np.ascontiguousarray(matrix)
+            self._payloads = list(payloads)
+
+    def add(self, vector: Sequence[float], payload: Any):
+        row = self.normalize(vector)
+        with self._lock:
+            if len(self._payloads) and self._matrix.shape[1] != row.shape[1]:
+                raise ValueError(f"차원 불일치: {self._matrix.shape[1]} != {row.shape[1]}")
+            self._matrix = row if not len(self._payloads) else np.vstack([self._matrix, row])
+            self._payloads.append(payload)
+
+    def scores(self, vector: Sequence[float]) -> np.ndarray:
+        """모든 항목과의 코사인 유사도 (항목 순서대로)"""
+        with self._lock:
+            matrix = self._matrix
+        if not len(matrix): return np.zeros(0, dtype=np.float32)
+        return matrix @ self.normalize(vector)[0]
+
+    def search(self, vector: Sequence[float], k: int = 1,
+               threshold: Optional[float] = None) -> List[Tuple[float, Any]]:
+        """유사도가 높은 순서로 최대 k개의 (유사도, payload)를 반환합니다."""
+        with self._lock:
+            matrix, payloads = self._matrix, self._payloads
+        if not len(payloads): return []
+
+        scores = matrix @ self.normalize(vector)[0]
+        k = min(k, len(payloads))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), payloads[i]) for i in top
+                if threshold is None or scores[i] >= threshold]
@@ -1,51 +1,141 @@
 import os
 import json
 import time
+import signal
+import threading
 import traceback
-from supabase import create_client
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 from utils import (
     redis_client,
-    get_gemini_embedding,
-    MAIN_ANSWER_CACHE_KEY,
-    rerank_search_results,
+    get_gemini_embeddings_batch,
+    save_cached_answer,
+    check_semantic_cache,
+    save_semantic_cache,
     format_search_results,
-    expand_search_query 
+    expand_search_query,
+    extract_info_from_question,
+    get_supabase_pages_by_ids,
+    show_more_target_ids,
+    build_show_more_result
 )
+import utils
+import job_queue
+import metrics
+from intent_rules import QUERY_EXPANSION_MAP, build_intent_response
+from rerank import rerank_search_results, RERANK_MODE
+from local_search import local_search_engine, LOCAL_SEARCH_ENABLED
+from search_filters import build_search_filter, filter_rows
 
 print("[Worker] 설정 로드 중...")
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-JOB_QUEUE_KEY = "chatbot:job_queue"
-JOB_RESULTS_KEY = "chatbot:job_results"
-
-print("[Worker] 클라이언트 초기화 중...")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-print("[Worker] 초기화 완료. 작업 대기 시작.")
-
-# --- 질문 확장 사전 ---
-QUERY_EXPANSION_MAP = {
-    "장애검사": "영유아 발달 정밀 검사비 지원 장애인 등록 진단서 발급비",
-    "발달검사": "영유아 발달 정밀 검사비 지원",
-    "치료지원": "발달재활서비스 바우처 짝치료 그룹치료",
-    "짝치료": "또래 그룹치료 두리활동 사회성 향상 프로그램 그룹 활동", 
-    "그룹치료": "또래 두리활동 사회성 향상 프로그램 짝치료",
-    "언어치료": "발달재활서비스 바우처",
-    "부모교육": "양육 코칭 상담",
-}
+# [DAG 모드] 서로 의존하지 않는 단계(키워드 확장 / 임베딩)를 동시에 실행
+PARALLEL_STAGES = os.getenv("WORKER_PARALLEL_STAGES", "1") == "1"
+STAGE_REPORT_EVERY = int(os.getenv("WORKER_STAGE_REPORT_EVERY", "20"))
+
+# [동시 처리] 프로세스당 동시에 처리할 작업 수 (대부분 Gemini/Supabase 네트워크 대기)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+# 지표 수집용 GET /metrics 포트 (0이면 띄우지 않음)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Supabase/Gemini 클라이언트는 utils의 공용 레지스트리에서 처음 쓸 때 만들어집니다.
+# 작업마다 확장/임베딩 2개를 동시에 띄우므로 동시 작업 수의 2배로 잡습니다.
+stage_executor = ThreadPoolExecutor(max_workers=2 * WORKER_CONCURRENCY, thread_name_prefix="stage")
+
+# 응답 뒤에 하는 의미 캐시 저장(Supabase insert) 전용 스레드풀.
+# stage_executor와 따로 두어 느린 쓰기가 다음 작업의 확장/임베딩 앞에 쌓이지 않게 합니다.
+# 처음 쓸 때 만들고, drain_background_writes()로 비운 뒤에는 다음 쓰기에서 새로 만듭니다.
+WORKER_BACKGROUND_THREADS = int(os.getenv("WORKER_BACKGROUND_THREADS", "2"))
+_background_executor = None
+_background_lock = threading.Lock()
+
+def submit_background(func, *args):
+    """응답을 늦추지 않아도 되는 쓰기를 백그라운드 스레드풀에 넣습니다."""
+    global _background_executor
+    with _background_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=WORKER_BACKGROUND_THREADS, thread_name_prefix="cache-write")
+        return _background_executor.submit(func, *args)
+
+def drain_background_writes():
+    """지금까지 넣은 백그라운드 쓰기가 끝날 때까지 기다립니다. (워커 종료 시, 벤치마크 측정 후)"""
+    global _background_executor
+    with _background_lock:
+        executor, _background_executor = _background_executor, None
+    if executor: executor.shutdown(wait=True)
+
+# --- 2. 단계별 소요시간 기록 ---
+# 최근 N건의 단계별 소요시간을 보관해 p50/p95를 주기적으로 출력하고,
+# 같은 값을 metrics.STAGE_SECONDS 히스토그램에도 넣어 /metrics로 내보냅니다.
+STAGE_HISTORY = defaultdict(lambda: deque(maxlen=500))
+stage_history_lock = threading.Lock()
+jobs_since_report = 0
+
+@contextmanager
+def stage_timer(timings, stage):
+    """with 블록의 소요시간을 timings[stage]에 초 단위로 기록합니다."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - started
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def record_stage_timings(timings):
+    """작업 1건의 단계별 소요시간을 누적하고, 일정 건수마다 p50/p95를 출력합니다."""
+    global jobs_since_report
+    for stage, seconds in timings.items():
+        metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+    with stage_history_lock:
+        for stage, seconds in timings.items():
+            STAGE_HISTORY[stage].append(seconds)
+
+        jobs_since_report += 1
+        if jobs_since_report < STAGE_REPORT_EVERY: return
+        jobs_since_report = 0
+        snapshot = {stage: list(values) for stage, values in STAGE_HISTORY.items()}
+
+    mode = "DAG" if PARALLEL_STAGES else "순차"
+    print(f"📊 [Stage Timings] 최근 {len(snapshot.get('total', []))}건 ({mode} 모드, 동시 {WORKER_CONCURRENCY})")
+    for stage, values in snapshot.items():
+        print(f"   - {stage:<10} p50={_percentile(values, 50):.2f}s p95={_percentile(values, 95):.2f}s")
 
 # --- 3. 검색 함수 ---
-def search_documents_hybrid(query_embedding, keywords, match_count=50):
+def search_documents_hybrid(query_embedding, keywords, match_count=50, filters=None):
+    """
+    filters(연령/분류/대상 조건)는 로컬 엔진에서는 순위를 매기기 전에,
+    RPC 경로에서는 match_documents가 메타데이터 조건을 받지 않으므로 받은 행에 같은 조건을 적용합니다.
+    """
+    # [로컬 엔진] 프로세스 내 인덱스로 검색 (실패 시 아래 RPC로 대체)
+    if LOCAL_SEARCH_ENABLED:
+        try:
+            print(f"🔍 [Local Hybrid Search] 적용된 키워드: {keywords}")
+            return local_search_engine.search(query_embedding, keywords, match_count=match_count, filters=filters)
+        except Exception as e:
+            print(f"⚠️ 로컬 검색 오류 -> Supabase RPC 사용: {e}")
+
     try:
         print(f"🔍 [Hybrid Search] 적용된 키워드: {keywords}")
-        response = supabase.rpc(
+        # 빌드 중인 새 버전 / 정리 전의 옛 버전 행이 상위 자리를 차지하므로 그 비율만큼 더 가져옵니다.
+        fetch_count = utils.overfetch_count(match_count)
+        response = utils.get_supabase().rpc(
             "match_documents",
-            {"query_embedding": query_embedding, "match_count": match_count, "keywords": keywords}
+            {"query_embedding": query_embedding, "match_count": fetch_count, "keywords": keywords}
         ).execute()
-        return response.data
+        # 활성 색인 버전의 행만 사용 (빌드 중인 새 버전 / 정리 전의 옛 버전 행 제외)
+        rows = utils.filter_active_rows(response.data or [])[:match_count]
+        if fetch_count > match_count: print(f"🧮 [Index] 비활성 행 대비 {fetch_count}건 조회 -> 활성 {len(rows)}건")
+        filtered, applied = filter_rows(rows, filters)
+        if applied: print(f"🧮 [Filter] {applied} -> {len(filtered)}/{len(rows)}건")
+        return filtered
     except Exception as e:
         print(f"❌ Supabase 검색 오류: {e}")
         return []
@@ -103,28 +193,118 @@ def assign_tiers(question, documents):
 
 
 # --- 4. 작업 처리 함수 (Main) ---
-def process_job(job_data):
+def _timed(func, *args, **kwargs):
+    """func 실행 결과와 소요시간(초)을 함께 반환합니다. (스레드 실행용)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def build_preview_event(ordered_docs, total_found):
+    """검색 직후(리랭킹 전) 파이썬 우선순위 상위 문서로 미리보기 이벤트를 만듭니다."""
+    preview_metadata = [dict(doc.get("metadata", {})) for doc in ordered_docs[:2]]
+    body = format_search_results(preview_metadata)
+    header = "🔎 **관련 정보를 찾았습니다.** (가장 알맞은 순서로 정리 중...)"
+    return {
+        "status": "partial",
+        "stage": "search",
+        "answer": f"{header}\n\n<hr>\n\n{body}",
+        "last_result_ids": [m.get("page_id") for m in preview_metadata],
+        "total_found": total_found
+    }
+
+def embed_query_variants(question: str, embedding_text: str):
+    """
+    검색용(질문 + 룰 키워드)과 의미 캐시용(질문 원문) 임베딩을 배치 요청 1회로 함께 만듭니다.
+    룰 키워드가 없으면 두 텍스트가 같으므로 한 건만 임베딩합니다. (검색용, 캐시용) 순서로 반환합니다.
+    """
+    texts = list(dict.fromkeys([embedding_text, question]))
+    embeddings = get_gemini_embeddings_batch(texts, task_type="RETRIEVAL_QUERY")
+    query_embedding = embeddings[0]
+    cache_embedding = embeddings[-1] or query_embedding
+    return query_embedding, cache_embedding
+
+def resolve_intent(job_data, timings):
+    """
+    API에서 규칙으로 분류하지 못한 질문의 의도를 Gemini로 분석합니다.
+    검색이 필요 없는 의도면 그 결과(dict)를, 검색해야 하면 None을 반환합니다.
+    (분석에 실패하면 검색으로 진행합니다)
+    """
+    if job_data.get("intent_resolved", True): return None
+    question = job_data.get("question", "")
+    with stage_timer(timings, "intent"):
+        extracted_info = extract_info_from_question(question, job_data.get("chat_history") or [])
+    if extracted_info.get("error"):
+        print(f"⚠️ 의도 분석 실패 -> 검색으로 진행: {extracted_info['error']}")
+        return None
+    # 검색으로 이어지면 연령/분류/대상 조건에 씁니다.
+    job_data["extracted_info"] = extracted_info
+
+    intent = extracted_info.get("intent")
+    print(f"🧭 [Intent] Gemini 분석 결과: {intent}")
+    last_result_ids = job_data.get("last_result_ids") or []
+    if intent == "show_more" and last_result_ids:
+        shown_count = job_data.get("shown_count", 0)
+        target_ids = show_more_target_ids(last_result_ids, shown_count)
+        return build_show_more_result(last_result_ids, shown_count, get_supabase_pages_by_ids(target_ids) if target_ids else [])
+    return build_intent_response(intent, extracted_info, question)
+
+def process_job(job_data, timings=None, on_partial=None):
+    """
+    질문 1건을 처리해 (답변, 전체 결과 ID, 결과 수)를 반환합니다.
+    timings(dict)를 넘기면 단계별 소요시간(초)이 채워집니다.
+    on_partial(event)을 넘기면 리랭킹 전에 검색 결과 미리보기를 먼저 전달합니다.
+    """
+    if timings is None: timings = {}
     start_time = time.time()
     question = job_data.get("question")
     print(f"\n▶️ 작업 시작: {question}")
 
-    # [Step 1] 키워드 전략
+    # [Step 1] 키워드 전략 (룰 기반 강제 키워드는 즉시 계산)
     forced_keywords = []
     for trigger, expansion in QUERY_EXPANSION_MAP.items():
         if trigger in question.replace(" ", ""): 
             forced_keywords.extend(expansion.split())
             print(f"⚡️ [Rule] '{trigger}' 감지! -> 강제 키워드 주입: {forced_keywords}")
 
-    ai_keywords = expand_search_query(question)
+    # [Step 2] AI 확장 + 임베딩
+    # 임베딩은 질문과 룰 키워드만 사용하므로 AI 확장과 서로 기다릴 필요가 없습니다.
+    # DAG 모드에서는 두 호출을 동시에 시작하고, 확장 결과는 의미 캐시에 걸리지 않았을 때만 합류합니다.
+    embedding_text = f"{question} {' '.join(forced_keywords)}".strip()
+    expand_future = None
+    if PARALLEL_STAGES:
+        expand_future = stage_executor.submit(_timed, expand_search_query, question)
+        embed_future = stage_executor.submit(_timed, embed_query_variants, question, embedding_text)
+        (query_embedding, cache_embedding), timings["embed"] = embed_future.result()
+    else:
+        (query_embedding, cache_embedding), timings["embed"] = _timed(embed_query_variants, question, embedding_text)
+    if not query_embedding:
+        if expand_future: expand_future.cancel()
+        return "일시적인 오류가 발생했습니다.", [], 0
+
+    # [Step 2-1] 연령/분류/대상 조건 (의도 분석 결과가 없으면 질문에서 규칙으로 추출)
+    search_filter = build_search_filter(question, job_data.get("extracted_info"))
+
+    # [Step 2-2] 의미 기반 캐시: 검색 조건까지 같은 질문이 있었다면 검색/리랭킹을 건너뜁니다.
+    with stage_timer(timings, "sem_cache"):
+        cached_result = check_semantic_cache(cache_embedding, search_filter)
+    if cached_result:
+        # 아직 시작하지 않은 확장은 취소하고, 이미 실행 중이면 결과를 버립니다. (순차 모드는 호출하지 않음)
+        if expand_future: expand_future.cancel()
+        timings["total"] = time.time() - start_time
+        print(f"✅ 의미 캐시 답변 반환 (소요시간: {timings['total']:.2f}초)")
+        return cached_result["answer"], cached_result.get("last_result_ids", []), cached_result.get("total_found", 0)
+
+    # [Step 2-3] AI 키워드 확장 합류 (순차 모드는 의미 캐시를 놓쳤을 때만 호출)
+    if expand_future:
+        ai_keywords, timings["expand"] = expand_future.result()
+    else:
+        ai_keywords, timings["expand"] = _timed(expand_search_query, question)
+
     target_keywords = list(dict.fromkeys(forced_keywords + ai_keywords))
     print(f"🗝️ [최종 검색 키워드] {target_keywords}")
 
-    # [Step 2] 검색
-    embedding_text = f"{question} {' '.join(forced_keywords)}"
-    query_embedding = get_gemini_embedding(embedding_text, task_type="RETRIEVAL_QUERY")
-    if not query_embedding: return "일시적인 오류가 발생했습니다.", [], 0
-
-    raw_results = search_documents_hybrid(query_embedding, target_keywords, match_count=100)
+    with stage_timer(timings, "search"):
+        raw_results = search_documents_hybrid(query_embedding, target_keywords, match_count=100, filters=search_filter)
     if not raw_results: return "관련 정보를 찾지 못했습니다.", [], 0
 
     # [중복 제거]
@@ -143,7 +323,15 @@ def process_job(job_data):
         raw_results = [d for d in raw_results if not any(x in d.get("metadata", {}).get("title", "") for x in ["특수교육", "선별", "배치", "입학", "교육청"])]
 
     # [Step 3] 랭킹 분류 (함수로 분리하여 깔끔해짐)
-    tier_1_docs, tier_2_docs, normal_docs = assign_tiers(question, raw_results)
+    with stage_timer(timings, "tiering"):
+        tier_1_docs, tier_2_docs, normal_docs = assign_tiers(question, raw_results)
+
+    # [Step 3.5] 미리보기 전송 (1티어 → 2티어 → 일반 순서, 리랭킹 결과는 최종 답변으로 전달)
+    if on_partial:
+        try:
+            on_partial(build_preview_event(tier_1_docs + tier_2_docs + normal_docs, len(raw_results)))
+        except Exception as e:
+            print(f"⚠️ 미리보기 전송 실패: {e}")
 
     # [Step 4] 랭킹 준비 (힌트 주입)
     marked_candidates = []
@@ -157,9 +345,12 @@ def process_job(job_data):
     # AI 후보군 (힌트 달린 1티어 + 2티어 + 일반)
     candidates_for_ai = marked_candidates + tier_2_docs + normal_docs
 
-    # [Step 5] AI 랭킹
-    print(f"🤖 Gemini에게 {len(candidates_for_ai)}개 문서를 보냅니다. (힌트 포함)")
-    reranked_results = rerank_search_results(question, candidates_for_ai)
+    # [Step 5] 랭킹 (RERANK_MODE: 로컬 특징 점수 / Gemini / 애매할 때만 Gemini)
+    tiers = {doc.get("metadata", {}).get("page_id"): 1 for doc in tier_1_docs}
+    tiers.update({doc.get("metadata", {}).get("page_id"): 2 for doc in tier_2_docs})
+    print(f"🤖 [Rerank:{RERANK_MODE}] {len(candidates_for_ai)}개 문서 정렬 (1티어 {len(tier_1_docs)}, 2티어 {len(tier_2_docs)})")
+    with stage_timer(timings, "rerank"):
+        reranked_results = rerank_search_results(question, candidates_for_ai, keywords=target_keywords, tiers=tiers)
 
     # Fallback: AI 실패 시, 파이썬이 정한 순서(1티어->2티어->일반) 그대로 사용
     if not reranked_results:
@@ -183,43 +374,170 @@ def process_job(job_data):
         meta["title"] = clean_title
         final_display_metadata.append(meta)
 
-    body = format_search_results(final_display_metadata)
+    with stage_timer(timings, "format"):
+        body = format_search_results(final_display_metadata)
     header = "🔎 **정보를 찾았습니다!**\n자세한 정보는 '자세히 보기'를 확인해주세요."
     final_answer = f"{header}\n\n<hr>\n\n{body}"
 
     if len(all_page_ids) > display_count:
         final_answer += f"\n\n<hr>\n\n🔍 **아직 결과가 더 남아있습니다.**\n'더 보여줘' 또는 '다음'을 입력해 보세요."
 
+    # 의미 캐시 저장은 Supabase 쓰기가 있으므로 응답을 늦추지 않게 백그라운드로 보냅니다.
+    submit_background(save_semantic_cache, question, {
+        "status": "complete",
+        "answer": final_answer,
+        "last_result_ids": all_page_ids,
+        "total_found": len(all_page_ids)
+    }, cache_embedding, search_filter)
+
     elapsed = time.time() - start_time
-    print(f"✅ 답변 조립 완료 (소요시간: {elapsed:.2f}초)")
+    timings["total"] = elapsed
+    stage_text = ", ".join(f"{k}={v:.2f}s" for k, v in timings.items() if k != "total")
+    print(f"✅ 답변 조립 완료 (소요시간: {elapsed:.2f}초 | {stage_text})")
     return final_answer, all_page_ids, len(all_page_ids)
 
 # --- 5. 메인 루프 ---
-def start_worker():
-    print("🚀 Worker 가동! Redis 큐 대기 중...")
-    while True:
+# 처리 중인 작업 (job_id -> 시작 시각). 하트비트 스레드가 참조합니다.
+inflight_jobs = {}
+inflight_lock = threading.Lock()
+
+metrics.JOBS_IN_FLIGHT.set_function(lambda: len(inflight_jobs))
+metrics.QUEUE_DEPTH.set_function(lambda: redis_client.llen(job_queue.JOB_QUEUE_KEY))
+
+def handle_job(job_json):
+    """큐에서 꺼낸 작업 1건을 처리하고 결과를 저장한 뒤 ack 합니다. (작업 스레드에서 실행)"""
+    job_id = None
+    try:
+        job_data = json.loads(job_json.decode('utf-8'))
+        job_id = job_data.get("job_id")
+        if not job_id:
+            # 하트비트로 추적하기 전에 데드레터로 보냅니다. (job_id 없이는 결과를 돌려줄 곳도 없음)
+            job_queue.fail_job(job_json, "job_id 없는 작업 데이터")
+            metrics.JOBS_TOTAL.inc(outcome="error")
+            return
+        with inflight_lock: inflight_jobs[job_id] = time.time()
+
+        timings = {}
+        intent_result = resolve_intent(job_data, timings)
+        if intent_result:
+            # 검색이 필요 없는 의도 (인사/범위 밖/분류 되묻기/더 보기 등). 답변 캐시에는 넣지 않습니다.
+            job_queue.save_job_result(job_id, intent_result)
+            job_queue.ack_job(job_json)
+            record_stage_timings(timings)
+            metrics.JOBS_TOTAL.inc(outcome="intent")
+            print(f"💾 의도 응답 저장 완료 (Job ID: {job_id})")
+            return
+
+        answer_text, all_ids, total_found = process_job(
+            job_data, timings,
+            on_partial=lambda event: job_queue.publish_job_event(job_id, event)
+        )
+        record_stage_timings(timings)
+
+        final_result = {
+            "status": "complete",
+            "answer": answer_text,
+            "last_result_ids": all_ids, 
+            "total_found": total_found 
+        }
+        job_queue.save_job_result(job_id, final_result)
+        job_queue.ack_job(job_json)
+        # 검색 결과가 있는 답변만 캐시합니다. (일시 오류/결과 없음은 다음 요청에서 다시 시도)
+        if total_found > 0:
+            save_cached_answer(job_data.get("question", ""), final_result)
+        metrics.JOBS_TOTAL.inc(outcome="search")
+        print(f"💾 결과 저장 완료 (Job ID: {job_id})")
+    except Exception as e:
+        print(f"🔥 작업 처리 오류 (Job ID: {job_id}): {e}")
+        metrics.JOBS_TOTAL.inc(outcome="error")
+        traceback.print_exc()
         try:
-            result = redis_client.blpop(JOB_QUEUE_KEY, timeout=0)
-            if result:
-                _, job_json = result
-                job_data = json.loads(job_json.decode('utf-8'))
-                job_id = job_data.get("job_id")
-                
-                answer_text, all_ids, total_found = process_job(job_data)
-
-                final_result = {
-                    "status": "complete",
-                    "answer": answer_text,
-                    "last_result_ids": all_ids, 
-                    "total_found": total_found 
-                }
-                redis_client.hset(JOB_RESULTS_KEY, job_id, json.dumps(final_result).encode('utf-8'))
-                print(f"💾 결과 저장 완료 (Job ID: {job_id})")
+            job_queue.fail_job(job_json, f"{type(e).__name__}: {e}")
+        except Exception as release_error:
+            # Redis 장애 등으로 되돌리지 못하면 리퍼가 하트비트 만료 후 회수합니다.
+            print(f"⚠️ 작업 반환 실패 (리퍼가 회수 예정): {release_error}")
+    finally:
+        with inflight_lock: inflight_jobs.pop(job_id, None)
+
+def start_worker(concurrency=None, stop_event=None):
+    """
+    신뢰성 큐에서 작업을 꺼내 최대 concurrency개까지 동시에 처리합니다.
+    - 빈 슬롯(세마포어)을 먼저 확보한 뒤에만 작업을 꺼내므로, 꺼낸 작업은 반드시 처리됩니다.
+    - 처리 중인 작업은 하트비트를 남기고, 리퍼 스레드가 다른 워커의 멈춘 작업까지 회수합니다.
+    - stop_event가 설정되면 새 작업을 받지 않고, 처리 중인 작업이 끝날 때까지 기다린 뒤 종료합니다.
+    """
+    concurrency = concurrency or WORKER_CONCURRENCY
+    stop_event = stop_event or threading.Event()
+    # 워커는 Redis 없이는 할 일이 없으므로 시작할 때 연결을 확인합니다. (API는 기다리지 않음)
+    utils.wait_for_redis()
+    print("[Worker] 초기화 완료. 작업 대기 시작.")
+    slots = threading.BoundedSemaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+
+    # 하트비트/리퍼는 처리 중인 작업이 모두 끝난 뒤에 멈춥니다.
+    background_stop = threading.Event()
+    threading.Thread(target=job_queue.run_heartbeats, args=(inflight_jobs, inflight_lock, background_stop),
+                     name="heartbeat", daemon=True).start()
+    threading.Thread(target=job_queue.run_reaper, args=(background_stop,), name="reaper", daemon=True).start()
+
+    metrics_server = None
+    if WORKER_METRICS_PORT:
+        try:
+            metrics_server = metrics.start_http_server(WORKER_METRICS_PORT)
+            print(f"📈 지표 수집 엔드포인트: http://0.0.0.0:{WORKER_METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ 지표 엔드포인트 시작 실패 (포트 {WORKER_METRICS_PORT}): {e}")
 
+    if LOCAL_SEARCH_ENABLED:
+        try:
+            local_search_engine.ensure_fresh()
         except Exception as e:
-            print(f"🔥 Worker 루프 오류: {e}")
-            traceback.print_exc()
-            time.sleep(1)
+            print(f"⚠️ 로컬 검색 엔진 로드 실패 (RPC로 대체): {e}")
+
+    try:
+        migrated = job_queue.migrate_legacy_results()
+        if migrated: print(f"📦 레거시 결과 {migrated}건을 TTL 키로 이전했습니다.")
+    except Exception as e:
+        print(f"⚠️ 레거시 결과 이전 실패: {e}")
+
+    print(f"🚀 Worker 가동! Redis 큐 대기 중... (ID: {job_queue.WORKER_ID}, 동시 처리: {concurrency})")
+    try:
+        while not stop_event.is_set():
+            if not slots.acquire(timeout=1): continue
+            try:
+                # timeout을 짧게 두어 종료 신호를 주기적으로 확인합니다.
+                job_json = job_queue.claim_job(timeout=1)
+            except Exception as e:
+                slots.release()
+                print(f"🔥 Worker 루프 오류: {e}")
+                traceback.print_exc()
+                time.sleep(1)
+                continue
+
+            if not job_json:
+                slots.release()
+                continue
+
+            future = executor.submit(handle_job, job_json)
+            future.add_done_callback(lambda _: slots.release())
+    finally:
+        print("🛑 Worker 종료 중... 처리 중인 작업을 마무리합니다.")
+        executor.shutdown(wait=True)
+        drain_background_writes()
+        background_stop.set()
+        if metrics_server:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        print("👋 Worker 종료 완료.")
+
+def _install_signal_handlers(stop_event):
+    def _handle_signal(signum, _frame):
+        print(f"🛑 종료 신호 수신 ({signal.Signals(signum).name})")
+        stop_event.set()
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
 
 if __name__ == "__main__":
-    start_worker()
\ No newline at end of file
+    stop = threading.Event()
+    _install_signal_handlers(stop)
+    start_worker(stop_event=stop)